@@ -68,6 +68,13 @@ export class WSocket<C, S> {
     });
   };
 
+  // The next connections resume the session of the token, e.g. after a server restart
+  resumeWith = (token: string) => {
+    const url = new URL(this.url, window.location.href);
+    url.searchParams.set("resume", token);
+    this.url = url.toString();
+  };
+
   send(msg: C) {
     const json = JSON.stringify(msg);
     this.socket.send(json);
@@ -15,7 +15,13 @@ const WikiGame = observer(() => {
     }
   };
   if (wikiStore.step === WGameStep.EndGame) {
-    return <div>You finished at {wikiStore.player!.place}th place</div>;
+    return (
+      <div>
+        You finished at {wikiStore.player!.place}th place in{" "}
+        {wikiStore.player!.steps} steps, the shortest path is{" "}
+        {wikiStore.optimalSteps} steps
+      </div>
+    );
   }
   const game = (() => {
     return (
@@ -26,7 +32,10 @@ const WikiGame = observer(() => {
             <div>Loading...</div>
           ) : (
             <>
-              <div>Target is: {wikiStore.targetArticle}</div>
+              <div>
+                Target is: {wikiStore.targetArticle}, {wikiStore.optimalSteps}{" "}
+                steps away
+              </div>
               <Typography.Title>{wikiStore.currArticle!.title}</Typography.Title>
               {articleContent !== null && (
                 <div
@@ -12,12 +12,11 @@ import GameTable from "./GameTable";
 import gs from "~/stores/wordsGameStore";
 
 const UsedLettersTable = () => {
-  const lettersLeftList = gs.myPlayer !== null ? gs.myPlayer.letters_left : [];
+  const lettersLeft = gs.myPlayer !== null ? gs.myPlayer.letters_left : 0;
   let allLetters = gs.gameState.all_letters;
-  const lettersLeft = new Set(lettersLeftList);
   return (
     <div className="wletter-table">
-      {allLetters.map((letter: number) => {
+      {allLetters.map((letter: number, i: number) => {
         const ch = String.fromCharCode(letter);
         return (
           <Paper
@@ -25,7 +24,7 @@ const UsedLettersTable = () => {
             elevation={1}
             className={cn({
               wletter: true,
-              wletter_used: !lettersLeft.has(letter),
+              wletter_used: ((lettersLeft >>> i) & 1) === 0,
             })}
           >
             {ch}
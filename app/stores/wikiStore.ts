@@ -31,6 +31,7 @@ interface Player {
   time_started: Date;
   time_ended: Date;
   place: number | null;
+  steps: number;
 }
 
 export enum CWMSG {
@@ -65,6 +66,8 @@ export class WikiGameStore implements IWikiGameStore {
   player: Player | null = null;
   step: WGameStep = WGameStep.Initial;
   targetArticle = null;
+  // Length of the shortest path from the initial article to the target
+  optimalSteps: number | null = null;
 
   get isLoading() {
     return this.loading;
@@ -94,6 +97,8 @@ export class WikiGameStore implements IWikiGameStore {
         {
           runInAction(() => {
             this.targetArticle = msg.target;
+            this.optimalSteps = msg.optimal_steps;
+            this.socket.resumeWith(msg.token);
           });
         }
         break;
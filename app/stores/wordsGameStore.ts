@@ -15,6 +15,7 @@ import {
   PlayerInfo,
   ClientState,
   GameState,
+  GameStatePatch,
   WordsGameStep,
   ActionType,
   ClientMessage,
@@ -33,6 +34,7 @@ const emptyGameState = (): GameState => {
     last_player_to_answer: null,
     start_timer: -1,
     all_letters: [],
+    version: 0,
   };
 };
 
@@ -87,6 +89,7 @@ export class WordsGameStore {
       this.step = WordsGameStep.Playing;
       this.gameState = parsed.state;
       this.myId = parsed.player.id;
+      this.socket?.resumeWith(parsed.token);
       console.log(this);
       console.log("changed", this.gameState, this.step);
     });
@@ -107,8 +110,19 @@ export class WordsGameStore {
         break;
       case SWMSG.UpdateGameState:
         {
-          // Generic game state update
-          this.gameState = { ...this.gameState, ...parsed.state };
+          // Versioned game state patch
+          if (parsed.version <= this.gameState.version) break;
+          const { players, ...rest } = parsed.state as GameStatePatch;
+          const nextPlayers = { ...this.gameState.players };
+          for (const [id, patch] of Object.entries(players ?? {})) {
+            nextPlayers[id] = { ...nextPlayers[id], ...patch };
+          }
+          this.gameState = {
+            ...this.gameState,
+            ...rest,
+            players: nextPlayers,
+            version: parsed.version,
+          };
         }
         break;
       case SWMSG.PlayerJoined:
@@ -28,7 +28,8 @@ export type PlayerInfo = {
   lives_left: number;
   input: string;
   id: PlayerId;
-  letters_left: number[];
+  // Bitmask, bit i is the letter all_letters[i]
+  letters_left: number;
 };
 
 export type PlayerInfoById = Record<PlayerId, PlayerInfo>;
@@ -41,6 +42,12 @@ export type GameState = {
   desc: GameStateDesc;
   last_player_to_answer: PlayerId | null;
   all_letters: number[];
+  version: number;
+};
+
+// Changed fields of the game state, players only carry their changed fields
+export type GameStatePatch = Partial<Omit<GameState, "players">> & {
+  players?: Record<PlayerId, Partial<PlayerInfo>>;
 };
 
 export enum WordsGameStep {
@@ -0,0 +1,33 @@
+import os
+import sys
+import json
+import argparse
+
+# The binary format is defined by the server
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+from server.dictionary import write_dictionary
+
+
+def read_words(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            word = line.rstrip("\r\n").lower()
+            if word:
+                yield word
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the words list and particles into a binary dictionary")
+    parser.add_argument("words", type=str, help="Words list, one word per line")
+    parser.add_argument("particles", type=str, help="Particles JSON generated by generate-particles-json.py")
+    parser.add_argument("--output", type=str, help="Output file", required=True)
+    args = parser.parse_args()
+    with open(args.particles, "r", encoding="utf-8") as f:
+        particles = json.load(f)
+    print(f"Compiling {args.words}...")
+    tmp_path = args.output + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write_dictionary(f, read_words(args.words), particles)
+    # Replace atomically, running servers keep their mapping of the old file
+    os.replace(tmp_path, args.output)
+    print("Done.")
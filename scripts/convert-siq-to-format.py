@@ -1,135 +1,185 @@
 #!/bin/env python3
 
 from zipfile import ZipFile
+from multiprocessing import Pool
 import xml.etree.ElementTree as ET
 import argparse
+import shutil
 import sys
 import json
 import os
 
 
-def parse_questions_from_files(files):
-    questions_by_theme = {}
-    related_files = {}
-    related_files["Images"] = []
-    for pack in files:
-        zip = ZipFile(pack)
-        all_files = {name: zip.read(name) for name in zip.namelist()}
-        for path in all_files:
-            if path.startswith("Images/"):
-                related_files["Images"].append(
-                    (path.replace("Images/", ""), all_files[path])
-                )
-        content_xml = all_files["content.xml"]
-        et = ET.fromstring(content_xml)
-        # import pdb; pdb.set_trace()
-        if len(list(et)) > 2:
-            continue
-        info, rounds = list(et)
-        for round in list(rounds):
-            roundl = list(round)
-            themes = roundl[0]
-            for theme in list(themes):
-                theme_name = theme.get("name")
-                questions_to_append = []
-                if theme_name is None:
-                    continue
-
-                # <questions>
-                questions = list(theme)[0]
-                # TODO: Consider the "price" tag to maybe be used to compute the value of the question
-                # TODO: Process the "sources" field to provide some info on question
-                for qidx, question in enumerate(questions):
-                    # for each <question>
-                    # parse question info
-                    children = list(question)
-                    info = None
-                    scenario = None
-                    right = None
-                    wrong = None
-                    for child in children:
-                        name = child.tag
-                        if name.endswith("info"):
-                            # <info>
-                            info = child
-                        elif name.endswith("scenario"):
-                            # <scenario>
-                            scenario = child
-                        elif name.endswith("right"):
-                            # <right>
-                            right = child
-                        elif name.endswith("wrong"):
-                            # <wrong>
-                            wrong = child
-
-                    # scenario contains the actual question
-                    scenario_question = ""
-                    # images in the question
-                    q_images = []
-                    # images to show after answer
-                    ans_images = []
-                    if scenario is None:
-                        # skip if no question
-                        print(
-                            f"Warning: no question specified for {theme_name} -> question #{qidx}"
-                        )
-                        continue
-                    parsing_answer_content = False
-                    for atom in list(scenario):
-                        atom_type = atom.get("type")
-                        if atom_type == "image":
-                            img_src = atom.text
-                            if parsing_answer_content:
-                                # answer image
-                                ans_images.append(img_src)
-                            else:
-                                # question image
-                                q_images.append(img_src)
-                        elif atom_type == "marker":
-                            # end of the question, after this marker the scenario answer content begins
-                            parsing_answer_content = True
-                            break
-                        elif atom.text is not None:
-                            scenario_question += atom.text
-                        else:
-                            print(f"Warning: Unknown <scenario> node found: {atom.tag}")
-
-                    # collect all <answer> nodes into an array of possible answers
-                    possible_answers = []
-                    if right is not None:
-                        for answer in list(right):
-                            possible_answers.append(answer.text)
-                    if len(possible_answers) == 0:
-                        # skip if no answer specified
-                        continue
-                    wrong_options = []
-                    if wrong is not None:
-                        for opt in list(wrong):
-                            wrong_options.append(opt.text)
-                    item = {
-                        "text": scenario_question,
-                        "qimages": q_images,
-                        "aimages": ans_images,
-                        "answers": possible_answers,
-                        "wrong_options": wrong_options,
-                    }
-
-                    # append new question
-                    questions_to_append.append(item)
-                questions_by_theme[theme_name] = questions_to_append
+def local_name(tag):
+    """Tag name without the XML namespace."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_question(theme_name, qidx, question):
+    # parse question info
+    children = list(question)
+    info = None
+    scenario = None
+    right = None
+    wrong = None
+    for child in children:
+        name = child.tag
+        if name.endswith("info"):
+            # <info>
+            info = child
+        elif name.endswith("scenario"):
+            # <scenario>
+            scenario = child
+        elif name.endswith("right"):
+            # <right>
+            right = child
+        elif name.endswith("wrong"):
+            # <wrong>
+            wrong = child
+
+    # scenario contains the actual question
+    scenario_question = ""
+    # images in the question
+    q_images = []
+    # images to show after answer
+    ans_images = []
+    if scenario is None:
+        # skip if no question
+        print(f"Warning: no question specified for {theme_name} -> question #{qidx}")
+        return None
+    parsing_answer_content = False
+    for atom in list(scenario):
+        atom_type = atom.get("type")
+        if atom_type == "image":
+            img_src = atom.text
+            if parsing_answer_content:
+                # answer image
+                ans_images.append(img_src)
+            else:
+                # question image
+                q_images.append(img_src)
+        elif atom_type == "marker":
+            # end of the question, after this marker the scenario answer content begins
+            parsing_answer_content = True
+            break
+        elif atom.text is not None:
+            scenario_question += atom.text
+        else:
+            print(f"Warning: Unknown <scenario> node found: {atom.tag}")
+
+    # collect all <answer> nodes into an array of possible answers
+    possible_answers = []
+    if right is not None:
+        for answer in list(right):
+            possible_answers.append(answer.text)
+    if len(possible_answers) == 0:
+        # skip if no answer specified
+        return None
+    wrong_options = []
+    if wrong is not None:
+        for opt in list(wrong):
+            wrong_options.append(opt.text)
     return {
-        "questions": questions_by_theme,
-        "themes": list(questions_by_theme.keys()),
-        "files": related_files,
+        "theme": theme_name,
+        "text": scenario_question,
+        "qimages": q_images,
+        "aimages": ans_images,
+        "answers": possible_answers,
+        "wrong_options": wrong_options,
     }
 
 
+def iter_questions(content_xml):
+    """Stream the questions of a pack, only one <question> is kept in memory at a time."""
+    theme_name = None
+    qidx = 0
+    for event, elem in ET.iterparse(content_xml, events=("start", "end")):
+        tag = local_name(elem.tag)
+        if event == "start":
+            if tag == "theme":
+                theme_name = elem.get("name")
+                qidx = 0
+                if theme_name is not None:
+                    yield theme_name, None
+            continue
+        if tag == "question":
+            # TODO: Consider the "price" tag to maybe be used to compute the value of the question
+            # TODO: Process the "sources" field to provide some info on question
+            if theme_name is not None:
+                item = parse_question(theme_name, qidx, elem)
+                if item is not None:
+                    yield theme_name, item
+            qidx += 1
+            elem.clear()
+        elif tag == "theme":
+            theme_name = None
+            elem.clear()
+        elif tag == "round":
+            elem.clear()
+
+
+def convert_pack(task):
+    """Convert a single pack. Images are written straight to disk, questions are returned."""
+    pack, images_dir = task
+    themes = []
+    questions = []
+    with ZipFile(pack) as zip:
+        for path in zip.namelist():
+            if path.startswith("Images/") and not path.endswith("/"):
+                with zip.open(path) as src, open(os.path.join(images_dir, path.replace("Images/", "")), "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+        with zip.open("content.xml") as content_xml:
+            for theme_name, item in iter_questions(content_xml):
+                if item is None:
+                    themes.append(theme_name)
+                else:
+                    questions.append(json.dumps(item, ensure_ascii=False))
+    return pack, themes, questions
+
+
+def convert_packs(files, out_dir, jobs):
+    """Convert packs in a process pool, writing questions to questions.jsonl as packs finish."""
+    images_dir = os.path.join(out_dir, "Images")
+    if not os.path.isdir(images_dir):
+        os.mkdir(images_dir)
+    themes = {}
+    tasks = [(pack, images_dir) for pack in files]
+    with open(os.path.join(out_dir, "questions.jsonl"), "w", encoding="utf-8") as out, Pool(jobs) as pool:
+        for pack, pack_themes, questions in pool.imap(convert_pack, tasks):
+            for theme_name in pack_themes:
+                themes[theme_name] = True
+            for line in questions:
+                out.write(line)
+                out.write("\n")
+            print(f"{pack}: {len(questions)} questions", file=sys.stderr)
+    return list(themes.keys())
+
+
+def write_questions_json(out_dir, themes):
+    """Group questions.jsonl by theme into questions.json. Keeps the text of all questions in memory."""
+    questions_by_theme = {theme_name: [] for theme_name in themes}
+    last_theme = None
+    with open(os.path.join(out_dir, "questions.jsonl"), encoding="utf-8") as f:
+        for line in f:
+            item = json.loads(line)
+            theme_name = item.pop("theme")
+            if theme_name != last_theme:
+                # A theme repeated in a later pack replaces the earlier one
+                questions_by_theme[theme_name] = []
+                last_theme = theme_name
+            questions_by_theme[theme_name].append(item)
+    with open(os.path.join(out_dir, "questions.json"), "w+", encoding="utf-8") as f:
+        json.dump(questions_by_theme, f)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Convert questions in SIQ format to json"
     )
     parser.add_argument("files", nargs="+", help="questions pack file paths")
-    parser.add_argument("--out", help="Output json file name", required=True)
+    parser.add_argument("--out", help="Output directory", required=True)
+    parser.add_argument("--jobs", type=int, help="Worker processes", default=os.cpu_count() or 1)
+    parser.add_argument("--no-json", dest="json", action="store_false", help="Skip questions.json, which the app loads")
     args = parser.parse_args()
     files_to_convert = args.files
     out_dir = args.out
@@ -139,20 +189,11 @@ def main():
     if not os.path.isdir(out_dir):
         print("Output directory does not exist, creating...", file=sys.stderr)
         os.mkdir(out_dir)
-    output_file = os.path.join(out_dir, "questions.json")
-    themes_output_file = os.path.join(out_dir, "themes.json")
-    parsed = parse_questions_from_files(files_to_convert)
-    with open(themes_output_file, "w+") as f:
-        json.dump(parsed["themes"], f)
-    print(parsed["questions"])
-    with open(output_file, "w+", encoding="utf-8") as f:
-        json.dump(parsed["questions"], f)
-    images_dir = os.path.join(out_dir, "Images")
-    if not os.path.isdir(images_dir):
-        os.mkdir(images_dir)
-    for fname, blob in parsed["files"]["Images"]:
-        with open(os.path.join(images_dir, fname), "wb") as f:
-            f.write(blob)
+    themes = convert_packs(files_to_convert, out_dir, args.jobs)
+    with open(os.path.join(out_dir, "themes.json"), "w+") as f:
+        json.dump(themes, f)
+    if args.json:
+        write_questions_json(out_dir, themes)
 
 
 if __name__ == "__main__":
@@ -1,54 +1,84 @@
 import os
+import re
 import json
 import argparse
-from collections import Counter, defaultdict
+from itertools import islice
+from collections import Counter
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Sequence, Tuple
 from util import ALLOWED_CHARS
 
-def generate_from_dictionary(dicp: str, encoding: str, freq: Counter, particle_len: int):
-    with open(dicp, "r", encoding=encoding) as f:
-        lines = f.readlines()
-        for word in lines:
-            word_len = len(word) - 1 # don't include the newline character
-            if word.startswith('-'): continue
-            if word_len < particle_len: continue
-            particles = []
-            i = 0
-            word_ending = word_len - (word_len % particle_len) + 1
-            while i < word_ending:
-                start = i
-                end = min(i + particle_len, word_len)
-                if (end - start) < particle_len: break
-                j = start
-                p = ""
-                valid = True
-                while j < end:
-                    ch = word[j]
-                    if not ch in ALLOWED_CHARS:
-                        valid = False
-                        break
-                    p += ch
-                    j += 1
-                if valid:
-                    particles.append(p.lower())
-                i += 1
-            for p in particles:
-                freq[p] += 1
+# Lines handed to a worker at once
+CHUNK_LINES = 50000
+
+# Particles never cross a character that is not allowed, so only runs of allowed characters are counted
+ALLOWED_RUN = re.compile("[" + "".join(sorted(ALLOWED_CHARS)) + "]+")
+
+Freqs = Dict[int, Counter]
+
+
+def count_chunk(task: Tuple[List[str], Sequence[int]]) -> Freqs:
+    """Count the particles of every length in a chunk of lines."""
+    lines, lengths = task
+    freqs = {n: Counter() for n in lengths}
+    # Newlines are not allowed characters, so the chunk is scanned as a single string
+    text = "".join(line for line in lines if not line.startswith('-')).lower()
+    for run in ALLOWED_RUN.findall(text):
+        for n, freq in freqs.items():
+            if len(run) >= n:
+                freq.update(run[i:i + n] for i in range(len(run) - n + 1))
+    return freqs
+
+
+def read_chunks(paths: Sequence[str], encoding: str, lengths: Sequence[int]) -> Iterator[Tuple[List[str], Sequence[int]]]:
+    for dicp in paths:
+        print(f"Reading {dicp}...")
+        with open(dicp, "r", encoding=encoding) as f:
+            while True:
+                lines = list(islice(f, CHUNK_LINES))
+                if not lines: break
+                yield lines, lengths
+
+
+def generate_from_dictionaries(paths: Sequence[str], encoding: str, lengths: Sequence[int], jobs: int) -> Freqs:
+    freqs = {n: Counter() for n in lengths}
+    chunks = read_chunks(paths, encoding, lengths)
+    # Chunks are merged in order, so particles keep the order they were first seen in
+    if jobs <= 1:
+        results = map(count_chunk, chunks)
+        for chunk_freqs in results:
+            for n, freq in chunk_freqs.items():
+                freqs[n].update(freq)
+    else:
+        with Pool(jobs) as pool:
+            for chunk_freqs in pool.imap(count_chunk, chunks):
+                for n, freq in chunk_freqs.items():
+                    freqs[n].update(freq)
+    return freqs
+
+
+def write_freq(path: str, freq: Counter):
+    if os.path.isfile(path):
+        os.remove(path)
+    with open(path, "w") as f:
+        json.dump(freq, f, ensure_ascii=False)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate particles of a certain length from text files containing words")
     parser.add_argument("files", type=str, nargs="+", help="Source files")
     parser.add_argument("--output", type=str, help="Output file", required=True)
     parser.add_argument("--length", type=int, help="Particle length", default=3)
+    parser.add_argument("--extra-lengths", type=int, nargs="*", default=[],
+                        help="Also count particles of these lengths, written next to the output as <name>.<length>.json")
+    parser.add_argument("--jobs", type=int, help="Worker processes", default=os.cpu_count() or 1)
     args = parser.parse_args()
-    source_files = args.files
     output_file = args.output
     particle_len = args.length
-    freq = Counter()
-    for dicp in source_files:
-        print(f"Reading {dicp}...")
-        generate_from_dictionary(dicp, "utf-8", freq, particle_len)
-        print("Done.")
-    if os.path.isfile(output_file):
-        os.remove(output_file)
-    with open(output_file, "w") as f:
-        json.dump(freq, f, ensure_ascii=False)
+    lengths = sorted({particle_len, *args.extra_lengths})
+    freqs = generate_from_dictionaries(args.files, "utf-8", lengths, args.jobs)
+    print("Done.")
+    write_freq(output_file, freqs[particle_len])
+    root, ext = os.path.splitext(output_file)
+    for n in args.extra_lengths:
+        write_freq(f"{root}.{n}{ext}", freqs[n])
@@ -38,3 +38,6 @@ cat "$RT/regions.txt" >> $WORDS_LIST_PATH
 
 # Generate particles
 python "$SP/generate-particles-json.py" $WORDS_LIST_PATH --output $PARTICLES_PATH
+
+# Compile the binary dictionary loaded by the server
+python "$SP/compile-dictionary.py" $WORDS_LIST_PATH $PARTICLES_PATH --output "$OUT_DIR/words.bin"
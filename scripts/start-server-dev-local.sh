@@ -1,2 +1,2 @@
 #!/bin/bash
-cd server && source venv/bin/activate && adev runserver server.py --port 8080
+cd server && source venv/bin/activate && DEV=1 adev runserver server.py --port 8080
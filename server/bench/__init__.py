@@ -0,0 +1 @@
+"""Load tests and micro-benchmarks of the server, run from the server directory."""
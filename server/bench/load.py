@@ -0,0 +1,417 @@
+"""Load test: bot players against a real server.
+
+Starts the server and a local stand-in for Wikipedia in child processes (or
+uses `--url`), connects bots to many WordsGame and WikiGame rooms for
+`--duration` seconds and reports the throughput and the latencies:
+
+    input_echo       UpdateInput sent until its UserInput broadcast arrives
+    turn_transition  correct SubmitGuess sent until the next turn is announced
+    navigate         NavigateTo sent until the article arrives
+
+Runs with the same options and seed are comparable:
+
+    python -m bench.load --duration 30 --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import socket
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import aiohttp
+
+from bench.synthetic import synthetic_dictionary
+from server.wiki_game import CWMSG as WikiCWMSG, SWMSG as WikiSWMSG
+from server.words_game_common import CWMSG, SWMSG, WordGameDict
+
+# Settings
+# Seconds a bot waits before acting, as if it was thinking
+THINK_TIME = 0.05
+# Share of the turns a words bot lets time out, so games end and restart
+MISS_RATE = 0.1
+# Seconds to wait for the server to come up
+STARTUP_TIMEOUT = 30.0
+LINK_REGEXP = re.compile(r'href="(/wiki/[^":#]+)"')
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of unsorted values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Stats:
+    latencies: Dict[str, List[float]]
+    sent: int
+    received: int
+    # Connections closed by the server
+    disconnects: int
+
+    def __init__(self) -> None:
+        self.latencies = {"input_echo": [], "turn_transition": [], "navigate": []}
+        self.sent = 0
+        self.received = 0
+        self.disconnects = 0
+
+    def record(self, kind: str, started: Optional[float]) -> None:
+        if started is not None:
+            self.latencies[kind].append(time.perf_counter() - started)
+
+
+class Bot:
+    ws: aiohttp.ClientWebSocketResponse
+    stats: Stats
+    rng: random.Random
+    deadline: float
+
+    def __init__(self, stats: Stats, rng: random.Random, deadline: float) -> None:
+        self.stats = stats
+        self.rng = rng
+        self.deadline = deadline
+
+    async def send(self, msg: Dict[str, Any]) -> None:
+        self.stats.sent += 1
+        await self.ws.send_json(msg)
+
+    async def run(self, session: aiohttp.ClientSession, url: str) -> None:
+        """Play until the deadline, reconnecting if the server drops the connection."""
+        while time.perf_counter() < self.deadline:
+            async with session.ws_connect(url) as self.ws:
+                self.reset()
+                await self.on_connected()
+                while time.perf_counter() < self.deadline:
+                    try:
+                        msg = await self.ws.receive(
+                            timeout=max(0.01, self.deadline - time.perf_counter())
+                        )
+                    except asyncio.TimeoutError:
+                        return
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        self.stats.disconnects += 1
+                        break
+                    self.stats.received += 1
+                    await self.on_message(json.loads(msg.data))
+
+    def reset(self) -> None:
+        """Forget the state of the previous connection."""
+
+    async def later(self, delay: float) -> bool:
+        """Sleep, return False if the test is over by then."""
+        await asyncio.sleep(delay)
+        return time.perf_counter() < self.deadline and not self.ws.closed
+
+    async def on_connected(self) -> None:
+        raise NotImplementedError
+
+    async def on_message(self, msg: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class WordsBot(Bot):
+    """Plays WordsGame, answering with dictionary words containing the particle."""
+
+    ww: WordGameDict
+    # Words submitted in the room, shared by its bots
+    used: Set[str]
+    id: Optional[str] = None
+    whos_turn: Optional[str] = None
+    particle: Optional[str] = None
+    input_sent: Optional[float] = None
+    guess_sent: Optional[float] = None
+
+    def __init__(
+        self,
+        stats: Stats,
+        rng: random.Random,
+        deadline: float,
+        ww: WordGameDict,
+        used: Set[str],
+    ) -> None:
+        super().__init__(stats, rng, deadline)
+        self.ww = ww
+        self.used = used
+
+    async def on_connected(self) -> None:
+        await self.send({"type": CWMSG.Joining, "nickname": "bot"})
+
+    async def on_message(self, msg: Dict[str, Any]) -> None:
+        t = msg["type"]
+        if t == SWMSG.InitGame:
+            self.id = msg["player"]["id"]
+            self.update_state(msg["state"])
+        elif t == SWMSG.UpdateGameState:
+            self.update_state(msg["state"])
+        elif t == SWMSG.UserInput and msg["id"] == self.id:
+            self.stats.record("input_echo", self.input_sent)
+            self.input_sent = None
+        elif t == SWMSG.WrongGuess and msg["id"] == self.id:
+            # Another bot took the word first
+            asyncio.create_task(self.play_turn(self.particle))
+        elif t in (SWMSG.EndGame, SWMSG.GameInProgress):
+            asyncio.create_task(self.rejoin())
+
+    def update_state(self, state: Dict[str, Any]) -> None:
+        if "particle" in state:
+            self.particle = state["particle"]
+        if "whos_turn" not in state:
+            return
+        self.whos_turn = state["whos_turn"]
+        if self.guess_sent is not None:
+            self.stats.record("turn_transition", self.guess_sent)
+            self.guess_sent = None
+        if self.whos_turn is not None and self.whos_turn == self.id:
+            asyncio.create_task(self.play_turn(self.particle))
+
+    async def play_turn(self, particle: Optional[str]) -> None:
+        if particle is None or not await self.later(THINK_TIME):
+            return
+        if self.rng.random() < MISS_RATE:
+            return
+        assert self.ww.index is not None
+        word = self.ww.index.hint(particle, self.used, self.rng)
+        if word is None or self.whos_turn != self.id:
+            return
+        self.used.add(word)
+        self.input_sent = time.perf_counter()
+        await self.send({"type": CWMSG.UpdateInput, "input": word})
+        self.guess_sent = time.perf_counter()
+        await self.send({"type": CWMSG.SubmitGuess, "guess": word})
+
+    def reset(self) -> None:
+        self.id = None
+        self.whos_turn = None
+        self.input_sent = None
+        self.guess_sent = None
+
+    async def rejoin(self) -> None:
+        self.whos_turn = None
+        self.guess_sent = None
+        if await self.later(self.rng.uniform(0.1, 0.5)):
+            await self.on_connected()
+
+
+class WikiBot(Bot):
+    """Plays WikiGame, following random links."""
+
+    navigate_sent: Optional[float] = None
+
+    def reset(self) -> None:
+        self.navigate_sent = None
+
+    async def on_connected(self) -> None:
+        await self.send({"type": WikiCWMSG.Joining, "nickname": "bot"})
+
+    async def on_message(self, msg: Dict[str, Any]) -> None:
+        if msg["type"] == WikiSWMSG.NavigateTo:
+            self.stats.record("navigate", self.navigate_sent)
+            self.navigate_sent = None
+            links = LINK_REGEXP.findall(msg["article"]["content"])
+            if links:
+                asyncio.create_task(self.navigate(self.rng.choice(links)))
+
+    async def navigate(self, path: str) -> None:
+        if await self.later(THINK_TIME):
+            self.navigate_sent = time.perf_counter()
+            await self.send({"type": WikiCWMSG.NavigateTo, "path": path})
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port: int = s.getsockname()[1]
+        return port
+
+
+def serve(port: int, n_words: int, seed: int) -> None:
+    """Child process running the server with a synthetic dictionary."""
+    from aiohttp import web
+
+    import server.words_game
+    from server.__main__ import create_app
+
+    server.words_game._dictionary = synthetic_dictionary(n_words, seed)
+    web.run_app(create_app(), host="127.0.0.1", port=port, print=None)
+
+
+def serve_wiki(port: int, seed: int) -> None:
+    from aiohttp import web
+
+    from bench.wiki_stub import create_wiki_app
+
+    web.run_app(create_wiki_app(seed=seed), host="127.0.0.1", port=port, print=None)
+
+
+async def wait_until_up(session: aiohttp.ClientSession, url: str) -> None:
+    deadline = time.perf_counter() + STARTUP_TIMEOUT
+    while True:
+        try:
+            async with session.get(url) as resp:
+                if resp.status < 500:
+                    return
+        except aiohttp.ClientError:
+            if time.perf_counter() > deadline:
+                raise
+        await asyncio.sleep(0.1)
+
+
+def server_loop_lag(metrics: str) -> Dict[str, float]:
+    values = dict(
+        line.rsplit(" ", 1)
+        for line in metrics.splitlines()
+        if line.startswith("event_loop_lag_seconds_")
+    )
+    count = float(values.get("event_loop_lag_seconds_count", 0))
+    total = float(values.get("event_loop_lag_seconds_sum", 0))
+    return {"mean_ms": 1000 * total / count if count else 0.0, "probes": count}
+
+
+async def run_load(args: argparse.Namespace, url: str) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    stats = Stats()
+    ww = synthetic_dictionary(args.words, args.seed)
+    ws_url = url.replace("http", "ws", 1)
+    timeout = aiohttp.ClientTimeout(total=None)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await wait_until_up(session, f"{url}/metrics")
+        bots = []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        for r in range(args.words_rooms):
+            options = {
+                "time_until_start": 1,
+                "time_to_answer": 2,
+                "lives_initial": 2,
+                "min_players_to_start_game": 2,
+            }
+            async with session.post(f"{url}/words/rooms/", json=options) as resp:
+                room_id = (await resp.json())["id"]
+            used: Set[str] = set()
+            for _ in range(args.words_bots_per_room):
+                bot = WordsBot(stats, random.Random(rng.random()), deadline, ww, used)
+                bots.append(bot.run(session, f"{ws_url}/words/{room_id}/"))
+        for r in range(args.wiki_rooms):
+            for _ in range(args.wiki_bots_per_room):
+                bot = WikiBot(stats, random.Random(rng.random()), deadline)
+                bots.append(bot.run(session, f"{ws_url}/wiki/bench-{r}/"))
+        await asyncio.gather(*bots)
+        elapsed = time.perf_counter() - started
+        async with session.get(f"{url}/metrics") as resp:
+            metrics = await resp.text()
+    return {
+        "config": {
+            k: v for k, v in vars(args).items() if k not in ("output", "compare", "url")
+        },
+        "elapsed": elapsed,
+        "messages_sent": stats.sent,
+        "messages_received": stats.received,
+        "disconnects": stats.disconnects,
+        "throughput": {
+            "sent_per_s": stats.sent / elapsed,
+            "received_per_s": stats.received / elapsed,
+        },
+        "latency_ms": {
+            kind: {
+                "count": len(values),
+                "p50": 1000 * percentile(values, 50),
+                "p99": 1000 * percentile(values, 99),
+            }
+            for kind, values in stats.latencies.items()
+        },
+        "server_loop_lag": server_loop_lag(metrics),
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    def delta(now: float, before: Optional[float]) -> str:
+        if not before:
+            return ""
+        return " ({:+.1f}%)".format(100 * (now - before) / before)
+
+    base_latency = (baseline or {}).get("latency_ms", {})
+    base_throughput = (baseline or {}).get("throughput", {})
+    for key, value in report["throughput"].items():
+        print(f"{key:>16}: {value:9.1f}{delta(value, base_throughput.get(key))}")
+    for kind, values in report["latency_ms"].items():
+        before = base_latency.get(kind, {})
+        print(
+            "{:>16}: p50 {:7.2f} ms{}  p99 {:7.2f} ms{}  n={}".format(
+                kind,
+                values["p50"],
+                delta(values["p50"], before.get("p50")),
+                values["p99"],
+                delta(values["p99"], before.get("p99")),
+                values["count"],
+            )
+        )
+    print("{:>16}: {}".format("disconnects", report["disconnects"]))
+    print(
+        "{:>16}: {:.2f} ms mean".format(
+            "server loop lag", report["server_loop_lag"]["mean_ms"]
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[2:]),
+    )
+    parser.add_argument("--url", help="Server to test, started locally if not set")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--words", type=int, default=20000, help="Dictionary size")
+    parser.add_argument("--words-rooms", type=int, default=10)
+    parser.add_argument("--words-bots-per-room", type=int, default=4)
+    parser.add_argument("--wiki-rooms", type=int, default=5)
+    parser.add_argument("--wiki-bots-per-room", type=int, default=4)
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--compare", help="Report of a previous run to compare with")
+    args = parser.parse_args()
+
+    children = []
+    url = args.url
+    if url is None:
+        ctx = multiprocessing.get_context("spawn")
+        wiki_port, port = free_port(), free_port()
+        # Read by the server settings when the children import them
+        os.environ["WIKI_BASE_URL"] = f"http://127.0.0.1:{wiki_port}"
+        os.environ["ARTICLE_CACHE_PATH"] = ""
+        # No room snapshots left behind, or restored from a previous run
+        os.environ["SNAPSHOT_PATH"] = ""
+        os.environ.setdefault("LOGS_DIR", tempfile.gettempdir())
+        children = [
+            ctx.Process(target=serve_wiki, args=(wiki_port, args.seed)),
+            ctx.Process(target=serve, args=(port, args.words, args.seed)),
+        ]
+        for child in children:
+            child.start()
+        url = f"http://127.0.0.1:{port}"
+    try:
+        report = asyncio.run(run_load(args, url))
+    finally:
+        for child in children:
+            child.terminate()
+            child.join()
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""Micro-benchmarks of the code that runs on every message.
+
+    python -m bench.micro                 # compare with bench/baseline.json
+    python -m bench.micro --save          # record a new baseline
+    python -m bench.micro to_json dispatch
+
+Exits with status 1 when a benchmark is slower than its baseline by more than
+`--threshold`. Baselines only compare on the machine they were recorded on,
+record one before making a change and check against it after.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bench.synthetic import synthetic_dictionary, synthetic_words
+from server.codec import Codec, codecs
+from server.dictionary import load_binary_dictionary, write_dictionary
+from server.lang import Language
+from server.particle_index import ParticleUsage
+from server.turn_order import TurnOrder
+from server.words_game import WordsGame, load_dictionary
+from server.words_game_common import (
+    CWMSG,
+    SWMSG,
+    PlayerInfo,
+    WordGameDict,
+    WordsGameConfig,
+)
+from server.ws_game import ClientInfo, Message, WSGame
+
+# Settings
+# Words in the synthetic dictionary and players in the synthetic lobby
+N_WORDS = 50000
+N_PLAYERS = 16
+# Seconds each measurement runs for at least, and the measurements taken.
+# The best one is kept, the others are slowed down by whatever else runs.
+MIN_TIME = 0.1
+REPEAT = 10
+# Slowdown relative to the baseline that counts as a regression. Runs on the
+# same machine still differ by up to a fifth.
+THRESHOLD = 0.3
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+SEED = 1
+
+# Runs the benchmarked operation the given number of times
+Runner = Callable[[int], None]
+# Prepares the data of a benchmark outside of the measurement
+Setup = Callable[[], Runner]
+
+benchmarks: Dict[str, Setup] = {}
+
+
+def benchmark(name: str) -> Callable[[Setup], Setup]:
+    def register(setup: Setup) -> Setup:
+        benchmarks[name] = setup
+        return setup
+
+    return register
+
+
+_dictionary: Optional[WordGameDict] = None
+
+
+def dictionary() -> WordGameDict:
+    global _dictionary
+    if _dictionary is None:
+        _dictionary = synthetic_dictionary(N_WORDS, SEED)
+    return _dictionary
+
+
+def config() -> WordsGameConfig:
+    return WordsGameConfig(
+        lang=Language.Russian, lives_initial=3, min_players_to_start_game=2
+    )
+
+
+def lobby(n_players: int = N_PLAYERS) -> WordsGame:
+    """A room in the middle of a game, without connected clients."""
+    game = WordsGame("bench", config(), dictionary())
+    gs = game.game_state
+    for i in range(n_players):
+        player = PlayerInfo(game.config, id=str(i), nickname=f"Player {i}")
+        player.letters_left = game.config.all_letters
+        gs.players[player.id] = player
+    gs.whos_turn = "0"
+    # The most common one
+    gs.particle = dictionary().particle_keys[0]
+    gs.clear_dirty()
+    return game
+
+
+def run_async(body: Callable[[int], Any]) -> Runner:
+    """Runner of a coroutine function, with the event loop set up once."""
+    loop = asyncio.new_event_loop()
+
+    def run(n: int) -> None:
+        loop.run_until_complete(body(n))
+
+    return run
+
+
+@benchmark("is_guess_correct")
+def bench_is_guess_correct() -> Runner:
+    game = lobby()
+    particle = game.game_state.particle
+    assert particle is not None and game.ww.index is not None
+    rng = random.Random(SEED)
+    valid = [game.ww.index.hint(particle, set(), rng) or "" for _ in range(50)]
+    # Misses of each kind: unknown words, and words without the particle
+    guesses = valid + [w + "я" for w in valid] + synthetic_words(50, SEED + 1)
+
+    def run(n: int) -> None:
+        is_guess_correct = game.is_guess_correct
+        for i in range(n):
+            is_guess_correct(guesses[i % len(guesses)])
+
+    return run
+
+
+@benchmark("correct_guess")
+def bench_correct_guess() -> Runner:
+    game = lobby()
+    player = game.game_state.players["0"]
+    words = sorted(dictionary().words)[:1000]
+    all_letters = game.config.all_letters
+
+    async def body(n: int) -> None:
+        gs = game.game_state
+        for i in range(n):
+            if i % len(words) == 0:
+                gs.used_words = set()
+                gs.particle_usage = ParticleUsage()
+            if i % 16 == 0:
+                player.letters_left = all_letters
+            await game.correct_guess(player, words[i % len(words)])
+
+    return run_async(body)
+
+
+@benchmark("to_json")
+def bench_to_json() -> Runner:
+    gs = lobby().game_state
+
+    def run(n: int) -> None:
+        for _ in range(n):
+            gs.to_json()
+
+    return run
+
+
+@benchmark("state_update_msg")
+def bench_state_update_msg() -> Runner:
+    """The patch of a new turn: turn, particle and the input of the player."""
+    game = lobby()
+    gs = game.game_state
+    players = list(gs.players.values())
+
+    def run(n: int) -> None:
+        for i in range(n):
+            player = players[i % len(players)]
+            gs.whos_turn = player.id
+            gs.particle = "аб" if i % 2 else "ба"
+            player.input = ""
+            game.state_update_msg("whos_turn", "particle", "players")
+
+    return run
+
+
+def _dictionary_files(directory: str) -> Tuple[str, str, str]:
+    ww = dictionary()
+    words_path = os.path.join(directory, "words.txt")
+    particles_path = os.path.join(directory, "particles.json")
+    compiled_path = os.path.join(directory, "words.bin")
+    with open(words_path, "w", encoding="utf-8") as f:
+        f.writelines(f"{w}\n" for w in sorted(ww.words))
+    with open(particles_path, "w", encoding="utf-8") as f:
+        json.dump(ww.particles, f, ensure_ascii=False)
+    with open(compiled_path, "wb") as f:
+        write_dictionary(f, ww.words, ww.particles)
+    return words_path, particles_path, compiled_path
+
+
+@benchmark("load_dictionary")
+def bench_load_dictionary() -> Runner:
+    # Removed with the runner
+    directory = tempfile.TemporaryDirectory()
+    words_path, particles_path, _ = _dictionary_files(directory.name)
+
+    def run(n: int, directory: Any = directory) -> None:
+        for _ in range(n):
+            load_dictionary(words_path, particles_path)
+
+    return run
+
+
+@benchmark("load_binary_dictionary")
+def bench_load_binary_dictionary() -> Runner:
+    directory = tempfile.TemporaryDirectory()
+    _, _, compiled_path = _dictionary_files(directory.name)
+
+    def run(n: int, directory: Any = directory) -> None:
+        for _ in range(n):
+            load_binary_dictionary(compiled_path)
+
+    return run
+
+
+@benchmark("turn_order")
+def bench_turn_order() -> Runner:
+    """Turns of a lobby, with a player leaving and joining again every round."""
+    players = list(lobby().game_state.players.values())
+
+    def run(n: int) -> None:
+        turns = TurnOrder(players)
+        for i in range(n):
+            next(turns)
+            if i % len(players) == 0:
+                turns.remove(players[1].id)
+                turns.add(players[1])
+
+    return run
+
+
+class _DispatchGame(WSGame):
+    def __init__(self) -> None:
+        super().__init__("bench")
+        self.ws_handlers_mapping = {CWMSG.UpdateInput: self.on_input}
+
+    async def on_input(self, si: ClientInfo, msg: Message) -> None:
+        pass
+
+
+@benchmark("dispatch")
+def bench_dispatch() -> Runner:
+    """Decoding a client message and handing it to its handler, as in `handle_req`."""
+    from aiohttp.web_ws import WebSocketResponse
+
+    game = _DispatchGame()
+    si = ClientInfo(id="1", socket=WebSocketResponse())
+    data = si.codec.encode({"type": CWMSG.UpdateInput, "input": "абвгд"})
+
+    async def body(n: int) -> None:
+        decode = si.codec.decode
+        for _ in range(n):
+            parsed = decode(data)
+            await game.handle_msg(si, parsed["type"], parsed)
+
+    return run_async(body)
+
+
+def _codec_benchmarks(codec: Codec) -> None:
+    """The keystroke relay through the codec: decoding the input, encoding the echo."""
+    update_input = codec.encode({"type": CWMSG.UpdateInput, "input": "абвгд"})
+    user_input = {"type": SWMSG.UserInput, "id": "1", "input": "абвгд"}
+
+    @benchmark(f"decode_input[{codec.name}]")
+    def bench_decode() -> Runner:
+        def run(n: int) -> None:
+            decode = codec.decode
+            for _ in range(n):
+                decode(update_input)
+
+        return run
+
+    @benchmark(f"encode_input[{codec.name}]")
+    def bench_encode() -> Runner:
+        def run(n: int) -> None:
+            encode = codec.encode
+            for _ in range(n):
+                encode(user_input)
+
+        return run
+
+
+for _codec in codecs.values():
+    _codec_benchmarks(_codec)
+
+
+def measure(run: Runner, min_time: float = MIN_TIME, repeat: int = REPEAT) -> float:
+    """Best seconds per operation out of `repeat` measurements."""
+    n = 1
+    while True:
+        start = time.perf_counter()
+        run(n)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        n = max(n * 2, int(n * min_time / max(elapsed, 1e-9)))
+    best = elapsed / n
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        run(n)
+        best = min(best, (time.perf_counter() - start) / n)
+    return best
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def compare(
+    results: Dict[str, float], baseline: Dict[str, float], threshold: float
+) -> List[str]:
+    """Print the results next to the baseline, return the regressed benchmarks."""
+    regressed = []
+    for name, seconds in results.items():
+        before = baseline.get(name, None)
+        line = f"{name:>24}: {format_time(seconds):>10}"
+        if before is not None:
+            change = seconds / before - 1
+            line += f"  baseline {format_time(before):>10}  {change:+.1%}"
+            if change > threshold:
+                line += "  REGRESSION"
+                regressed.append(name)
+        print(line)
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[2:]),
+    )
+    parser.add_argument("names", nargs="*", help="Benchmarks to run, all by default")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Record a new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--min-time", type=float, default=MIN_TIME)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    args = parser.parse_args()
+
+    names = args.names or list(benchmarks)
+    unknown = [name for name in names if name not in benchmarks]
+    if unknown:
+        parser.error("unknown benchmarks: {}".format(", ".join(unknown)))
+    baseline: Dict[str, float] = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    results = {}
+    for name in names:
+        results[name] = measure(benchmarks[name](), args.min_time, args.repeat)
+    if args.save:
+        compare(results, {}, args.threshold)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return
+    regressed = compare(results, baseline, args.threshold)
+    if regressed:
+        print("Slower than the baseline: {}".format(", ".join(regressed)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
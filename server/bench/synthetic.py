@@ -0,0 +1,79 @@
+"""Synthetic dictionaries and wikis, so benchmarks run without the generated assets."""
+import random
+from collections import Counter
+from typing import List
+
+from server.particle_index import ParticleIndex
+from server.lang import Language
+from server.words_game_common import (
+    Difficulty,
+    WordGameDict,
+    WordLetters,
+    alphabet_for_lang,
+)
+
+# A few letters make for common particles, so every difficulty has some
+LETTERS = "абвгдежз"
+PARTICLE_LENGTHS = (2, 3)
+
+
+def synthetic_words(n_words: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < n_words:
+        words.add("".join(rng.choice(LETTERS) for _ in range(rng.randint(4, 9))))
+    return sorted(words)
+
+
+def synthetic_dictionary(n_words: int, seed: int = 0) -> WordGameDict:
+    words = synthetic_words(n_words, seed)
+    counts: Counter[str] = Counter()
+    for word in words:
+        counts.update(
+            {
+                word[i : i + n]
+                for n in PARTICLE_LENGTHS
+                for i in range(len(word) - n + 1)
+            }
+        )
+    ww = WordGameDict()
+    ww.words = set(words)
+    ww.particles = dict(counts.most_common())
+    ww.particle_keys = list(ww.particles)
+    for diff in Difficulty:
+        ww.by_difficulty[diff] = [
+            p for p in ww.particle_keys if ww.particles[p] >= diff.value
+        ]
+    ww.index = ParticleIndex.build(words, ww.particle_keys)
+    ww.letters = WordLetters.build(alphabet_for_lang(Language.Russian), words)
+    return ww
+
+
+def page_title(i: int) -> str:
+    return f"Page_{i}"
+
+
+def page_links(i: int, n_pages: int, links_per_page: int) -> List[int]:
+    """Pages linked from page `i`, the same every time."""
+    rng = random.Random(i)
+    return [rng.randrange(n_pages) for _ in range(links_per_page)]
+
+
+def wiki_page_html(i: int, n_pages: int, links_per_page: int, paragraphs: int) -> str:
+    """A page shaped like a Wikipedia article."""
+    links = page_links(i, n_pages, links_per_page)
+    body = []
+    for n in range(paragraphs):
+        anchors = " ".join(
+            f'<a href="/wiki/{page_title(t)}" title="{page_title(t)}">{page_title(t)}</a>'
+            for t in links[n::paragraphs]
+        )
+        body.append(f"<p>Paragraph {n} of page {i} with some text. {anchors}</p>")
+    return (
+        "<!DOCTYPE html><html><head><title>{title}</title>"
+        "<script>var wgPageName = '{title}';</script></head><body>"
+        '<h1 id="firstHeading" class="firstHeading">{title}</h1>'
+        '<div id="mw-content-text"><div class="mw-parser-output">{body}</div></div>'
+        '<div id="footer"><a href="/wiki/Wikipedia:About">About</a></div>'
+        "</body></html>"
+    ).format(title=page_title(i), body="".join(body))
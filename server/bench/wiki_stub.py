@@ -0,0 +1,61 @@
+"""Local stand-in for Wikipedia, serving synthetic articles.
+
+    python -m bench.wiki_stub --port 8090 --pages 5000
+"""
+import argparse
+import asyncio
+import random
+from typing import Optional
+
+from aiohttp import web
+
+from bench.synthetic import page_title, wiki_page_html
+
+# Settings
+N_PAGES = 5000
+LINKS_PER_PAGE = 30
+PARAGRAPHS = 10
+
+
+def create_wiki_app(
+    n_pages: int = N_PAGES,
+    links_per_page: int = LINKS_PER_PAGE,
+    paragraphs: int = PARAGRAPHS,
+    delay: float = 0.0,
+    seed: Optional[int] = None,
+) -> web.Application:
+    """`delay` seconds are added to every response, to stand for the network."""
+    rng = random.Random(seed)
+
+    async def handle_article(request: web.Request) -> web.StreamResponse:
+        if delay:
+            await asyncio.sleep(delay)
+        title = request.match_info["title"]
+        if title == "Special:Random":
+            raise web.HTTPFound(f"/wiki/{page_title(rng.randrange(n_pages))}")
+        prefix, _, number = title.partition("_")
+        if prefix != "Page" or not number.isdigit() or int(number) >= n_pages:
+            raise web.HTTPNotFound()
+        html = wiki_page_html(int(number), n_pages, links_per_page, paragraphs)
+        return web.Response(text=html, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/wiki/{title}", handle_article)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--pages", type=int, default=N_PAGES)
+    parser.add_argument("--links", type=int, default=LINKS_PER_PAGE)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    app = create_wiki_app(args.pages, args.links, delay=args.delay, seed=args.seed)
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 from aiohttp import web
-from server.env import DEV, HOST
+from server.env import DEV, HOST, INTERNAL_PORT, PORT, WORKERS
 from server.logger import configure_loggers, logger
+from server.backplane import backplane
+from server.room_snapshots import snapshots
 from server.routes import routes
+import server.metrics
 import server.words_game
 import server.wiki_game
+from server.workers import cluster, run_workers
 
 
 def create_app() -> web.Application:
@@ -11,9 +15,27 @@ def create_app() -> web.Application:
     logger.info("Running in {} mode".format("DEV" if DEV else "PROD"))
     app = web.Application()
     app.add_routes(routes)
+    app.on_startup.append(server.words_game.preload_dictionary)
+    app.cleanup_ctx.append(server.wiki_game.wiki_context)
+    app.cleanup_ctx.append(server.metrics.metrics_context)
+    app.cleanup_ctx.append(cluster.lifecycle)
+    app.cleanup_ctx.append(backplane.lifecycle)
+    # After the games and the backplane, the restored rooms need them
+    app.cleanup_ctx.append(snapshots.lifecycle)
+    app.on_shutdown.append(snapshots.on_shutdown)
     return app
 
 
 if __name__ == "__main__":
-    app_ = create_app()
-    web.run_app(app_, host=HOST)
+    if WORKERS > 1:
+        run_workers(
+            create_app,
+            HOST,
+            PORT,
+            WORKERS,
+            INTERNAL_PORT,
+            preload=server.words_game.shared_dictionary,
+        )
+    else:
+        app_ = create_app()
+        web.run_app(app_, host=HOST, port=PORT)
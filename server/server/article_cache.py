@@ -0,0 +1,178 @@
+import asyncio
+import json
+import sqlite3
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from server.logger import logger
+from server.wiki_game_common import Article, normalize_wiki_path
+
+# Settings
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ArticleCache:
+    """Two-tier article cache.
+
+    Recently used articles are kept in memory, in an LRU bounded by the size of
+    their content. Every article is also stored compressed in an SQLite
+    database, so it survives evictions and restarts. Keys are normalized wiki
+    paths, see `normalize_wiki_path`.
+    """
+
+    db_path: Optional[str]
+    max_bytes: int
+    memory: "OrderedDict[str, Article]"
+    memory_bytes: int
+    # Hit/miss counters
+    memory_hits: int
+    disk_hits: int
+    misses: int
+
+    def __init__(self, db_path: Optional[str], max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db: Optional[sqlite3.Connection] = None
+        # SQLite is only ever touched from this thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="article-cache")
+
+    async def get(self, path: str) -> Optional[Article]:
+        key = normalize_wiki_path(path)
+        article = self.memory.get(key, None)
+        if article is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return article
+        if self.db_path:
+            loop = asyncio.get_running_loop()
+            article = await loop.run_in_executor(self._executor, self._db_get, key)
+            if article is not None:
+                self.disk_hits += 1
+                self._remember(key, article)
+                return article
+        self.misses += 1
+        return None
+
+    def in_memory(self, path: str) -> bool:
+        return normalize_wiki_path(path) in self.memory
+
+    async def put(self, article: Article, *aliases: str) -> None:
+        """Store the article under its own path and the paths it was requested with."""
+        keys = {normalize_wiki_path(p) for p in (article.path, *aliases)}
+        for key in keys:
+            self._remember(key, article)
+        if self.db_path:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._db_put, keys, article)
+
+    async def link_rows(self) -> Tuple[List[Tuple[str, List[str]]], Dict[str, str]]:
+        """Path and links of every cached article, and the article paths of the aliases.
+
+        Used to build the link graph.
+        """
+        if self.db_path:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._db_link_rows)
+        return self._split_aliases(
+            (key, article.path, article.links) for key, article in self.memory.items()
+        )
+
+    @staticmethod
+    def _split_aliases(
+        rows: Iterable[Tuple[str, str, List[str]]]
+    ) -> Tuple[List[Tuple[str, List[str]]], Dict[str, str]]:
+        articles = []
+        aliases = {}
+        for key, url, links in rows:
+            path = normalize_wiki_path(url)
+            if key == path:
+                articles.append((key, links))
+            else:
+                aliases[key] = path
+        return articles, aliases
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_articles": len(self.memory),
+            "memory_bytes": self.memory_bytes,
+        }
+
+    async def close(self) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._db_close)
+
+    def _remember(self, key: str, article: Article) -> None:
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_bytes -= len(old.content)
+        self.memory[key] = article
+        self.memory_bytes += len(article.content)
+        while self.memory_bytes > self.max_bytes and len(self.memory) > 1:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted.content)
+
+    def _db_conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            assert self.db_path is not None
+            self._db = sqlite3.connect(self.db_path)
+            # Lets several server processes share the database
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS articles ("
+                "path TEXT PRIMARY KEY, title TEXT, url TEXT, content BLOB, links TEXT)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(articles)")]
+            if "links" not in columns:
+                self._db.execute("ALTER TABLE articles ADD COLUMN links TEXT")
+            logger.info("Opened article cache at {}".format(self.db_path))
+        return self._db
+
+    def _db_get(self, key: str) -> Optional[Article]:
+        row = (
+            self._db_conn()
+            .execute(
+                "SELECT title, url, content, links FROM articles WHERE path = ?", (key,)
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        title, url, content, links = row
+        return Article(
+            title=title,
+            path=url,
+            content=zlib.decompress(content).decode(),
+            links=json.loads(links) if links else [],
+        )
+
+    def _db_put(self, keys: Set[str], article: Article) -> None:
+        content = zlib.compress(article.content.encode())
+        links = json.dumps(article.links)
+        db = self._db_conn()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO articles (path, title, url, content, links) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(key, article.title, article.path, content, links) for key in keys],
+            )
+
+    def _db_link_rows(self) -> Tuple[List[Tuple[str, List[str]]], Dict[str, str]]:
+        rows = self._db_conn().execute("SELECT path, url, links FROM articles")
+        return self._split_aliases(
+            (key, url, json.loads(links) if links else []) for key, url, links in rows
+        )
+
+    def _db_close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,496 @@
+"""Publish/subscribe between the nodes of the server, to spread the rooms over several boxes.
+
+Each room is owned by the node that claims it first, and its state only
+lives there. Clients connected to other nodes send their messages to the
+owner and receive the broadcasts of the room through the backplane, see
+`server.rooms`.
+
+    BACKPLANE=                     # a single node, the default
+    BACKPLANE=unix:/tmp/bp.sock    # nodes connected to a broker
+    BACKPLANE=tcp:10.0.0.1:9200
+
+    python -m server.backplane unix:/tmp/bp.sock   # runs the broker
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+from collections import defaultdict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+from server.env import BACKPLANE
+from server.logger import logger
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+Message = Dict[str, Any]
+# Called with every message published on a channel, in order
+Handler = Callable[[Message], None]
+
+# Settings
+# Seconds to wait for the broker to answer a claim
+CLAIM_TIMEOUT = 5.0
+# Seconds between the attempts to reconnect to the broker
+RECONNECT_DELAY = 1.0
+# Largest frame accepted from the other side of a socket
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# Bytes waiting to be sent to a node before the broker drops it as too slow
+MAX_BUFFERED = 4 * 1024 * 1024
+
+_header = struct.Struct(">I")
+
+
+class BackplaneError(Exception):
+    pass
+
+
+def default_node() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class Backplane:
+    """Channels of messages between the nodes, and the owners of the rooms."""
+
+    # Id of this node
+    node: str
+    # Called with the keys this node has lost to another node
+    lost_handlers: List[Callable[[str], None]]
+
+    def __init__(self, node: Optional[str] = None) -> None:
+        self.node = node or ""
+        self.lost_handlers = []
+
+    async def start(self) -> None:
+        if not self.node:
+            self.node = default_node()
+
+    async def close(self) -> None:
+        pass
+
+    def publish(self, channel: str, msg: Message) -> None:
+        """Send a message to the subscribers of the channel, on every node."""
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        raise NotImplementedError
+
+    def unsubscribe(self, channel: str, handler: Handler) -> None:
+        raise NotImplementedError
+
+    async def claim(self, key: str) -> str:
+        """Node owning the key, which becomes this one if nobody owns it yet."""
+        raise NotImplementedError
+
+    async def release(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """Node owning the key, if any."""
+        raise NotImplementedError
+
+    def on_claim_lost(self, handler: Callable[[str], None]) -> None:
+        self.lost_handlers.append(handler)
+
+    def claim_lost(self, key: str) -> None:
+        """Another node owns the key this node had claimed."""
+        logger.error("Lost the claim on %s to another node", key)
+        for handler in list(self.lost_handlers):
+            try:
+                handler(key)
+            except Exception:
+                logger.exception("Failed to give up %s", key)
+
+    async def lifecycle(self, app: web.Application) -> AsyncIterator[None]:
+        """Connects on startup and disconnects on cleanup, for `app.cleanup_ctx`."""
+        await self.start()
+        yield
+        await self.close()
+
+
+class MemoryHub:
+    """Subscriptions and owners shared by the in-memory backplanes of a process."""
+
+    subscribers: Dict[str, List[Handler]]
+    owners: Dict[str, str]
+
+    def __init__(self) -> None:
+        self.subscribers = defaultdict(list)
+        self.owners = {}
+
+
+class MemoryBackplane(Backplane):
+    """Nodes living in the same process, e.g. a single node or the tests.
+
+    Messages are delivered on the next iteration of the event loop, as they
+    would be by a remote backplane.
+    """
+
+    hub: MemoryHub
+
+    def __init__(
+        self, hub: Optional[MemoryHub] = None, node: Optional[str] = None
+    ) -> None:
+        super().__init__(node or default_node())
+        self.hub = hub or MemoryHub()
+
+    def publish(self, channel: str, msg: Message) -> None:
+        handlers = self.hub.subscribers.get(channel, None)
+        if handlers:
+            loop = asyncio.get_running_loop()
+            for handler in handlers:
+                loop.call_soon(handler, msg)
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self.hub.subscribers[channel].append(handler)
+
+    def unsubscribe(self, channel: str, handler: Handler) -> None:
+        handlers = self.hub.subscribers.get(channel, [])
+        if handler in handlers:
+            handlers.remove(handler)
+        if not handlers:
+            self.hub.subscribers.pop(channel, None)
+
+    async def claim(self, key: str) -> str:
+        return self.hub.owners.setdefault(key, self.node)
+
+    async def release(self, key: str) -> None:
+        if self.hub.owners.get(key, None) == self.node:
+            del self.hub.owners[key]
+
+    async def lookup(self, key: str) -> Optional[str]:
+        return self.hub.owners.get(key, None)
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def write_frame(writer: asyncio.StreamWriter, value: Any) -> None:
+    data = _dumps(value)
+    writer.write(_header.pack(len(data)) + data)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Any:
+    """The next frame, or None at the end of the stream."""
+    try:
+        size, = _header.unpack(await reader.readexactly(_header.size))
+        if size > MAX_FRAME_SIZE:
+            raise BackplaneError(f"Frame of {size} bytes is too large")
+        return _loads(await reader.readexactly(size))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+async def open_connection(
+    address: str,
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    kind, _, rest = address.partition(":")
+    if kind == "unix":
+        return await asyncio.open_unix_connection(rest)
+    if kind == "tcp":
+        host, _, port = rest.rpartition(":")
+        return await asyncio.open_connection(host, int(port))
+    raise ValueError(f"Unknown backplane address: {address}")
+
+
+class SocketBackplane(Backplane):
+    """Nodes connected to a `Broker` through a unix or TCP socket.
+
+    Frames are JSON arrays prefixed with their length: `["pub", channel, msg]`,
+    `["sub", channel]`, `["unsub", channel]`, `["claim", id, key, node]`,
+    `["lookup", id, key]` and `["release", key]` from the nodes,
+    `["msg", channel, msg]` and `["owner", id, node]` from the broker. The
+    broker drops the claims of a node that disconnects, the node claims them
+    again when it reconnects and gives up those another node has claimed
+    meanwhile.
+    """
+
+    address: str
+    handlers: Dict[str, List[Handler]]
+    # Keys claimed by this node
+    claims: Set[str]
+    # Claims and lookups waiting for the answer of the broker, by request id
+    pending: Dict[int, "asyncio.Future[Optional[str]]"]
+    writer: Optional[asyncio.StreamWriter]
+    connected: asyncio.Event
+    task: Optional["asyncio.Task[None]"]
+    reclaiming: Optional["asyncio.Task[None]"]
+    __request_id = 0
+
+    def __init__(self, address: str, node: Optional[str] = None) -> None:
+        super().__init__(node)
+        self.address = address
+        self.handlers = defaultdict(list)
+        self.claims = set()
+        self.pending = {}
+        self.writer = None
+        self.connected = asyncio.Event()
+        self.task = None
+        self.reclaiming = None
+
+    async def start(self) -> None:
+        await super().start()
+        self.task = asyncio.create_task(self.run())
+        await self.connected.wait()
+
+    async def close(self) -> None:
+        for task in (self.reclaiming, self.task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.task = self.reclaiming = None
+
+    async def run(self) -> None:
+        """Stay connected to the broker, dispatching the messages it sends."""
+        while True:
+            try:
+                reader, writer = await open_connection(self.address)
+            except OSError as e:
+                logger.warning(
+                    "Can't connect to the backplane at %s: %r", self.address, e
+                )
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            self.writer = writer
+            for channel in self.handlers:
+                write_frame(writer, ["sub", channel])
+            self.connected.set()
+            reclaiming = self.reclaiming = asyncio.create_task(self.reclaim())
+            try:
+                while True:
+                    frame = await read_frame(reader)
+                    if frame is None:
+                        break
+                    self.dispatch(frame)
+            except (OSError, BackplaneError) as e:
+                logger.warning("Backplane connection failed: %r", e)
+            finally:
+                self.writer = None
+                self.connected.clear()
+                writer.close()
+                reclaiming.cancel()
+            logger.error("Lost the backplane connection, reconnecting")
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(BackplaneError("Backplane disconnected"))
+            self.pending = {}
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def reclaim(self) -> None:
+        """Claim again the keys the broker dropped when this node disconnected."""
+        keys = list(self.claims)
+        owners = await asyncio.gather(
+            *(self.request("claim", key, self.node) for key in keys),
+            return_exceptions=True,
+        )
+        for key, owner in zip(keys, owners):
+            if isinstance(owner, BaseException):
+                # Claimed again on the next reconnection
+                logger.warning("Can't claim %s again: %r", key, owner)
+            elif owner != self.node and key in self.claims:
+                self.claims.discard(key)
+                self.claim_lost(key)
+
+    def dispatch(self, frame: List[Any]) -> None:
+        op = frame[0]
+        if op == "msg":
+            for handler in list(self.handlers.get(frame[1], ())):
+                # A failing handler mustn't take the connection down
+                try:
+                    handler(frame[2])
+                except Exception:
+                    logger.exception("Failed to handle a message on %s", frame[1])
+        elif op == "owner":
+            future = self.pending.pop(frame[1], None)
+            if future is not None and not future.done():
+                future.set_result(frame[2])
+
+    def send(self, frame: List[Any]) -> None:
+        # Written as soon as the connection is back otherwise, if it matters
+        if self.writer is not None:
+            write_frame(self.writer, frame)
+
+    def publish(self, channel: str, msg: Message) -> None:
+        self.send(["pub", channel, msg])
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        handlers = self.handlers[channel]
+        if not handlers:
+            self.send(["sub", channel])
+        handlers.append(handler)
+
+    def unsubscribe(self, channel: str, handler: Handler) -> None:
+        handlers = self.handlers.get(channel, [])
+        if handler in handlers:
+            handlers.remove(handler)
+        if not handlers:
+            self.handlers.pop(channel, None)
+            self.send(["unsub", channel])
+
+    async def request(self, op: str, key: str, *args: str) -> Optional[str]:
+        """Owner of the key, as answered by the broker."""
+        try:
+            await asyncio.wait_for(self.connected.wait(), CLAIM_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise BackplaneError("Not connected to the backplane")
+        self.__request_id += 1
+        request_id = self.__request_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.send([op, request_id, key, *args])
+        try:
+            return await asyncio.wait_for(future, CLAIM_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.pending.pop(request_id, None)
+            raise BackplaneError(f"The backplane didn't answer the {op} of {key}")
+
+    async def claim(self, key: str) -> str:
+        owner = await self.request("claim", key, self.node)
+        assert owner is not None
+        if owner == self.node:
+            self.claims.add(key)
+        return owner
+
+    async def lookup(self, key: str) -> Optional[str]:
+        return await self.request("lookup", key)
+
+    async def release(self, key: str) -> None:
+        self.claims.discard(key)
+        self.send(["release", key])
+
+
+class Broker:
+    """Relays the messages between the nodes connected to it, and keeps the owners of the keys.
+
+    A node that doesn't keep up with the messages is disconnected instead of
+    holding them in memory, it connects and claims its rooms again.
+    """
+
+    subscribers: Dict[str, Set[asyncio.StreamWriter]]
+    # Owner of each key, and the connection it has claimed it from
+    owners: Dict[str, Tuple[str, asyncio.StreamWriter]]
+    server: Optional[asyncio.AbstractServer]
+
+    def __init__(self) -> None:
+        self.subscribers = defaultdict(set)
+        self.owners = {}
+        self.server = None
+
+    async def start(self, address: str) -> None:
+        kind, _, rest = address.partition(":")
+        if kind == "unix":
+            if os.path.exists(rest):
+                os.unlink(rest)
+            self.server = await asyncio.start_unix_server(self.handle, rest)
+        elif kind == "tcp":
+            host, _, port = rest.rpartition(":")
+            self.server = await asyncio.start_server(self.handle, host, int(port))
+        else:
+            raise ValueError(f"Unknown backplane address: {address}")
+        logger.info("Backplane broker listening on %s", address)
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        channels: Set[str] = set()
+        try:
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                op = frame[0]
+                if op == "pub":
+                    data = _dumps(["msg", frame[1], frame[2]])
+                    data = _header.pack(len(data)) + data
+                    for subscriber in list(self.subscribers.get(frame[1], ())):
+                        if subscriber.transport.get_write_buffer_size() > MAX_BUFFERED:
+                            logger.error("Dropping a backplane node too slow to read")
+                            # Unlike close, doesn't wait for the buffer to be sent
+                            subscriber.transport.abort()
+                        else:
+                            subscriber.write(data)
+                elif op == "sub":
+                    channels.add(frame[1])
+                    self.subscribers[frame[1]].add(writer)
+                elif op == "unsub":
+                    channels.discard(frame[1])
+                    self.unsubscribe(frame[1], writer)
+                elif op == "claim":
+                    _, request_id, key, node = frame
+                    owner = self.owners.setdefault(key, (node, writer))
+                    write_frame(writer, ["owner", request_id, owner[0]])
+                elif op == "lookup":
+                    _, request_id, key = frame
+                    found = self.owners.get(key, None)
+                    write_frame(
+                        writer, ["owner", request_id, found[0] if found else None]
+                    )
+                elif op == "release":
+                    claimed = self.owners.get(frame[1], None)
+                    if claimed is not None and claimed[1] is writer:
+                        del self.owners[frame[1]]
+        except (OSError, BackplaneError) as e:
+            logger.warning("Backplane node disconnected: %r", e)
+        finally:
+            for channel in channels:
+                self.unsubscribe(channel, writer)
+            for key, (_, claimed_by) in list(self.owners.items()):
+                if claimed_by is writer:
+                    del self.owners[key]
+            writer.close()
+
+    def unsubscribe(self, channel: str, writer: asyncio.StreamWriter) -> None:
+        subscribers = self.subscribers.get(channel, None)
+        if subscribers is not None:
+            subscribers.discard(writer)
+            if not subscribers:
+                del self.subscribers[channel]
+
+
+def create_backplane(address: str) -> Backplane:
+    if not address:
+        return MemoryBackplane()
+    return SocketBackplane(address)
+
+
+backplane = create_backplane(BACKPLANE)
+
+
+async def run_broker(address: str) -> None:
+    broker = Broker()
+    await broker.start(address)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await broker.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the broker of the backplane")
+    parser.add_argument("address", help="unix:PATH or tcp:HOST:PORT")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_broker(args.address))
+    except KeyboardInterrupt:
+        pass
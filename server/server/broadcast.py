@@ -0,0 +1,95 @@
+import asyncio
+from typing import Optional
+
+from aiohttp.http_websocket import WSCloseCode
+from aiohttp.web_ws import WebSocketResponse
+
+from server.codec import Frame
+from server.logger import logger
+from server.metrics import evictions
+
+# Settings
+SEND_TIMEOUT = 5.0
+OUTBOX_SIZE = 256
+
+
+class Outbox:
+    """Bounded queue of outbound frames for a single client socket.
+
+    Frames are written by a writer task owned by the outbox, so a slow socket
+    only delays its own client. A client that overflows the queue or stalls a
+    single write for longer than `send_timeout` is evicted.
+    """
+
+    socket: WebSocketResponse
+    send_timeout: float
+    queue: "asyncio.Queue[Frame]"
+    writer: Optional["asyncio.Task[None]"]
+    # Closes the socket of an evicted client
+    closing: Optional["asyncio.Task[bool]"]
+    evicted: bool
+
+    def __init__(
+        self,
+        socket: WebSocketResponse,
+        size: int = OUTBOX_SIZE,
+        send_timeout: float = SEND_TIMEOUT,
+    ) -> None:
+        self.socket = socket
+        self.send_timeout = send_timeout
+        self.queue = asyncio.Queue(maxsize=size)
+        self.writer = None
+        self.closing = None
+        self.evicted = False
+
+    def push(self, frame: Frame) -> bool:
+        """Queue a frame without waiting. Returns False if the frame was dropped."""
+        if self.evicted:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.evict("outbound queue overflow")
+            return False
+        if self.writer is None:
+            self.writer = asyncio.create_task(self.drain())
+        return True
+
+    async def drain(self) -> None:
+        while True:
+            frame = await self.queue.get()
+            send = (
+                self.socket.send_bytes(frame)
+                if isinstance(frame, bytes)
+                else self.socket.send_str(frame)
+            )
+            try:
+                await asyncio.wait_for(send, self.send_timeout)
+            except asyncio.TimeoutError:
+                self.evict("send timed out")
+                return
+            except (ConnectionError, RuntimeError):
+                # The socket is closing, the request handler cleans the client up.
+                # Nothing else gets written to it
+                self.evicted = True
+                return
+
+    def evict(self, reason: str) -> None:
+        """Stop writing to the client and close its socket."""
+        if self.evicted:
+            return
+        self.evicted = True
+        logger.warning("Evicting lagging client: %s", reason, extra={"event": "evict"})
+        evictions.inc()
+        if self.writer is not None and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        self.closing = asyncio.create_task(
+            self.socket.close(code=WSCloseCode.TRY_AGAIN_LATER, message=b"Too slow")
+        )
+
+    def close(self) -> None:
+        """Drop pending frames and stop the writer task."""
+        self.evicted = True
+        if self.writer is not None:
+            self.writer.cancel()
+            self.writer = None
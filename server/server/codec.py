@@ -0,0 +1,123 @@
+"""Encodings of the WebSocket messages, negotiated per connection.
+
+Clients pick one with the WebSocket subprotocol, e.g.
+`new WebSocket(url, ["msgpack", "json"])`, the first one the server supports
+is used. Clients that don't ask for any get JSON.
+"""
+import json
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+Message = Dict[str, Any]
+# Message that is already serialized and ready to be written to a socket,
+# text for the text codecs and bytes for the binary ones
+Frame = Union[str, bytes]
+
+# Settings
+DEFAULT_CODEC = "json"
+
+
+class CodecError(ValueError):
+    pass
+
+
+class Codec:
+    # Name of the codec, which is also its WebSocket subprotocol
+    name: str
+    # Whether the frames are sent as binary WebSocket messages
+    binary = False
+
+    def available(self) -> bool:
+        return True
+
+    def encode(self, msg: Message) -> Frame:
+        raise NotImplementedError
+
+    def decode(self, data: Frame) -> Message:
+        """Message with its `type`, or CodecError if the frame can't be decoded."""
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    """Text frames of JSON, serialized with orjson when it's installed."""
+
+    name = "json"
+
+    def encode(self, msg: Message) -> Frame:
+        if orjson is not None:
+            return orjson.dumps(msg).decode("utf-8")
+        return json.dumps(msg)
+
+    def decode(self, data: Frame) -> Message:
+        try:
+            msg = orjson.loads(data) if orjson is not None else json.loads(data)
+        except ValueError as e:
+            raise CodecError(str(e)) from e
+        if not isinstance(msg, dict) or "type" not in msg:
+            raise CodecError("Messages must be objects with a type")
+        # Looked up in the handlers, which an array or an object can't be
+        if not isinstance(msg["type"], (int, str)):
+            raise CodecError("The type of a message must be a number or a string")
+        return msg
+
+
+class MsgpackCodec(Codec):
+    """Binary frames: the message type as a single byte, then the other fields in MessagePack.
+
+    The type can be read without decoding the rest, and the frames of
+    messages with short fields, e.g. the keystroke relays, are a few bytes.
+    """
+
+    name = "msgpack"
+    binary = True
+    packer: Any
+
+    def __init__(self) -> None:
+        # Reused, it keeps its buffer between messages
+        self.packer = msgpack.Packer(use_bin_type=True) if msgpack is not None else None
+
+    def available(self) -> bool:
+        return msgpack is not None
+
+    def encode(self, msg: Message) -> Frame:
+        body = dict(msg)
+        _type = body.pop("type")
+        frame: bytes = bytes((_type,)) + self.packer.pack(body)
+        return frame
+
+    def decode(self, data: Frame) -> Message:
+        if not isinstance(data, bytes) or not data:
+            raise CodecError("Expected a binary frame")
+        try:
+            msg = msgpack.unpackb(data[1:], raw=False) if len(data) > 1 else {}
+        except ValueError as e:
+            raise CodecError(str(e)) from e
+        if not isinstance(msg, dict):
+            raise CodecError("Messages must be maps")
+        msg["type"] = data[0]
+        return msg
+
+
+# Supported codecs by name, in the order of preference
+codecs: Dict[str, Codec] = {
+    codec.name: codec for codec in (MsgpackCodec(), JSONCodec()) if codec.available()
+}
+
+
+def protocols() -> List[str]:
+    """Subprotocols offered to the clients."""
+    return list(codecs)
+
+
+def codec_for(protocol: Optional[str]) -> Codec:
+    """Codec of a connection, by the subprotocol it has negotiated."""
+    return codecs.get(protocol or DEFAULT_CODEC, codecs[DEFAULT_CODEC])
@@ -0,0 +1,228 @@
+"""Compiled binary dictionary format.
+
+All integers are little-endian uint32 unless stated otherwise. Sections
+follow each other and are padded to 4 bytes:
+
+    header            magic, version, counts and blob sizes (HEADER)
+    word offsets      n_words + 1 entries into the words blob
+    words blob        utf-8 words sorted by their encoded bytes
+    particle offsets  n_particles + 1 entries into the particles blob
+    particle counts   n_particles entries
+    particles blob    utf-8 particles
+    difficulties      n_difficulties times: threshold, size, size particle ids
+    posting offsets   n_particles + 1 entries into the postings
+    postings          sorted ids of the words containing each particle
+    letter masks      n_words entries, the letters of each word (see `Alphabet`)
+
+The file is memory-mapped, so words are looked up in place and processes
+loading the same file share its pages.
+"""
+import mmap
+import struct
+import sys
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Sequence, Union, overload
+
+from server.lang import Language
+from server.particle_index import ParticleIndex, build_postings
+from server.words_game_common import (
+    Difficulty,
+    ParticleDict,
+    WordGameDict,
+    WordLetters,
+    alphabet_for_lang,
+)
+
+MAGIC = b"WGD\x00"
+VERSION = 3
+# magic, version, n_difficulties, n_words, words blob size, n_particles, particles blob size,
+# language
+HEADER = struct.Struct("<4sHHIIIII")
+# Particle counts of the difficulties, each gets the list of its particles
+THRESHOLDS = tuple(diff.value for diff in Difficulty)
+
+
+class DictionaryFormatError(Exception):
+    pass
+
+
+class MappedWords(Sequence[str]):
+    """Sorted words stored in a memory-mapped blob. Supports `in`, `len()` and indexing."""
+
+    blob: memoryview
+    offsets: memoryview
+
+    def __init__(self, blob: memoryview, offsets: memoryview) -> None:
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def encoded(self, i: int) -> bytes:
+        return bytes(self.blob[self.offsets[i] : self.offsets[i + 1]])
+
+    @overload
+    def __getitem__(self, i: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[str]:
+        ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("word id out of range")
+        return self.encoded(i).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def find(self, word: str) -> int:
+        """Id of the word, or -1 if it's not in the dictionary."""
+        key = word.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.encoded(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self.encoded(lo) == key:
+            return lo
+        return -1
+
+    def __contains__(self, word: object) -> bool:
+        return isinstance(word, str) and self.find(word) != -1
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % 4)
+
+
+def _write_offsets(f: BinaryIO, encoded: Sequence[bytes]) -> bytes:
+    """Write the offsets table, return the padded blob of the strings."""
+    offsets = [0]
+    for s in encoded:
+        offsets.append(offsets[-1] + len(s))
+    f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+    blob = b"".join(encoded)
+    return blob + _padding(len(blob))
+
+
+def write_dictionary(
+    f: BinaryIO,
+    words: Iterable[str],
+    particles: ParticleDict,
+    thresholds: Sequence[int] = THRESHOLDS,
+    lang: Language = Language.Russian,
+) -> None:
+    encoded_words = sorted({w.encode("utf-8") for w in words})
+    particle_keys = list(particles.keys())
+    encoded_particles = [p.encode("utf-8") for p in particle_keys]
+    f.write(
+        HEADER.pack(
+            MAGIC,
+            VERSION,
+            len(thresholds),
+            len(encoded_words),
+            sum(map(len, encoded_words)),
+            len(particle_keys),
+            sum(map(len, encoded_particles)),
+            lang.value,
+        )
+    )
+    f.write(_write_offsets(f, encoded_words))
+    blob = _write_offsets(f, encoded_particles)
+    f.write(struct.pack(f"<{len(particle_keys)}I", *particles.values()))
+    f.write(blob)
+    for threshold in thresholds:
+        bucket = [i for i, p in enumerate(particle_keys) if particles[p] >= threshold]
+        f.write(struct.pack(f"<II{len(bucket)}I", threshold, len(bucket), *bucket))
+    decoded_words = [w.decode("utf-8") for w in encoded_words]
+    postings = build_postings(decoded_words, particle_keys)
+    offsets = [0]
+    for posting in postings:
+        offsets.append(offsets[-1] + len(posting))
+    f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+    for posting in postings:
+        f.write(posting.tobytes())
+    alphabet = alphabet_for_lang(lang)
+    f.write(struct.pack(f"<{len(decoded_words)}I", *map(alphabet.mask, decoded_words)))
+
+
+def load_binary_dictionary(path: str) -> WordGameDict:
+    if sys.byteorder != "little":
+        raise DictionaryFormatError("Compiled dictionaries need a little-endian host")
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(buf)
+    (
+        magic,
+        version,
+        n_diffs,
+        n_words,
+        words_size,
+        n_particles,
+        particles_size,
+        lang,
+    ) = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise DictionaryFormatError(
+            f"{path} is not a version {VERSION} dictionary, recompile it"
+        )
+    pos = HEADER.size
+
+    def take_u32(n: int) -> memoryview:
+        nonlocal pos
+        section = view[pos : pos + 4 * n].cast("I")
+        pos += 4 * n
+        return section
+
+    def take_blob(size: int) -> memoryview:
+        nonlocal pos
+        section = view[pos : pos + size]
+        pos += size + (-size % 4)
+        return section
+
+    ww = WordGameDict()
+    word_offsets = take_u32(n_words + 1)
+    ww.words = MappedWords(take_blob(words_size), word_offsets)
+    particle_offsets = take_u32(n_particles + 1)
+    counts = take_u32(n_particles)
+    particles_blob = take_blob(particles_size)
+    ww.particle_keys = [
+        bytes(particles_blob[particle_offsets[i] : particle_offsets[i + 1]]).decode(
+            "utf-8"
+        )
+        for i in range(n_particles)
+    ]
+    ww.particles = dict(zip(ww.particle_keys, counts))
+    buckets: Dict[int, List[str]] = {}
+    for _ in range(n_diffs):
+        threshold, size = struct.unpack_from("<II", view, pos)
+        pos += 8
+        buckets[threshold] = [ww.particle_keys[i] for i in take_u32(size)]
+    for diff in Difficulty:
+        bucket = buckets.get(diff.value, None)
+        if bucket is None:
+            bucket = [p for p in ww.particle_keys if ww.particles[p] >= diff.value]
+        ww.by_difficulty[diff] = bucket
+    posting_offsets = take_u32(n_particles + 1)
+    postings = take_u32(posting_offsets[n_particles])
+    ww.index = ParticleIndex(
+        ww.words,
+        ww.particle_keys,
+        [
+            postings[posting_offsets[i] : posting_offsets[i + 1]]
+            for i in range(n_particles)
+        ],
+    )
+    ww.letters = WordLetters(
+        alphabet_for_lang(Language(lang)), ww.words, take_u32(n_words)
+    )
+    return ww
@@ -3,6 +3,26 @@ import pathlib
 
 _FILE_DIR = pathlib.Path(__file__).parent.resolve()
 
-DEV = os.environ.get("DEV", True)
+# Set DEV=1 for debug logging
+DEV = os.environ.get("DEV", "").lower() in ("1", "true", "yes")
 HOST = os.environ.get("HOST", "127.0.0.1")
+PORT = int(os.environ.get("PORT", 8080))
+# Worker processes, each with an internal port counting up from INTERNAL_PORT
+WORKERS = int(os.environ.get("WORKERS", 1))
+INTERNAL_PORT = int(os.environ.get("INTERNAL_PORT", 9100))
+# Broker connecting the nodes, unix:PATH or tcp:HOST:PORT, empty for a single node
+BACKPLANE = os.environ.get("BACKPLANE", "")
 LOGS_DIR = os.environ.get("LOGS_DIR", os.path.join(_FILE_DIR, "../logs"))
+# Empty to keep the article cache in memory only
+ARTICLE_CACHE_PATH = os.environ.get(
+    "ARTICLE_CACHE_PATH", os.path.join(_FILE_DIR, "../cache/articles.sqlite3")
+)
+ARTICLE_CACHE_MAX_BYTES = int(
+    os.environ.get("ARTICLE_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+)
+# Snapshots of the open rooms, restored on startup. Empty to disable them
+SNAPSHOT_PATH = os.environ.get(
+    "SNAPSHOT_PATH", os.path.join(_FILE_DIR, "../cache/rooms.snapshot")
+)
+# Wikipedia or a local stand-in for it
+WIKI_BASE_URL = os.environ.get("WIKI_BASE_URL", "https://en.wikipedia.org")
@@ -0,0 +1,100 @@
+import asyncio
+import random
+from typing import AsyncIterator, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+from server.logger import logger
+
+# Settings
+CONNECTIONS_LIMIT = 100
+CONNECTIONS_PER_HOST = 20
+REQUEST_TIMEOUT = 10.0
+RETRIES = 3
+RETRY_BACKOFF = 0.25
+
+# Statuses worth retrying, the rest are returned to the caller
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HTTPClient:
+    """HTTP client shared by the whole app.
+
+    Keeps a single pooled session, so requests to the same host reuse
+    keep-alive connections instead of paying for a new handshake each time.
+    All request paths are relative to `base_url`.
+    """
+
+    base_url: str
+    limit: int
+    limit_per_host: int
+    timeout: float
+    retries: int
+    backoff: float
+    session: Optional[aiohttp.ClientSession]
+
+    def __init__(
+        self,
+        base_url: str,
+        limit: int = CONNECTIONS_LIMIT,
+        limit_per_host: int = CONNECTIONS_PER_HOST,
+        timeout: float = REQUEST_TIMEOUT,
+        retries: int = RETRIES,
+        backoff: float = RETRY_BACKOFF,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def lifecycle(self, app: web.Application) -> AsyncIterator[None]:
+        """Ties the session to the app, to be added to `app.cleanup_ctx`."""
+        self.get_session()
+        yield
+        await self.close()
+
+    async def get_text(self, path: str) -> Tuple[str, str]:
+        """GET `path`, return the response text and the URL after redirects."""
+        url = f"{self.base_url}{path}"
+        attempt = 0
+        while True:
+            try:
+                async with self.get_session().get(url) as resp:
+                    if resp.status in RETRY_STATUSES and attempt < self.retries:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info, resp.history, status=resp.status
+                        )
+                    resp.raise_for_status()
+                    return await resp.text(), str(resp.real_url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or (
+                    e.status in RETRY_STATUSES
+                )
+                if not retryable or attempt >= self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                logger.warning(
+                    "GET %s failed (%r), retrying in %.2fs", url, e, delay
+                )
+                attempt += 1
+                await asyncio.sleep(delay)
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from typing import Callable, Dict, Optional
+
+from server.metrics import counter
+
+# Settings
+# Input updates relayed to a room per second
+RELAY_RATE = 20.0
+# Input updates a client may send per second, and in a burst
+CLIENT_INPUT_RATE = 30.0
+CLIENT_INPUT_BURST = 60
+
+inputs_coalesced = counter(
+    "ws_inputs_coalesced_total",
+    "Input updates replaced by a newer one before being relayed",
+    ("game",),
+)
+inputs_dropped = counter(
+    "ws_inputs_dropped_total",
+    "Input updates dropped by the per-client rate limit",
+    ("game",),
+)
+
+
+class TokenBucket:
+    """Lets through `rate` events per second on average, and up to `burst` at once."""
+
+    rate: float
+    burst: float
+    tokens: float
+    last: float
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def take(self, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+# Sends the input of a player to the room
+RelayInput = Callable[[str, str], None]
+
+
+class InputRelay:
+    """Coalesces the inputs of the players of a room into a rate-capped stream.
+
+    An input is relayed right away if the room hasn't had one for
+    `1 / rate` seconds, otherwise it waits for the next flush. Only the
+    latest input of each player is kept until then.
+    """
+
+    send: RelayInput
+    interval: float
+    game: str
+    # Latest input of each player, waiting for the next flush
+    pending: Dict[str, str]
+    last_flush: float
+    handle: Optional[asyncio.TimerHandle]
+
+    def __init__(self, send: RelayInput, rate: float = RELAY_RATE, game: str = "") -> None:
+        self.send = send
+        self.interval = 1 / rate
+        self.game = game
+        self.pending = {}
+        self.last_flush = float("-inf")
+        self.handle = None
+
+    def push(self, pid: str, value: str) -> None:
+        loop = asyncio.get_running_loop()
+        if pid in self.pending:
+            inputs_coalesced.inc(self.game)
+        self.pending[pid] = value
+        if self.handle is None:
+            delay = self.last_flush + self.interval - loop.time()
+            if delay <= 0:
+                self.flush()
+            else:
+                self.handle = loop.call_later(delay, self.flush)
+
+    def flush(self) -> None:
+        self.handle = None
+        self.last_flush = asyncio.get_running_loop().time()
+        pending, self.pending = self.pending, {}
+        for pid, value in pending.items():
+            self.send(pid, value)
+
+    def drop(self, pid: str) -> None:
+        """Forget the pending input of a player, e.g. when their turn ends."""
+        self.pending.pop(pid, None)
+
+    def clear(self) -> None:
+        """Forget the pending inputs of every player."""
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        self.pending = {}
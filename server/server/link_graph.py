@@ -0,0 +1,215 @@
+import random
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from server.wiki_game_common import normalize_wiki_path
+
+NodeId = int
+# Normalized path of an article and the paths it links to
+LinkRow = Tuple[str, Sequence[str]]
+
+
+class LinkGraph:
+    """Links between wiki articles, as adjacency lists in CSR form.
+
+    Nodes are normalized wiki paths. The out-links of node `i` are
+    `targets[offsets[i]:offsets[i + 1]]`. Nodes below `n_known` are articles
+    whose links are known, the rest are only linked to.
+
+    Distances are measured in this graph, which is usually a part of the
+    whole wiki, so they are upper bounds on the distances in the wiki.
+    """
+
+    paths: List[str]
+    ids: Dict[str, NodeId]
+    n_known: int
+    offsets: "array[int]"
+    targets: "array[int]"
+    # Redirects to the paths of the articles they lead to
+    aliases: Dict[str, str]
+
+    def __init__(
+        self,
+        paths: List[str],
+        n_known: int,
+        offsets: "array[int]",
+        targets: "array[int]",
+        aliases: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.paths = paths
+        self.ids = {p: i for i, p in enumerate(paths)}
+        self.n_known = n_known
+        self.offsets = offsets
+        self.targets = targets
+        self.aliases = aliases or {}
+        self._reversed: Optional[Tuple["array[int]", "array[int]"]] = None
+
+    @classmethod
+    def empty(cls) -> "LinkGraph":
+        return cls([], 0, array("I", [0]), array("I"))
+
+    @classmethod
+    def build(
+        cls, link_rows: Iterable[LinkRow], aliases: Optional[Dict[str, str]] = None
+    ) -> "LinkGraph":
+        """Build the graph from the links of each article, e.g. the article cache or a dump.
+
+        `aliases` map redirects to the paths of the articles they lead to.
+        """
+        aliases = aliases or {}
+        rows = list(link_rows)
+        paths: List[str] = []
+        ids: Dict[str, NodeId] = {}
+        for path, _ in rows:
+            if path not in ids:
+                ids[path] = len(paths)
+                paths.append(path)
+        n_known = len(paths)
+        adjacency: List[List[NodeId]] = [[] for _ in range(n_known)]
+        done: Set[NodeId] = set()
+        for path, links in rows:
+            if ids[path] in done:
+                # Duplicate row for the same article
+                continue
+            done.add(ids[path])
+            out = adjacency[ids[path]]
+            seen: Set[NodeId] = set()
+            for link in links:
+                target = normalize_wiki_path(link)
+                target = aliases.get(target, target)
+                node = ids.get(target, None)
+                if node is None:
+                    node = ids[target] = len(paths)
+                    paths.append(target)
+                if node not in seen:
+                    seen.add(node)
+                    out.append(node)
+        offsets = array("I", [0])
+        targets = array("I")
+        for out in adjacency:
+            targets.extend(out)
+            offsets.append(len(targets))
+        # Linked-only nodes have no out-links
+        offsets.extend([len(targets)] * (len(paths) - n_known))
+        return cls(paths, n_known, offsets, targets, aliases)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    def node_id(self, path: str) -> Optional[NodeId]:
+        """Node of a wiki path or URL, following redirects."""
+        key = normalize_wiki_path(path)
+        return self.ids.get(self.aliases.get(key, key), None)
+
+    def links_of(self, node: NodeId) -> "array[int]":
+        return self.targets[self.offsets[node] : self.offsets[node + 1]]
+
+    def _reversed_csr(self) -> Tuple["array[int]", "array[int]"]:
+        """In-links of every node, in the same CSR form. Built on first use."""
+        if self._reversed is None:
+            n = len(self.paths)
+            counts = [0] * (n + 1)
+            for target in self.targets:
+                counts[target + 1] += 1
+            for i in range(n):
+                counts[i + 1] += counts[i]
+            offsets = array("I", counts)
+            sources = array("I", bytes(4 * len(self.targets)))
+            fill = counts[:n]
+            for source in range(n):
+                for target in self.links_of(source):
+                    sources[fill[target]] = source
+                    fill[target] += 1
+            self._reversed = (offsets, sources)
+        return self._reversed
+
+    def distances_to(self, target: str, max_depth: int) -> Dict[str, int]:
+        """Distances to `target` from the articles at most `max_depth` links away from it."""
+        node = self.node_id(target)
+        if node is None:
+            return {}
+        offsets, sources = self._reversed_csr()
+        distances = {node: 0}
+        frontier = [node]
+        for depth in range(1, max_depth + 1):
+            if not frontier:
+                break
+            next_frontier: List[NodeId] = []
+            for n in frontier:
+                for source in sources[offsets[n] : offsets[n + 1]]:
+                    if source not in distances:
+                        distances[source] = depth
+                        next_frontier.append(source)
+            frontier = next_frontier
+        return {self.paths[n]: d for n, d in distances.items()}
+
+    def levels(
+        self, source: str, max_depth: int, links: Iterable[str] = ()
+    ) -> List[List[NodeId]]:
+        """Nodes grouped by their distance from `source`, up to `max_depth`.
+
+        `links` are extra out-links of the source, so articles fetched after
+        the graph was built can be searched from too.
+        """
+        seen = bytearray(len(self.paths))
+        start = self.node_id(source)
+        first: List[NodeId] = []
+        if start is not None:
+            seen[start] = 1
+            first.extend(self.links_of(start))
+        for link in links:
+            node = self.node_id(link)
+            if node is not None:
+                first.append(node)
+        levels: List[List[NodeId]] = [[] if start is None else [start]]
+        frontier: List[NodeId] = []
+        for node in first:
+            if not seen[node]:
+                seen[node] = 1
+                frontier.append(node)
+        while frontier and len(levels) <= max_depth:
+            levels.append(frontier)
+            next_frontier: List[NodeId] = []
+            for node in frontier:
+                for target in self.links_of(node):
+                    if not seen[target]:
+                        seen[target] = 1
+                        next_frontier.append(target)
+            frontier = next_frontier
+        return levels
+
+    def shortest_path_length(
+        self, source: str, target: str, max_depth: int, links: Iterable[str] = ()
+    ) -> Optional[int]:
+        node = self.node_id(target)
+        if node is None:
+            return None
+        for distance, level in enumerate(self.levels(source, max_depth, links)):
+            if node in level:
+                return distance
+        return None
+
+    def pick_target(
+        self,
+        source: str,
+        min_steps: int,
+        max_steps: int,
+        links: Iterable[str] = (),
+        rng: Optional[random.Random] = None,
+    ) -> Optional[Tuple[str, int]]:
+        """Random known article exactly `steps` links away from `source`.
+
+        Prefers the largest distance in `[min_steps, max_steps]` that has a
+        known article, returns its path and the distance.
+        """
+        choice = (rng or random).choice
+        levels = self.levels(source, max_steps, links)
+        for steps in range(min(max_steps, len(levels) - 1), min_steps - 1, -1):
+            known = [node for node in levels[steps] if node < self.n_known]
+            if known:
+                return self.paths[choice(known)], steps
+        return None
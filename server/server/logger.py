@@ -1,21 +1,156 @@
-import os
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, MutableMapping, Optional, Tuple
+
 from server.env import DEV, LOGS_DIR
 
 logger = logging.getLogger("server")
 
+# Settings
+# Records of each sampled event let through per second, and in a burst
+SAMPLED_EVENTS_PER_SECOND = 5.0
+SAMPLED_EVENTS_BURST = 20
+# Context fields copied from the records into the JSON output
+CONTEXT_FIELDS = ("room", "player", "event", "suppressed")
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the room and player ids of the record if any."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in CONTEXT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        # Formatted by `StructuredQueueHandler` when the record went through the queue
+        exc_text = record.exc_text
+        if record.exc_info:
+            exc_text = self.formatException(record.exc_info)
+        if exc_text:
+            entry["exc_info"] = exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """Keeps the traceback of a record apart from its message.
+
+    `QueueHandler.prepare` appends the traceback to the message, this keeps it
+    in `exc_text` so `JSONFormatter` writes it as a field of its own.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = JSONFormatter().formatException(record.exc_info)
+            # The traceback holds the frames, don't keep them alive in the queue
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Rate-limits the records of high-frequency events.
+
+    Records with an `event` attribute are let through by a token bucket per
+    event, the others always pass. The number of records dropped since the
+    last one that passed is reported in its `suppressed` attribute.
+    """
+
+    rate: float
+    burst: float
+    # Tokens, time of the last refill and dropped records of each event
+    buckets: Dict[str, Tuple[float, float, int]]
+
+    def __init__(
+        self, rate: float = SAMPLED_EVENTS_PER_SECOND, burst: float = SAMPLED_EVENTS_BURST
+    ) -> None:
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, dropped = self.buckets.get(event, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.buckets[event] = (tokens, now, dropped + 1)
+                return False
+            self.buckets[event] = (tokens - 1, now, 0)
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+class ContextLogger(logging.LoggerAdapter):  # type: ignore[type-arg]
+    """Adds context, e.g. the room id, to the records, merged with the `extra` of each call."""
+
+    def process(
+        self, msg: Any, kwargs: MutableMapping[str, Any]
+    ) -> Tuple[Any, MutableMapping[str, Any]]:
+        kwargs["extra"] = {**(self.extra or {}), **kwargs.get("extra", {})}
+        return msg, kwargs
+
+
+def room_logger(room_id: str) -> ContextLogger:
+    return ContextLogger(logger, {"room": room_id})
+
 
 def configure_loggers() -> None:
-    f_format = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    """Log to a file from a background thread, so writes don't block the event loop."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
     if DEV:
-        logger.setLevel(logging.DEBUG)
-        f_handler = logging.FileHandler(os.path.join(LOGS_DIR, "server.dev.log"))
-        f_handler.setLevel(logging.DEBUG)
-        f_handler.setFormatter(f_format)
-        logger.addHandler(f_handler)
+        level = logging.DEBUG
+        path = os.path.join(LOGS_DIR, "server.dev.log")
     else:
-        logger.setLevel(logging.INFO)
-        f_handler = logging.FileHandler(os.path.join(LOGS_DIR, "server.prod.log"))
-        f_handler.setLevel(logging.INFO)
-        f_handler.setFormatter(f_format)
-        logger.addHandler(f_handler)
+        level = logging.INFO
+        path = os.path.join(LOGS_DIR, "server.prod.log")
+    logger.setLevel(level)
+    f_handler = logging.FileHandler(path)
+    f_handler.setLevel(level)
+    f_handler.setFormatter(JSONFormatter())
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _queue_handler = StructuredQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter())
+    logger.addHandler(_queue_handler)
+    _listener = QueueListener(log_queue, f_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_loggers)
+
+
+def stop_loggers() -> None:
+    """Write out the queued records and stop the logging thread."""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logger.removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,293 @@
+"""Server metrics, served at /metrics in the Prometheus text exposition format."""
+import asyncio
+import time
+from bisect import bisect_left
+from enum import IntEnum
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from aiohttp import hdrs, web
+
+from server.routes import routes
+
+# Settings
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5
+)
+# Seconds between the event loop lag probes
+LOOP_LAG_INTERVAL = 0.5
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+# Name suffix, label values and value of a sample
+Sample = Tuple[str, LabelValues, float]
+# Label values and value of each sample of a collected metric
+Collector = Callable[[], Iterable[Tuple[LabelValues, float]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    name: str
+    help: str
+    type: str
+    labelnames: Tuple[str, ...]
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, values, value in self.samples():
+            names = self.labelnames + (("le",) if suffix == "_bucket" else ())
+            labels = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+            lines.append(
+                f"{self.name}{suffix}{{{labels}}} {_format_value(value)}"
+                if labels
+                else f"{self.name}{suffix} {_format_value(value)}"
+            )
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+    values: Dict[LabelValues, float]
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self.values = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self.values.items():
+            yield "", labels, value
+
+
+class Gauge(Metric):
+    """A value that is set, or collected by a function at scrape time."""
+
+    type = "gauge"
+    values: Dict[LabelValues, float]
+    collector: Optional[Collector]
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        collector: Optional[Collector] = None,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.values = {}
+        self.collector = collector
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+    def samples(self) -> Iterable[Sample]:
+        values = self.values if self.collector is None else self.collector()
+        for labels, value in dict(values).items():
+            yield "", labels, value
+
+
+class CollectedCounter(Gauge):
+    """A counter kept elsewhere, e.g. in an object's stats, read at scrape time."""
+
+    type = "counter"
+
+
+class Histogram(Metric):
+    type = "histogram"
+    buckets: Tuple[float, ...]
+    # Observations in each bucket (not cumulative), their sum and count
+    counts: Dict[LabelValues, List[int]]
+    sums: Dict[LabelValues, float]
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.counts = {}
+        self.sums = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self.counts.get(labels, None)
+        if counts is None:
+            counts = self.counts[labels] = [0] * len(self.buckets)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def time(self, *labels: str) -> "Timer":
+        return Timer(self, labels)
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, counts in self.counts.items():
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                yield "_bucket", labels + (_format_value(bound),), total
+            yield "_sum", labels, self.sums[labels]
+            yield "_count", labels, total
+
+
+class Timer:
+    """Context manager observing the time spent in it."""
+
+    histogram: Histogram
+    labels: LabelValues
+    start: float
+
+    def __init__(self, histogram: Histogram, labels: LabelValues) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Registry:
+    metrics: List[Metric]
+
+    def __init__(self) -> None:
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    metric = Counter(name, help, labelnames)
+    registry.register(metric)
+    return metric
+
+
+def gauge(
+    name: str,
+    help: str,
+    labelnames: Sequence[str] = (),
+    collector: Optional[Collector] = None,
+) -> Gauge:
+    metric = Gauge(name, help, labelnames, collector)
+    registry.register(metric)
+    return metric
+
+
+def collected_counter(
+    name: str, help: str, labelnames: Sequence[str], collector: Collector
+) -> CollectedCounter:
+    metric = CollectedCounter(name, help, labelnames, collector)
+    registry.register(metric)
+    return metric
+
+
+def histogram(
+    name: str,
+    help: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = LATENCY_BUCKETS,
+) -> Histogram:
+    metric = Histogram(name, help, labelnames, buckets)
+    registry.register(metric)
+    return metric
+
+
+def message_name(messages: Optional[Type[IntEnum]], value: object) -> str:
+    """Name of a message type for the labels, e.g. "Joining".
+
+    Types that aren't in `messages` are all "unknown", so that clients can't
+    add labels.
+    """
+    if messages is None:
+        return str(value)
+    if isinstance(value, int):
+        try:
+            return messages(value).name
+        except ValueError:
+            pass
+    return "unknown"
+
+
+messages_received = counter(
+    "ws_messages_received_total", "Messages received from clients", ("game", "type")
+)
+messages_sent = counter(
+    "ws_messages_sent_total", "Messages queued for clients", ("game", "type")
+)
+handler_seconds = histogram(
+    "ws_handler_seconds", "Time spent handling client messages", ("game", "type")
+)
+broadcast_seconds = histogram(
+    "ws_broadcast_seconds", "Time spent fanning a message out to a room", ("game",)
+)
+evictions = counter("ws_evictions_total", "Clients disconnected for being too slow")
+loop_lag_seconds = histogram(
+    "event_loop_lag_seconds", "How late the event loop runs a scheduled callback"
+)
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag_seconds.observe(max(0.0, loop.time() - expected))
+
+
+async def metrics_context(app: web.Application) -> AsyncIterator[None]:
+    task = asyncio.create_task(monitor_loop_lag())
+    yield
+    task.cancel()
+
+
+@routes.get("/metrics")
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        body=registry.render().encode("utf-8"),
+        headers={hdrs.CONTENT_TYPE: CONTENT_TYPE},
+    )
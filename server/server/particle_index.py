@@ -0,0 +1,151 @@
+import random
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Union
+
+# How many random particles to try before falling back to a full scan
+PICK_ATTEMPTS = 16
+# How many random words to try before scanning a posting list for a hint
+HINT_ATTEMPTS = 16
+
+WordId = int
+ParticleId = int
+# Sorted word ids, either an array or a memory-mapped section of a compiled dictionary
+Postings = Union["array[int]", memoryview]
+
+
+def build_postings(
+    words: Sequence[str], particle_keys: Sequence[str]
+) -> List["array[int]"]:
+    """For every particle, collect the sorted ids of the words containing it."""
+    particle_ids = {p: i for i, p in enumerate(particle_keys)}
+    lengths = sorted({len(p) for p in particle_keys})
+    postings = [array("I") for _ in particle_keys]
+    for word_id, word in enumerate(words):
+        found: Set[ParticleId] = set()
+        for length in lengths:
+            for i in range(len(word) - length + 1):
+                pid = particle_ids.get(word[i : i + length], None)
+                if pid is not None:
+                    found.add(pid)
+        for pid in found:
+            postings[pid].append(word_id)
+    return postings
+
+
+class ParticleUsage:
+    """Per game count of the used words containing each particle."""
+
+    used: Dict[ParticleId, int]
+
+    def __init__(self) -> None:
+        self.used = {}
+
+
+class ParticleIndex:
+    """Inverted index from particles to the ids of the words containing them.
+
+    Word ids are positions in `words`, which has to be sorted the same way the
+    postings were built.
+    """
+
+    words: Sequence[str]
+    particle_keys: Sequence[str]
+    particle_ids: Dict[str, ParticleId]
+    postings: Sequence[Postings]
+    # Distinct particle lengths
+    lengths: List[int]
+    # Particles sorted by the number of words containing them, most common first
+    ranked: List[str]
+    # Negated sizes of the `ranked` posting lists, ascending for bisect
+    ranked_sizes: List[int]
+
+    def __init__(
+        self,
+        words: Sequence[str],
+        particle_keys: Sequence[str],
+        postings: Sequence[Postings],
+    ) -> None:
+        self.words = words
+        self.particle_keys = particle_keys
+        self.particle_ids = {p: i for i, p in enumerate(particle_keys)}
+        self.postings = postings
+        self.lengths = sorted({len(p) for p in particle_keys})
+        self.ranked = sorted(
+            particle_keys, key=lambda p: len(postings[self.particle_ids[p]]), reverse=True
+        )
+        self.ranked_sizes = [-len(postings[self.particle_ids[p]]) for p in self.ranked]
+
+    @classmethod
+    def build(cls, words: Iterable[str], particle_keys: Sequence[str]) -> "ParticleIndex":
+        sorted_words = sorted(words)
+        return cls(sorted_words, particle_keys, build_postings(sorted_words, particle_keys))
+
+    def particles_in(self, word: str) -> Set[ParticleId]:
+        found = set()
+        for length in self.lengths:
+            for i in range(len(word) - length + 1):
+                pid = self.particle_ids.get(word[i : i + length], None)
+                if pid is not None:
+                    found.add(pid)
+        return found
+
+    def word_count(self, particle: str) -> int:
+        """Number of dictionary words containing the particle."""
+        pid = self.particle_ids.get(particle, None)
+        return 0 if pid is None else len(self.postings[pid])
+
+    def unused_count(self, particle: str, usage: ParticleUsage) -> int:
+        """Number of words containing the particle that weren't used in the game yet."""
+        pid = self.particle_ids.get(particle, None)
+        if pid is None:
+            return 0
+        return len(self.postings[pid]) - usage.used.get(pid, 0)
+
+    def mark_used(self, usage: ParticleUsage, word: str) -> None:
+        for pid in self.particles_in(word):
+            usage.used[pid] = usage.used.get(pid, 0) + 1
+
+    def pick(
+        self,
+        usage: ParticleUsage,
+        min_words: int,
+        rng: Optional[random.Random] = None,
+    ) -> Optional[str]:
+        """Random particle with at least `min_words` unused words containing it."""
+        randrange = (rng or random).randrange
+        candidates = bisect_right(self.ranked_sizes, -min_words)
+        if candidates == 0:
+            return None
+        for _ in range(PICK_ATTEMPTS):
+            particle = self.ranked[randrange(candidates)]
+            if self.unused_count(particle, usage) >= min_words:
+                return particle
+        for particle in self.ranked[:candidates]:
+            if self.unused_count(particle, usage) >= min_words:
+                return particle
+        return None
+
+    def hint(
+        self,
+        particle: str,
+        used_words: Set[str],
+        rng: Optional[random.Random] = None,
+    ) -> Optional[str]:
+        """Random unused word containing the particle."""
+        randrange = (rng or random).randrange
+        pid = self.particle_ids.get(particle, None)
+        if pid is None:
+            return None
+        postings = self.postings[pid]
+        if len(postings) == 0:
+            return None
+        for _ in range(HINT_ATTEMPTS):
+            word = self.words[postings[randrange(len(postings))]]
+            if word not in used_words:
+                return word
+        for word_id in postings:
+            word = self.words[word_id]
+            if word not in used_words:
+                return word
+        return None
@@ -0,0 +1,88 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence
+
+from server.logger import logger
+from server.wiki_game_common import normalize_wiki_path
+
+# Settings
+# How many links of an article to prefetch
+PREFETCH_LINKS = 4
+# Weights of the ranking signals, each signal is between 0 and 1
+POSITION_WEIGHT = 1.0
+POPULARITY_WEIGHT = 2.0
+CLOSENESS_WEIGHT = 3.0
+
+Loader = Callable[[str], Awaitable[Any]]
+
+
+def rank_links(
+    links: Sequence[str],
+    popularity: Mapping[str, int],
+    distances: Mapping[str, int],
+    limit: int = PREFETCH_LINKS,
+) -> List[str]:
+    """The `limit` links a player is most likely to follow.
+
+    Links are ranked by their position in the article, how many times other
+    players have opened them and how close they are to the target. Keys of
+    `popularity` and `distances` are normalized wiki paths.
+    """
+    most_popular = max(popularity.values(), default=0) or 1
+    scores: Dict[str, float] = {}
+    for position, link in enumerate(links):
+        path = normalize_wiki_path(link)
+        if path in scores:
+            continue
+        score = POSITION_WEIGHT / (1 + position)
+        score += POPULARITY_WEIGHT * popularity.get(path, 0) / most_popular
+        distance = distances.get(path, None)
+        if distance is not None:
+            score += CLOSENESS_WEIGHT / (1 + distance)
+        scores[path] = score
+    return sorted(scores, key=scores.__getitem__, reverse=True)[:limit]
+
+
+class Prefetcher:
+    """Loads the articles players are likely to open next, in the background.
+
+    Each key (e.g. a player) has at most one batch of prefetches running,
+    starting a new one cancels the previous. `budget` limits how many
+    articles are fetched at once and can be shared between prefetchers.
+    """
+
+    load: Loader
+    budget: asyncio.Semaphore
+    # Running prefetches of each key, by normalized path
+    tasks: Dict[Any, Dict[str, "asyncio.Task[None]"]]
+
+    def __init__(self, load: Loader, budget: asyncio.Semaphore) -> None:
+        self.load = load
+        self.budget = budget
+        self.tasks = {}
+
+    def prefetch(self, key: Any, paths: Sequence[str]) -> None:
+        self.cancel(key)
+        self.tasks[key] = {
+            normalize_wiki_path(path): asyncio.create_task(self._prefetch(path))
+            for path in paths
+        }
+
+    def cancel(self, key: Any, keep: Optional[str] = None) -> None:
+        """Cancel the prefetches of `key`, except the one of the `keep` path."""
+        keep = normalize_wiki_path(keep) if keep is not None else None
+        for path, task in self.tasks.pop(key, {}).items():
+            if path != keep:
+                task.cancel()
+
+    def close(self) -> None:
+        for key in list(self.tasks):
+            self.cancel(key)
+
+    async def _prefetch(self, path: str) -> None:
+        async with self.budget:
+            try:
+                await self.load(path)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug("Failed to prefetch {}: {}".format(path, e))
@@ -0,0 +1,139 @@
+"""Snapshots of the open rooms, taken periodically and on shutdown and restored on startup.
+
+Clients resume their session in a restored room by connecting with the token
+they got on joining, e.g. `/words/{room_id}/?resume={token}`.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, List, Optional
+
+from aiohttp import web
+
+from server.env import SNAPSHOT_PATH
+from server.logger import logger
+from server.metrics import histogram
+from server.rooms import managers
+from server.snapshot import SnapshotFormatError, read_snapshot, write_snapshot
+from server.workers import cluster
+
+# Settings
+# Seconds between the snapshots
+SNAPSHOT_INTERVAL = 5.0
+# Seconds the players of a restored room have to resume their session
+RESUME_TIMEOUT = 30.0
+# Snapshots older than this are stale and aren't restored
+MAX_SNAPSHOT_AGE = 10 * 60
+
+room_snapshot_seconds = histogram(
+    "room_snapshot_seconds", "Time spent writing the snapshot of a single room"
+)
+
+
+class RoomSnapshots:
+    # Empty if the snapshots are disabled
+    path: str
+    interval: float
+    task: Optional["asyncio.Task[None]"]
+    stopped: asyncio.Event
+
+    def __init__(self, path: str, interval: float = SNAPSHOT_INTERVAL) -> None:
+        self.path = path
+        self.interval = interval
+        self.task = None
+        self.stopped = asyncio.Event()
+
+    def file_path(self) -> str:
+        # Each worker owns different rooms
+        if cluster.size > 1:
+            return f"{self.path}.{cluster.index}"
+        return self.path
+
+    async def save(self) -> int:
+        """Write the snapshot of every room, return how many there were."""
+        records: List[bytes] = []
+        for manager in list(managers.values()):
+            for room_id in list(manager.rooms):
+                if room_id not in manager.rooms:
+                    continue
+                try:
+                    with room_snapshot_seconds.time():
+                        records.append(manager.snapshot(room_id))
+                except Exception:
+                    logger.exception("Can't take the snapshot of room %s", room_id)
+                # One room at a time, so the other rooms aren't held up
+                await asyncio.sleep(0)
+        path = self.file_path()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        await asyncio.get_running_loop().run_in_executor(
+            None, write_snapshot, path, records
+        )
+        return len(records)
+
+    async def restore(self) -> int:
+        """Open the rooms of the last snapshot again, return how many there were."""
+        path = self.file_path()
+        if not os.path.isfile(path):
+            return 0
+        try:
+            taken, records = read_snapshot(path)
+        except (OSError, SnapshotFormatError) as e:
+            logger.warning("Can't read the snapshot of the rooms: %s", e)
+            return 0
+        if time.time() - taken > MAX_SNAPSHOT_AGE:
+            logger.info("Not restoring the rooms, the snapshot is stale")
+            return 0
+        restored = 0
+        for game, room_id, options, state in records:
+            manager = managers.get(game, None)
+            if manager is None or room_id in manager.rooms:
+                continue
+            try:
+                if await manager.restore(
+                    room_id, json.loads(options), state, RESUME_TIMEOUT
+                ):
+                    restored += 1
+            except Exception:
+                logger.exception("Can't restore room %s", room_id)
+        logger.info("Restored %s rooms", restored)
+        return restored
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.stopped.wait(), self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.save()
+            except Exception:
+                logger.exception("Can't write the snapshot of the rooms")
+
+    async def lifecycle(self, app: web.Application) -> AsyncIterator[None]:
+        """Restores the rooms on startup and keeps taking snapshots, for `app.cleanup_ctx`."""
+        if self.path:
+            await self.restore()
+            self.stopped.clear()
+            self.task = asyncio.create_task(self.run())
+        yield
+        await self.stop()
+
+    async def stop(self) -> None:
+        """Stop taking snapshots, once the one being written is done."""
+        self.stopped.set()
+        if self.task is not None:
+            await self.task
+            self.task = None
+
+    async def on_shutdown(self, app: web.Application) -> None:
+        """Take the last snapshot before the connections are closed, for `app.on_shutdown`."""
+        if not self.path:
+            return
+        await self.stop()
+        saved = await self.save()
+        logger.info("Saved the snapshot of %s rooms", saved)
+
+
+snapshots = RoomSnapshots(SNAPSHOT_PATH)
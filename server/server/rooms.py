@@ -0,0 +1,494 @@
+import asyncio
+import functools
+import json
+import uuid
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from aiohttp import web
+from aiohttp.http_websocket import WSCloseCode
+from aiohttp.web_request import Request
+from aiohttp.web_response import Response
+from aiohttp.web_ws import WebSocketResponse
+
+from server.backplane import CLAIM_TIMEOUT, Backplane, BackplaneError, Handler
+from server.backplane import backplane as default_backplane
+from server.logger import logger
+from server.metrics import gauge
+from server.snapshot import SnapshotReader, SnapshotWriter, encode_record
+from server.workers import (
+    cluster,
+    gather_json,
+    is_forwarded,
+    proxy_request,
+    proxy_websocket,
+)
+from server.ws_game import ClientId, ClientInfo, Message, RemoteClient, WSGame
+
+RoomId = str
+Room = TypeVar("Room", bound=WSGame)
+RoomOptions = Dict[str, Any]
+RoomFactory = Callable[[RoomId, RoomOptions], Room]
+
+# Settings
+DEFAULT_ROOM_ID = "default"
+MAX_ROOMS = 1000
+# Seconds a room created through the lobby API waits for its first client
+EMPTY_ROOM_TIMEOUT = 60.0
+
+
+class RoomsLimitReached(Exception):
+    pass
+
+
+# Room managers by the name of their game, for the metrics
+managers: Dict[str, "RoomManager[Any]"] = {}
+
+
+def _collect_rooms() -> List[Tuple[Tuple[str], float]]:
+    return [((game,), len(m.rooms)) for game, m in managers.items()]
+
+
+def _collect_clients() -> List[Tuple[Tuple[str], float]]:
+    return [
+        ((game,), sum(len(room.clients) for room in m.rooms.values()))
+        for game, m in managers.items()
+    ]
+
+
+def inbound(channel: str) -> str:
+    """Channel of the messages sent to a room by the other nodes."""
+    return f"{channel}/in"
+
+
+gauge("rooms_active", "Open rooms", ("game",), _collect_rooms)
+gauge("ws_clients", "Connected clients", ("game",), _collect_clients)
+
+
+class RemoteRoom(WSGame):
+    """The clients of this node in a room owned by another node.
+
+    Their messages are published to the owner, the messages of the room are
+    relayed to them.
+    """
+
+    backplane: Backplane
+    # Resume requests waiting for the answer of the owner, by request id
+    pending: Dict[str, "asyncio.Future[Optional[ClientId]]"]
+
+    def __init__(
+        self, room_id: RoomId, game: str, backplane: Backplane, channel: str
+    ) -> None:
+        super().__init__(room_id)
+        self.game = game
+        self.backplane = backplane
+        self.channel = channel
+        self.pending = {}
+
+    def forward(self, envelope: Message) -> None:
+        self.backplane.publish(inbound(self.channel), envelope)
+
+    async def resume_player(self, token: Optional[str]) -> Optional[ClientId]:
+        """Ask the owner whose token it is. The owner checks it again on join."""
+        if not token:
+            return None
+        request_id = uuid.uuid4().hex
+        future: "asyncio.Future[Optional[ClientId]]"
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.forward({"op": "resume", "token": token, "reply": request_id})
+        try:
+            pid = await asyncio.wait_for(future, CLAIM_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.pending.pop(request_id, None)
+        if pid is not None:
+            # Sent along with the join
+            self.tokens[pid] = token
+        return pid
+
+    async def handle_msg(self, si: ClientInfo, _type: Any, msg: Message) -> None:
+        self.forward({"op": "msg", "client": si.id, "msg": msg})
+
+    async def add_client(self, si: ClientInfo) -> None:
+        self.clients[si.id] = si
+        self.forward(
+            {
+                "op": "join",
+                "client": si.id,
+                "spectator": si.spectator,
+                "token": self.tokens.get(si.id, None),
+            }
+        )
+
+    async def remove_client(self, si: ClientInfo) -> None:
+        await super().remove_client(si)
+        self.forward({"op": "leave", "client": si.id})
+
+    def on_message(self, envelope: Message) -> None:
+        """Relay a message published by the owner of the room."""
+        if "reply" in envelope:
+            future = self.pending.get(envelope["reply"], None)
+            if future is not None and not future.done():
+                future.set_result(envelope["player"])
+            return
+        to = envelope.get("to", None)
+        if envelope.get("close", False):
+            if to is None:
+                asyncio.create_task(self.close())
+            elif to in self.clients:
+                reason = envelope.get("reason", "Already connected")
+                asyncio.create_task(self.clients[to].close(reason.encode()))
+            return
+        msg = envelope["msg"]
+        if to is None:
+            self.broadcast(msg, exclude=envelope.get("exclude", None))
+            return
+        client = self.clients.get(to, None)
+        if client is not None:
+            client.push(client.codec.encode(msg))
+
+
+class RoomManager(Generic[Room]):
+    """Registry of the rooms (lobbies) of a single game.
+
+    With several nodes, a room is owned by the node that claims it first on
+    the backplane, see `locate`.
+    """
+
+    rooms: Dict[RoomId, Room]
+    # Options each room was created with
+    options: Dict[RoomId, RoomOptions]
+    factory: RoomFactory[Room]
+    max_rooms: int
+    # Name of the game, the prefix of its channels on the backplane
+    name: str
+    backplane: Backplane
+    # Handlers of the messages sent by the other nodes to the rooms of this one
+    inbound: Dict[RoomId, Handler]
+    # Clients of this node in the rooms owned by other nodes
+    remote_rooms: Dict[RoomId, RemoteRoom]
+
+    def __init__(
+        self,
+        factory: RoomFactory[Room],
+        max_rooms: int = MAX_ROOMS,
+        backplane: Optional[Backplane] = None,
+    ) -> None:
+        self.rooms = {}
+        self.options = {}
+        self.factory = factory
+        self.max_rooms = max_rooms
+        self.name = ""
+        self.backplane = backplane or default_backplane
+        self.inbound = {}
+        self.remote_rooms = {}
+        self.backplane.on_claim_lost(self.on_claim_lost)
+
+    def channel(self, room_id: RoomId) -> str:
+        return f"{self.name}/{room_id}"
+
+    def create(
+        self, room_id: Optional[RoomId] = None, options: Optional[RoomOptions] = None
+    ) -> Room:
+        if len(self.rooms) >= self.max_rooms:
+            raise RoomsLimitReached(f"Can't have more than {self.max_rooms} rooms")
+        if room_id is None:
+            # An id of a room this worker owns, see `server.workers`
+            room_id = uuid.uuid4().hex[:8]
+            while room_id in self.rooms or not cluster.owns(room_id):
+                room_id = uuid.uuid4().hex[:8]
+        elif room_id in self.rooms:
+            raise ValueError(f"Room {room_id} already exists")
+        options = options or {}
+        room = self.factory(room_id, options)
+        room.backplane = self.backplane
+        room.channel = self.channel(room_id)
+        self.rooms[room_id] = room
+        self.options[room_id] = options
+        logger.info("Created room id={}".format(room_id))
+        return room
+
+    def get(self, room_id: RoomId) -> Optional[Room]:
+        return self.rooms.get(room_id, None)
+
+    def join(self, room_id: RoomId) -> Room:
+        """Get the room, creating it with the default options if it doesn't exist."""
+        room = self.get(room_id)
+        if room is None:
+            room = self.create(room_id)
+        return room
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [room.describe() for room in self.rooms.values()]
+
+    async def close(self, room_id: RoomId) -> bool:
+        room = self.rooms.pop(room_id, None)
+        if room is None:
+            return False
+        self.options.pop(room_id, None)
+        await room.close()
+        await self.release(room_id)
+        logger.info("Closed room id={}".format(room_id))
+        return True
+
+    async def close_if_empty(self, room_id: RoomId) -> None:
+        """Close a room nobody is connected to. The default room is kept alive."""
+        room = self.get(room_id)
+        if room is not None and room_id != DEFAULT_ROOM_ID and room.is_empty():
+            await self.close(room_id)
+
+    def snapshot(self, room_id: RoomId) -> bytes:
+        """Record of the room in a snapshot, see `server.snapshot`."""
+        w = SnapshotWriter()
+        self.rooms[room_id].snapshot(w)
+        options = json.dumps(self.options.get(room_id, {}))
+        return encode_record((self.name, room_id, options, bytes(w.buf)))
+
+    async def restore(
+        self, room_id: RoomId, options: RoomOptions, state: bytes, resume_timeout: float
+    ) -> bool:
+        """Open a room again from its snapshot. Returns False if another node owns it.
+
+        The players who haven't resumed their session after `resume_timeout`
+        seconds are removed.
+        """
+        if await self.claim(room_id) is not None:
+            return False
+        room = self.create(room_id, options)
+        try:
+            await room.restore(SnapshotReader(state))
+        except Exception:
+            await self.close(room_id)
+            raise
+        asyncio.create_task(self.expire_absent(room_id, room, resume_timeout))
+        return True
+
+    async def expire_if_empty(
+        self, room_id: RoomId, room: Room, timeout: float
+    ) -> None:
+        """Close the room if nobody is connected to it after `timeout` seconds."""
+        await asyncio.sleep(timeout)
+        if self.rooms.get(room_id, None) is room:
+            await self.close_if_empty(room_id)
+
+    async def expire_absent(self, room_id: RoomId, room: Room, timeout: float) -> None:
+        await asyncio.sleep(timeout)
+        if self.rooms.get(room_id, None) is room:
+            await room.drop_absent()
+            await self.close_if_empty(room_id)
+
+    async def claim(self, room_id: RoomId) -> Optional[str]:
+        """Claim the room for this node, return its owner if it's another node."""
+        if room_id not in self.inbound:
+            # Before claiming, so nothing sent to the room once it's ours is missed
+            handler = functools.partial(self.on_inbound, room_id)
+            self.inbound[room_id] = handler
+            self.backplane.subscribe(inbound(self.channel(room_id)), handler)
+        try:
+            owner = await self.backplane.claim(self.channel(room_id))
+        except BackplaneError:
+            self.stop_inbound(room_id)
+            raise
+        if owner == self.backplane.node:
+            return None
+        self.stop_inbound(room_id)
+        return owner
+
+    async def locate(self, room_id: RoomId) -> Optional[str]:
+        """Node owning the room if it's another one. Claims the room if nobody owns it."""
+        if room_id in self.rooms:
+            return None
+        return await self.claim(room_id)
+
+    async def release(self, room_id: RoomId) -> None:
+        """Give up the claim on a room this node doesn't hold anymore."""
+        self.stop_inbound(room_id)
+        await self.backplane.release(self.channel(room_id))
+
+    async def lookup(self, room_id: RoomId) -> Optional[str]:
+        """Node owning the room if it's another one, without claiming it.
+
+        Raises `KeyError` if nobody owns the room.
+        """
+        if room_id in self.rooms:
+            return None
+        owner = await self.backplane.lookup(self.channel(room_id))
+        if owner is None or owner == self.backplane.node:
+            raise KeyError(room_id)
+        return owner
+
+    def on_claim_lost(self, channel: str) -> None:
+        """Close a room another node owns now, its clients reconnect to that node."""
+        prefix = f"{self.name}/"
+        if channel.startswith(prefix) and channel[len(prefix) :] in self.rooms:
+            asyncio.create_task(self.close(channel[len(prefix) :]))
+
+    def stop_inbound(self, room_id: RoomId) -> None:
+        handler = self.inbound.pop(room_id, None)
+        if handler is not None:
+            self.backplane.unsubscribe(inbound(self.channel(room_id)), handler)
+
+    def on_inbound(self, room_id: RoomId, envelope: Message) -> None:
+        """Handle a message sent to a room of this node by another node."""
+        room = self.get(room_id)
+        if room is None:
+            return
+        op = envelope["op"]
+        if op == "close":
+            asyncio.create_task(self.close(room_id))
+            return
+        if op == "resume":
+            pid = room.find_absent(envelope["token"])
+            room.publish({"reply": envelope["reply"], "player": pid})
+            return
+        if op == "join":
+            joined = RemoteClient(envelope["client"], room, envelope["spectator"])
+            token = envelope.get("token", None)
+            resumed = token is not None
+            if resumed and room.resume(token) != joined.id:
+                # Somebody else has resumed the session meanwhile
+                room.publish({"close": True, "to": joined.id})
+                return
+            room.remote_clients[joined.id] = joined
+            asyncio.create_task(self.serve_remote(room_id, room, joined, resumed))
+            return
+        client = room.remote_clients.get(envelope["client"], None)
+        if client is None:
+            return
+        if op == "msg":
+            client.inbox.put_nowait(envelope["msg"])
+        elif op == "leave":
+            client.inbox.put_nowait(None)
+
+    async def serve_remote(
+        self, room_id: RoomId, room: Room, client: RemoteClient, resumed: bool
+    ) -> None:
+        try:
+            await room.serve_remote(client, resumed)
+        finally:
+            await self.close_if_empty(room_id)
+
+    def remote_room(self, room_id: RoomId) -> RemoteRoom:
+        """Relay of the room owned by another node, for the clients of this node."""
+        room = self.remote_rooms.get(room_id, None)
+        if room is None:
+            channel = self.channel(room_id)
+            room = RemoteRoom(room_id, self.name, self.backplane, channel)
+            self.remote_rooms[room_id] = room
+            self.backplane.subscribe(channel, room.on_message)
+        return room
+
+    def drop_remote_room_if_empty(self, room_id: RoomId) -> None:
+        room = self.remote_rooms.get(room_id, None)
+        if room is not None and room.is_empty():
+            del self.remote_rooms[room_id]
+            self.backplane.unsubscribe(room.channel, room.on_message)
+
+
+def add_room_routes(
+    routes: web.RouteTableDef, prefix: str, manager: "RoomManager[Any]"
+) -> None:
+    """Register the lobby HTTP API and the WebSocket routes of a game under `prefix`."""
+    managers[prefix.strip("/")] = manager
+    manager.name = prefix.strip("/")
+
+    async def handle_room_req(
+        request: Request, room_id: RoomId, spectator: bool = False
+    ) -> WebSocketResponse:
+        # Plain HTTP requests don't get to create or claim anything
+        if not web.WebSocketResponse().can_prepare(request):
+            raise web.HTTPBadRequest(reason="Expected a WebSocket request")
+        if not cluster.owns(room_id) and not is_forwarded(request):
+            return await proxy_websocket(request, cluster.owner(room_id))
+        try:
+            # Spectators watch the existing rooms, only players open new ones
+            if spectator:
+                owner = await manager.lookup(room_id)
+            else:
+                owner = await manager.locate(room_id)
+        except KeyError:
+            raise web.HTTPNotFound()
+        except BackplaneError as e:
+            raise web.HTTPServiceUnavailable(reason=str(e))
+        if owner is not None:
+            remote = manager.remote_room(room_id)
+            try:
+                return await remote.handle_req(request, spectator)
+            finally:
+                manager.drop_remote_room_if_empty(room_id)
+        try:
+            room: WSGame = manager.join(room_id)
+        except RoomsLimitReached as e:
+            # Claimed by `locate`
+            await manager.release(room_id)
+            raise web.HTTPServiceUnavailable(reason=str(e))
+        try:
+            return await room.handle_req(request, spectator)
+        finally:
+            await manager.close_if_empty(room_id)
+
+    @routes.get(f"{prefix}/rooms/")
+    async def list_rooms(request: Request) -> Response:
+        rooms = manager.list()
+        if cluster.size > 1 and not is_forwarded(request):
+            for other in await gather_json(request.path):
+                rooms.extend(other)  # type: ignore
+        return web.json_response(rooms)
+
+    @routes.post(f"{prefix}/rooms/")
+    async def create_room(request: Request) -> Response:
+        try:
+            options = await request.json() if request.can_read_body else {}
+            if not isinstance(options, dict):
+                raise ValueError("Room options must be an object")
+            room = manager.create(options=options)
+        except RoomsLimitReached as e:
+            raise web.HTTPServiceUnavailable(reason=str(e))
+        except (ValueError, TypeError, json.JSONDecodeError) as e:
+            raise web.HTTPBadRequest(reason=str(e))
+        try:
+            owner = await manager.claim(room.room_id)
+        except BackplaneError as e:
+            await manager.close(room.room_id)
+            raise web.HTTPServiceUnavailable(reason=str(e))
+        if owner is not None:
+            # The id is taken on another node
+            await manager.close(room.room_id)
+            raise web.HTTPConflict(reason="Room id collision, try again")
+        asyncio.create_task(
+            manager.expire_if_empty(room.room_id, room, EMPTY_ROOM_TIMEOUT)
+        )
+        return web.json_response(room.describe(), status=201)
+
+    @routes.delete(f"{prefix}/rooms/{{room_id}}/")
+    async def close_room(request: Request) -> Response:
+        room_id = request.match_info["room_id"]
+        if not cluster.owns(room_id) and not is_forwarded(request):
+            return await proxy_request(request, cluster.owner(room_id))
+        if await manager.close(room_id):
+            return web.Response(status=204)
+        try:
+            owner = await manager.backplane.lookup(manager.channel(room_id))
+        except BackplaneError as e:
+            raise web.HTTPServiceUnavailable(reason=str(e))
+        if owner is None or owner == manager.backplane.node:
+            raise web.HTTPNotFound()
+        manager.backplane.publish(
+            inbound(manager.channel(room_id)), {"op": "close"}
+        )
+        return web.Response(status=204)
+
+    @routes.get(f"{prefix}/")
+    async def default_room(request: Request) -> WebSocketResponse:
+        return await handle_room_req(request, DEFAULT_ROOM_ID)
+
+    @routes.get(f"{prefix}/{{room_id}}/")
+    async def room(request: Request) -> WebSocketResponse:
+        return await handle_room_req(request, request.match_info["room_id"])
+
+    @routes.get(f"{prefix}/{{room_id}}/spectate/")
+    async def spectate(request: Request) -> WebSocketResponse:
+        return await handle_room_req(
+            request, request.match_info["room_id"], spectator=True
+        )
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, List, Optional, TypeVar
+
+from server.logger import logger
+
+# Settings
+# How many rounds to keep ready
+ROUND_POOL_SIZE = 4
+# How many rounds are prepared at once
+ROUND_POOL_WORKERS = 2
+# Seconds to wait after a failed preparation, doubled up to the maximum
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+# Seconds to wait for a round before giving up
+TAKE_TIMEOUT = 30.0
+
+Round = TypeVar("Round")
+
+
+class RoundPool(Generic[Round]):
+    """Rounds prepared in the background, ready to be handed out to rooms.
+
+    Workers keep the pool full, so taking a round doesn't wait for it to be
+    prepared unless the pool has run dry.
+    """
+
+    prepare: Callable[[], Awaitable[Round]]
+    ready: "asyncio.Queue[Round]"
+    n_workers: int
+    workers: List["asyncio.Task[None]"]
+
+    def __init__(
+        self,
+        prepare: Callable[[], Awaitable[Round]],
+        size: int = ROUND_POOL_SIZE,
+        workers: int = ROUND_POOL_WORKERS,
+    ) -> None:
+        self.prepare = prepare
+        self.ready = asyncio.Queue(maxsize=size)
+        self.n_workers = workers
+        self.workers = []
+
+    def start(self) -> None:
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._work()) for _ in range(self.n_workers)]
+
+    async def stop(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def take(self, timeout: Optional[float] = None) -> Round:
+        """A ready round, or a freshly prepared one if the pool isn't running.
+
+        Raises `asyncio.TimeoutError` if no round is ready after `timeout`
+        seconds, `TAKE_TIMEOUT` by default, e.g. while every preparation fails.
+        """
+        if timeout is None:
+            timeout = TAKE_TIMEOUT
+        if not self.workers and self.ready.empty():
+            return await asyncio.wait_for(self.prepare(), timeout)
+        return await asyncio.wait_for(self.ready.get(), timeout)
+
+    async def _work(self) -> None:
+        delay = RETRY_DELAY
+        while True:
+            try:
+                round_ = await self.prepare()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to prepare a round, retrying in {}s".format(delay))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+            delay = RETRY_DELAY
+            await self.ready.put(round_)
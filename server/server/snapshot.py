@@ -0,0 +1,161 @@
+"""Binary snapshot format of the open rooms, to restore them after a restart.
+
+All integers are little-endian. The file starts with the header and then
+holds one record per room:
+
+    header   magic, version, n_rooms, wall-clock time of the snapshot (HEADER)
+    record   game, room id, room options as JSON, then the size of the state
+             of the room as an uint32 and the state, written by `WSGame.snapshot`
+
+Strings are uint32 sizes followed by utf-8 bytes. Lists of words are written
+as a count and a single NUL separated blob, so long lists of used words cost
+a single encode.
+"""
+import os
+import struct
+import time
+from typing import Any, Iterable, List, Tuple
+
+MAGIC = b"WGS\x00"
+VERSION = 2
+# magic, version, n_rooms, time
+HEADER = struct.Struct("<4sHId")
+
+_u8 = struct.Struct("<B")
+_u32 = struct.Struct("<I")
+_i32 = struct.Struct("<i")
+_f64 = struct.Struct("<d")
+
+
+class SnapshotFormatError(Exception):
+    pass
+
+
+class SnapshotWriter:
+    buf: bytearray
+
+    def __init__(self) -> None:
+        self.buf = bytearray()
+
+    def u8(self, value: int) -> None:
+        self.buf += _u8.pack(value)
+
+    def u32(self, value: int) -> None:
+        self.buf += _u32.pack(value)
+
+    def i32(self, value: int) -> None:
+        self.buf += _i32.pack(value)
+
+    def f64(self, value: float) -> None:
+        self.buf += _f64.pack(value)
+
+    def blob(self, value: bytes) -> None:
+        self.buf += _u32.pack(len(value))
+        self.buf += value
+
+    def string(self, value: str) -> None:
+        self.blob(value.encode("utf-8"))
+
+    def strings(self, values: Iterable[str]) -> None:
+        values = list(values)
+        self.u32(len(values))
+        for value in values:
+            self.string(value)
+
+    def words(self, values: Iterable[str]) -> None:
+        """Strings without NUL characters, e.g. dictionary words."""
+        values = list(values)
+        self.u32(len(values))
+        self.string("\0".join(values))
+
+
+class SnapshotReader:
+    view: memoryview
+    pos: int
+
+    def __init__(self, data: bytes) -> None:
+        self.view = memoryview(data)
+        self.pos = 0
+
+    def unpack(self, st: struct.Struct) -> Tuple[Any, ...]:
+        if self.pos + st.size > len(self.view):
+            raise SnapshotFormatError("Truncated snapshot")
+        values = st.unpack_from(self.view, self.pos)
+        self.pos += st.size
+        return values
+
+    def u8(self) -> int:
+        value: int = self.unpack(_u8)[0]
+        return value
+
+    def u32(self) -> int:
+        value: int = self.unpack(_u32)[0]
+        return value
+
+    def i32(self) -> int:
+        value: int = self.unpack(_i32)[0]
+        return value
+
+    def f64(self) -> float:
+        value: float = self.unpack(_f64)[0]
+        return value
+
+    def blob(self) -> bytes:
+        size = self.u32()
+        if self.pos + size > len(self.view):
+            raise SnapshotFormatError("Truncated snapshot")
+        value = bytes(self.view[self.pos : self.pos + size])
+        self.pos += size
+        return value
+
+    def string(self) -> str:
+        return self.blob().decode("utf-8")
+
+    def strings(self) -> List[str]:
+        return [self.string() for _ in range(self.u32())]
+
+    def words(self) -> List[str]:
+        n = self.u32()
+        blob = self.string()
+        return blob.split("\0") if n else []
+
+
+# game, room id, options as JSON, state of the room
+RoomRecord = Tuple[str, str, str, bytes]
+
+
+def encode_record(record: RoomRecord) -> bytes:
+    w = SnapshotWriter()
+    game, room_id, options, state = record
+    w.string(game)
+    w.string(room_id)
+    w.string(options)
+    w.blob(state)
+    return bytes(w.buf)
+
+
+def write_snapshot(path: str, records: List[bytes]) -> None:
+    """Write the encoded records, replacing the previous snapshot at once."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), time.time()))
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Tuple[float, List[RoomRecord]]:
+    """Time the snapshot was taken, and its records."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise SnapshotFormatError(f"{path} is not a snapshot")
+    magic, version, n_rooms, taken = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise SnapshotFormatError(f"{path} is not a version {VERSION} snapshot")
+    r = SnapshotReader(data)
+    r.pos = HEADER.size
+    records = [
+        (r.string(), r.string(), r.string(), r.blob()) for _ in range(n_rooms)
+    ]
+    return taken, records
@@ -0,0 +1,27 @@
+from typing import Any, Iterable, Set
+
+
+class DirtyTracking:
+    """Records which public attributes were assigned since they were last taken.
+
+    In-place mutations (e.g. adding to a set) are not seen and have to be
+    reported with `mark_dirty()`.
+    """
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name[0] != "_":
+            self.__dict__.setdefault("_dirty", set()).add(name)
+
+    def mark_dirty(self, *names: str) -> None:
+        self.__dict__.setdefault("_dirty", set()).update(names)
+
+    def take_dirty(self, names: Iterable[str]) -> Set[str]:
+        """Return which of `names` have changed and mark them as clean."""
+        dirty: Set[str] = self.__dict__.setdefault("_dirty", set())
+        taken = dirty.intersection(names)
+        dirty.difference_update(taken)
+        return taken
+
+    def clear_dirty(self) -> None:
+        self.__dict__["_dirty"] = set()
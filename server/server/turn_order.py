@@ -0,0 +1,143 @@
+from array import array
+from typing import Dict, Iterable, Iterator, List
+
+from server.words_game_common import PlayerId, PlayerInfo
+
+# Settings
+# The game goes on while at least this many players are alive
+MIN_ALIVE_PLAYERS = 2
+
+
+class TurnOrder:
+    """Rotation of the players' turns, skipping the players who are out of lives.
+
+    The ring is kept in arrays of the neighbours' indices, so advancing,
+    removing a player and counting the players left are all O(1). A player
+    who has run out of lives is dropped when the rotation gets to them, or
+    right after their own turn.
+
+    Iterating yields the player of each turn. Once fewer than `min_alive`
+    players are left, the survivor is yielded one last time, as the winner,
+    and `finished` is set.
+    """
+
+    __slots__ = (
+        "players",
+        "index",
+        "next_",
+        "prev_",
+        "linked",
+        "alive",
+        "min_alive",
+        "current",
+        "last",
+        "finished",
+    )
+
+    players: List[PlayerInfo]
+    # Position of each player in the arrays
+    index: Dict[PlayerId, int]
+    next_: "array[int]"
+    prev_: "array[int]"
+    # Whether each position is still in the ring
+    linked: bytearray
+    # Number of players in the ring
+    alive: int
+    min_alive: int
+    # Position of the player to be tried next, -1 if the ring is empty
+    current: int
+    # Position of the player of the previous turn, -1 if none
+    last: int
+    finished: bool
+
+    def __init__(
+        self, players: Iterable[PlayerInfo], min_alive: int = MIN_ALIVE_PLAYERS
+    ) -> None:
+        self.players = []
+        self.index = {}
+        self.next_ = array("i")
+        self.prev_ = array("i")
+        self.linked = bytearray()
+        self.alive = 0
+        self.min_alive = min_alive
+        self.current = -1
+        self.last = -1
+        self.finished = False
+        for player in players:
+            if player.lives_left > 0:
+                self.add(player)
+
+    def __len__(self) -> int:
+        return self.alive
+
+    def add(self, player: PlayerInfo) -> None:
+        """Add a player, whose turn comes after everyone else has had theirs."""
+        if self.index.get(player.id, None) is not None and self.linked[self.index[player.id]]:
+            return
+        i = len(self.players)
+        self.players.append(player)
+        self.index[player.id] = i
+        self.linked.append(1)
+        self.alive += 1
+        if self.current == -1:
+            self.next_.append(i)
+            self.prev_.append(i)
+            self.current = i
+            return
+        # Insert right before the player of the previous turn, so everyone else goes first
+        after = self.last if self.last != -1 and self.linked[self.last] else self.current
+        before = self.prev_[after]
+        self.next_.append(after)
+        self.prev_.append(before)
+        self.next_[before] = i
+        self.prev_[after] = i
+
+    def remove(self, pid: PlayerId) -> None:
+        """Take a player, e.g. one who has left the game, out of the rotation."""
+        i = self.index.get(pid, None)
+        if i is not None and self.linked[i]:
+            self._unlink(i)
+
+    def _unlink(self, i: int) -> None:
+        self.linked[i] = 0
+        self.alive -= 1
+        if self.alive == 0:
+            self.current = -1
+            return
+        after = self.next_[i]
+        before = self.prev_[i]
+        self.next_[before] = after
+        self.prev_[after] = before
+        if self.current == i:
+            self.current = after
+
+    def order(self) -> List[PlayerInfo]:
+        """Players in the rotation, from the player of the next turn."""
+        order = []
+        i = self.current
+        for _ in range(self.alive):
+            order.append(self.players[i])
+            i = self.next_[i]
+        return order
+
+    def __iter__(self) -> Iterator[PlayerInfo]:
+        return self
+
+    def __next__(self) -> PlayerInfo:
+        if self.finished:
+            raise StopIteration
+        last = self.last
+        if last != -1 and self.linked[last] and self.players[last].lives_left <= 0:
+            self._unlink(last)
+        while self.alive > 0 and self.players[self.current].lives_left <= 0:
+            self._unlink(self.current)
+        if self.alive == 0:
+            self.finished = True
+            raise StopIteration
+        i = self.current
+        if self.alive < self.min_alive:
+            self.finished = True
+            return self.players[i]
+        self.last = i
+        self.current = self.next_[i]
+        return self.players[i]
@@ -0,0 +1,72 @@
+import asyncio
+from enum import IntEnum
+from typing import Optional
+
+
+class TurnResult(IntEnum):
+    """How a turn has ended."""
+
+    Answered = 0
+    TimedOut = 1
+    # The player has left the game during their turn
+    Skipped = 2
+
+
+class TurnTimer:
+    """Deadline of the current turn.
+
+    The turn is resolved either by `resolve()` or by the loop when the deadline
+    passes, whichever happens first. Nothing runs while the turn is waiting.
+    """
+
+    future: Optional["asyncio.Future[TurnResult]"]
+    deadline_handle: Optional[asyncio.TimerHandle]
+    # Deadline in the event loop time
+    deadline: float
+
+    def __init__(self) -> None:
+        self.future = None
+        self.deadline_handle = None
+        self.deadline = 0.0
+
+    @property
+    def pending(self) -> bool:
+        return self.future is not None and not self.future.done()
+
+    def start(self, timeout: float) -> None:
+        """Begin a new turn that times out in `timeout` seconds."""
+        self.cancel()
+        loop = asyncio.get_running_loop()
+        self.future = loop.create_future()
+        self.deadline = loop.time() + timeout
+        self.deadline_handle = loop.call_at(
+            self.deadline, self.resolve, TurnResult.TimedOut
+        )
+
+    def resolve(self, result: TurnResult) -> bool:
+        """End the current turn. Returns False if it has already ended."""
+        if self.future is None or self.future.done():
+            return False
+        self.future.set_result(result)
+        if self.deadline_handle is not None:
+            self.deadline_handle.cancel()
+            self.deadline_handle = None
+        return True
+
+    async def wait(self) -> TurnResult:
+        assert self.future is not None
+        return await self.future
+
+    def remaining(self) -> float:
+        """Seconds left until the deadline of the current turn."""
+        if not self.pending:
+            return 0.0
+        return max(0.0, self.deadline - asyncio.get_running_loop().time())
+
+    def cancel(self) -> None:
+        if self.deadline_handle is not None:
+            self.deadline_handle.cancel()
+            self.deadline_handle = None
+        if self.future is not None and not self.future.done():
+            self.future.cancel()
+        self.future = None
@@ -0,0 +1,185 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from html import escape, unescape
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from server.wiki_game_common import Article
+
+# Settings
+EXTRACT_WORKERS = 2
+
+T = TypeVar("T")
+
+# Elements that have no end tag
+VOID_TAGS = set("area base br col embed hr img input link meta source track wbr".split())
+# Elements dropped from the article content together with everything inside
+DROPPED_TAGS = {"script", "style", "noscript"}
+# Links to these namespaces aren't articles
+IGNORED_LINK_PREFIXES = (
+    "/wiki/Wikipedia:",
+    "/wiki/Template:",
+    "/wiki/Template_talk:",
+    "/wiki/File:",
+)
+
+
+def is_article_link(href: Optional[str]) -> bool:
+    return (
+        href is not None
+        and href.startswith("/wiki/")
+        and not href.startswith(IGNORED_LINK_PREFIXES)
+    )
+
+
+class ArticleExtractor(HTMLParser):
+    """Single pass over a Wikipedia page.
+
+    Collects the title (`h1#firstHeading`), the sanitized HTML of the first
+    `div.mw-parser-output` and the article links inside it.
+    """
+
+    title: List[str]
+    content: List[str]
+    links: List[str]
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=False)
+        self.title = []
+        self.content = []
+        self.links = []
+        self._seen_links: Dict[str, None] = {}
+        self._in_title = False
+        self._title_done = False
+        # Open <div>s of the content, 0 when outside of it
+        self._content_divs = 0
+        self._content_done = False
+        # The dropped element being skipped and how deep in it we are
+        self._skipping: Optional[str] = None
+        self._skip_depth = 0
+
+    def _emit_starttag(
+        self, tag: str, attrs: List[Tuple[str, Optional[str]]], closed: bool
+    ) -> None:
+        parts = [tag]
+        for name, value in attrs:
+            if name.startswith("on"):
+                continue
+            if value is None:
+                parts.append(name)
+                continue
+            if name == "href" and value.lstrip().lower().startswith("javascript:"):
+                continue
+            parts.append(f'{name}="{escape(value, quote=True)}"')
+        self.content.append("<{}{}>".format(" ".join(parts), " /" if closed else ""))
+
+    def _starttag(
+        self, tag: str, attrs: List[Tuple[str, Optional[str]]], closed: bool
+    ) -> None:
+        if tag == "h1" and not self._title_done and ("id", "firstHeading") in attrs:
+            self._in_title = True
+        if self._content_divs == 0:
+            if self._content_done or tag != "div":
+                return
+            classes = (dict(attrs).get("class") or "").split()
+            if "mw-parser-output" not in classes:
+                return
+        if self._skipping is not None:
+            if tag == self._skipping and not closed:
+                self._skip_depth += 1
+            return
+        if tag in DROPPED_TAGS and not closed:
+            self._skipping = tag
+            self._skip_depth = 1
+            return
+        if tag == "div" and not closed:
+            self._content_divs += 1
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if is_article_link(href) and href not in self._seen_links:
+                assert href is not None
+                self._seen_links[href] = None
+                self.links.append(href)
+        self._emit_starttag(tag, attrs, closed)
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self._starttag(tag, attrs, tag in VOID_TAGS)
+
+    def handle_startendtag(
+        self, tag: str, attrs: List[Tuple[str, Optional[str]]]
+    ) -> None:
+        self._starttag(tag, attrs, True)
+
+    def handle_endtag(self, tag: str) -> None:
+        if self._in_title and tag == "h1":
+            self._in_title = False
+            self._title_done = True
+        if self._content_divs == 0:
+            return
+        if self._skipping is not None:
+            if tag == self._skipping:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skipping = None
+            return
+        if tag in VOID_TAGS:
+            return
+        self.content.append(f"</{tag}>")
+        if tag == "div":
+            self._content_divs -= 1
+            if self._content_divs == 0:
+                self._content_done = True
+
+    def _text(self, raw: str) -> None:
+        if self._in_title:
+            self.title.append(unescape(raw))
+        if self._content_divs > 0 and self._skipping is None:
+            self.content.append(raw)
+
+    def handle_data(self, data: str) -> None:
+        self._text(data)
+
+    def handle_entityref(self, name: str) -> None:
+        self._text(f"&{name};")
+
+    def handle_charref(self, name: str) -> None:
+        self._text(f"&#{name};")
+
+
+def extract_article(html: str, url: str) -> Article:
+    extractor = ArticleExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return Article(
+        title="".join(extractor.title).strip(),
+        path=url,
+        content="".join(extractor.content),
+        links=extractor.links,
+    )
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+async def run_in_process(fn: Callable[..., T], *args: Any) -> T:
+    """Run `fn` in a worker process, off the event loop and its GIL.
+
+    The arguments and the result are pickled.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, fn, *args)
+
+
+async def extract_article_async(html: str, url: str) -> Article:
+    """Run `extract_article` in a worker process, off the event loop."""
+    return await run_in_process(extract_article, html, url)
+
+
+def shutdown_extractors() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
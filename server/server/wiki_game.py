@@ -1,17 +1,31 @@
 import enum
+from collections import Counter
 from dataclasses import asdict, dataclass
-from typing import Dict
+from typing import Any, AsyncIterator, Dict
 import aiohttp
 import random
 
-from bs4 import BeautifulSoup
-from aiohttp.web_request import Request
-from aiohttp.web_ws import WebSocketResponse
+from aiohttp import web
+from server.article_cache import ArticleCache
+from server.env import ARTICLE_CACHE_MAX_BYTES, ARTICLE_CACHE_PATH, WIKI_BASE_URL
+from server.http_client import HTTPClient
+from server.link_graph import LinkGraph
 from server.logger import logger
+from server.metrics import collected_counter, gauge
+from server.prefetch import Prefetcher, rank_links
+from server.rooms import RoomId, RoomManager, RoomOptions, add_room_routes
+from server.round_pool import RoundPool
 from server.routes import routes
+from server.snapshot import SnapshotReader, SnapshotWriter
+from server.wiki_extract import (
+    extract_article_async,
+    run_in_process,
+    shutdown_extractors,
+)
+from server.wiki_game_common import Article, Round, is_wiki_path, normalize_wiki_path
 from server.words_game_common import PlayerId
-from server.ws_game import ClientInfo, Message, MessageHandler, WSGame
-from typing import Optional, List
+from server.ws_game import ClientInfo, Message, WSGame
+from typing import Optional, List, Tuple
 
 
 import aiohttp
@@ -20,9 +34,6 @@ import aiohttp
 import asyncio
 
 
-import re
-
-
 class CWMSG(enum.IntEnum):
     Joining = 0
     NavigateTo = 1
@@ -43,6 +54,10 @@ class PlayerInfo:
     time_started: Optional[None] = None
     time_ended: Optional[None] = None
     place: int = 0
+    # Articles visited after the initial one
+    steps: int = 0
+    # Path of the article the player is on
+    path: str = ""
 
     @property
     def total_time(self):
@@ -54,138 +69,227 @@ class PlayerInfo:
         return asdict(self)
 
 
-@dataclass
-class Article:
-    title: str
-    path: str
-    content: str
-
-    def to_json(self):
-        return {"title": self.title, "path": self.path, "content": self.content}
+# Settings
+# Distance of the target from the initial article, in links
+MIN_STEPS = 2
+MAX_STEPS = 4
+# Seconds between rebuilds of the link graph from the article cache
+LINK_GRAPH_REBUILD_INTERVAL = 5 * 60
+PREFETCH_CONCURRENCY = 8
+
+# Shared between the rooms
+wiki_client = HTTPClient(WIKI_BASE_URL)
+article_cache = ArticleCache(ARTICLE_CACHE_PATH, ARTICLE_CACHE_MAX_BYTES)
+# Links between the cached articles, replaced by `rebuild_link_graph()`
+link_graph = LinkGraph.empty()
+# Fetches in progress and how many loads are waiting for each, by normalized path
+article_fetches: Dict[str, "asyncio.Task[Article]"] = {}
+fetch_waiters: Dict[str, int] = {}
+# Articles being prefetched at once, across all the rooms
+prefetch_budget = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+collected_counter(
+    "article_cache_lookups_total",
+    "Article cache lookups by the tier that had the article",
+    ("result",),
+    lambda: [
+        (("memory_hit",), article_cache.memory_hits),
+        (("disk_hit",), article_cache.disk_hits),
+        (("miss",), article_cache.misses),
+    ],
+)
+gauge(
+    "article_cache_memory_bytes",
+    "Size of the article contents cached in memory",
+    collector=lambda: [((), article_cache.memory_bytes)],
+)
+gauge(
+    "article_cache_memory_articles",
+    "Articles cached in memory",
+    collector=lambda: [((), len(article_cache.memory))],
+)
 
 
 async def load_wiki_article(path: str) -> Article:
-    url = f"https://en.wikipedia.org{path}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            content = await resp.text()
-            path = str(resp.real_url)
-            html = BeautifulSoup(content, "html.parser")
-            article_title = html.find("h1", {"id": "firstHeading"})
-            article_content_div = html.find("div", {"class": "mw-parser-output"})
-            article_content = str(article_content_div)
-            return Article(title=article_title.text, path=path, content=article_content)
-
-
-URL_REGEXP = r".*(\/wiki\/.*)"
-
-
-def get_wiki_path_from_url(url: str):
-    m = re.search(URL_REGEXP, url)
-    if m is None:
-        raise Exception("Invalid Wiki article URL")
-    return m.group(1)
-
-
-MIN_STEPS = 1
-MAX_STEPS = 1
-
-
-async def generate_random_target_for_article(article: Article) -> Article:
-    def filter_link(link: str):
-        href = link.get("href")
-        if href is None:
-            return False
-        if not href.startswith("/wiki/"):
-            return False
-        if (
-            href.startswith("/wiki/Wikipedia:")
-            or href.startswith("/wiki/Template:")
-            or href.startswith("/wiki/Template_talk:")
-            or href.startswith("/wiki/File:")
-        ):
-            return False
-        return True
-
-    async def iter_(article: Article, steps: int):
-        if steps <= 0:
-            return article
-        content = article.content
-        html = BeautifulSoup(content, "html.parser")
-        links = html.findAll("a")
-        assert len(links) != 0
-        if len(links) == 0:
-            return None
-        links = list(filter(filter_link, links))
-        next_link = random.choice(links)
-        next_link = next_link.get("href")
-        next_path = get_wiki_path_from_url(next_link)
-        art = await load_wiki_article(next_path)
-        return await iter_(art, steps - 1)
+    content, url = await wiki_client.get_text(path)
+    return await extract_article_async(content, url)
+
+
+async def fetch_and_cache_article(path: str) -> Article:
+    article = await load_wiki_article(path)
+    await article_cache.put(article, path)
+    return article
+
+
+async def load_cached_article(path: str) -> Article:
+    """Article from the cache, or fetched once however many times it's requested meanwhile.
+
+    A fetch is cancelled when everyone waiting for it is.
+    """
+    article = await article_cache.get(path)
+    if article is not None:
+        return article
+    key = normalize_wiki_path(path)
+    fetch = article_fetches.get(key, None)
+    if fetch is None:
+        fetch = asyncio.create_task(fetch_and_cache_article(path))
+        article_fetches[key] = fetch
+        fetch_waiters[key] = 0
+        fetch.add_done_callback(lambda _: article_fetches.pop(key, None))
+    fetch_waiters[key] += 1
+    try:
+        return await asyncio.shield(fetch)
+    except asyncio.CancelledError:
+        if fetch_waiters[key] == 1:
+            fetch.cancel()
+        raise
+    finally:
+        fetch_waiters[key] -= 1
+        if fetch_waiters[key] == 0:
+            del fetch_waiters[key]
+
+
+async def rebuild_link_graph() -> None:
+    global link_graph
+    rows, aliases = await article_cache.link_rows()
+    # In a process, a thread would hold the GIL for the whole build
+    link_graph = await run_in_process(LinkGraph.build, rows, aliases)
+    logger.info(
+        "Built the link graph of {} articles and {} links".format(
+            link_graph.n_known, link_graph.edge_count
+        )
+    )
+
 
-    initial_steps = random.randint(MIN_STEPS, MAX_STEPS)
-    target = await iter_(article, initial_steps)
+async def keep_link_graph_fresh() -> None:
+    while True:
+        try:
+            await rebuild_link_graph()
+        except Exception:
+            logger.exception("Failed to build the link graph")
+        await asyncio.sleep(LINK_GRAPH_REBUILD_INTERVAL)
 
-    return target
+
+async def generate_target_for_article(article: Article) -> Tuple[Article, int]:
+    """Pick the target article, return it with the length of the shortest path to it.
+
+    The target is looked up in the link graph. Until the graph reaches
+    `MIN_STEPS` links away, one of the article's own links is used.
+    """
+    picked = link_graph.pick_target(article.path, MIN_STEPS, MAX_STEPS, article.links)
+    if picked is not None:
+        path, steps = picked
+        return await load_cached_article(path), steps
+    assert len(article.links) != 0
+    return await load_cached_article(random.choice(article.links)), 1
+
+
+async def load_random_article() -> Article:
+    """Random Wikipedia article, or a random cached one while Wikipedia can't be reached."""
+    try:
+        article = await load_wiki_article("/wiki/Special:Random")
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        if link_graph.n_known == 0:
+            raise
+        logger.warning("Wikipedia is unreachable, starting from a cached article")
+        return await load_cached_article(
+            link_graph.paths[random.randrange(link_graph.n_known)]
+        )
+    await article_cache.put(article)
+    return article
+
+
+async def prepare_round() -> Round:
+    initial = await load_random_article()
+    target, optimal_steps = await generate_target_for_article(initial)
+    return Round(initial=initial, target=target, optimal_steps=optimal_steps)
+
+
+round_pool: RoundPool[Round] = RoundPool(prepare_round)
+gauge(
+    "wiki_rounds_ready",
+    "Rounds prepared in the background",
+    collector=lambda: [((), round_pool.ready.qsize())],
+)
 
 
 class WikiGame(WSGame):
-    ws_handlers_mapping: Dict[CWMSG, MessageHandler]
-    players: Dict[PlayerId, PlayerInfo] = {}
+    game = "wiki"
+    client_messages = CWMSG
+    server_messages = SWMSG
+    players: Dict[PlayerId, PlayerInfo]
     initial_article: Optional[Article] = None
     target_article: Optional[Article] = None
-    # Article cache
-    article_store: Dict[str, Article] = {}
-    players_finished: List[PlayerId] = []
-
-    def __init__(self) -> None:
-        super().__init__()
+    # Length of the shortest path from the initial article to the target
+    optimal_steps: int = 0
+    players_finished: List[PlayerId]
+    # Held while the round is set up, so players joining at once share it
+    init_lock: asyncio.Lock
+    # How many times each article was opened in the room, by normalized path
+    visits: "Counter[str]"
+    # Distances to the target from the articles around it, by normalized path
+    target_distances: Dict[str, int]
+    prefetcher: Prefetcher
+
+    def __init__(self, room_id: RoomId) -> None:
+        super().__init__(room_id)
         self.ws_handlers_mapping = {
             CWMSG.Joining: self.on_player_joined,  # type: ignore
             CWMSG.NavigateTo: self.on_player_navigate,  # type: ignore
         }
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(self.init_game())
-
-    async def load_initial_article(self) -> Article:
-        return await self.load_random_article()
-
-    async def get_initial_article(self) -> Article:
-        return self.initial_article
-
-    async def init_game(self):
-        self.initial_article = await self.load_initial_article()
-        self.target_article = await generate_random_target_for_article(
-            self.initial_article
+        self.players = {}
+        self.players_finished = []
+        self.visits = Counter()
+        self.target_distances = {}
+        self.prefetcher = Prefetcher(load_cached_article, prefetch_budget)
+        self.init_lock = asyncio.Lock()
+
+    async def init_game(self) -> None:
+        """Start a new round, prepared in the background by `round_pool`."""
+        round_ = await round_pool.take()
+        self.initial_article = round_.initial
+        self.target_article = round_.target
+        self.optimal_steps = round_.optimal_steps
+        self.target_distances = link_graph.distances_to(
+            self.target_article.path, MAX_STEPS
         )
         self.players_finished = []
         self.players = {}
-
-    async def load_random_article(self) -> Article:
-        article = await load_wiki_article("/wiki/Special:Random")
-        self.article_store[article.path] = article
-        return article
+        self.visits = Counter()
 
     async def load_wiki_article(self, path: str) -> Article:
-        article = self.article_store.get(path, None)
-        if article is not None:
-            return article
-        article = await load_wiki_article(path)
-        self.article_store[path] = article
-        return article
+        return await load_cached_article(path)
+
+    def prefetch_links(self, pid: PlayerId, article: Article) -> None:
+        """Start loading the links the player is likely to follow from the article."""
+        ranked = rank_links(article.links, self.visits, self.target_distances)
+        self.prefetcher.prefetch(
+            pid, [path for path in ranked if not article_cache.in_memory(path)]
+        )
 
     async def on_player_joined(self, si: ClientInfo, parsed: Message) -> None:
         # if self.is_game_in_progress():
         #     await self.send_to_user(si, {"type": SWMSG.GameInProgress})
         #     return
         nickname = parsed["nickname"]
-        logger.debug("{} is joining".format(nickname))
-        await self.init_game()
+        self.log.debug("%s is joining", nickname, extra={"player": si.id})
+        # Players joining an ongoing round play the same round
+        async with self.init_lock:
+            if self.initial_article is None:
+                try:
+                    await self.init_game()
+                except Exception:
+                    self.log.exception("Can't start a round", extra={"player": si.id})
+                    await si.close(b"No round ready")
+                    return
         ws_id = si.id
+        initial_article = self.initial_article
+        assert initial_article is not None
         new_player = PlayerInfo(
             # self.config,
             id=ws_id,
             nickname=nickname,
+            path=initial_article.path,
         )
         self.players[ws_id] = new_player
         assert self.target_article is not None
@@ -195,12 +299,14 @@ class WikiGame(WSGame):
                 "type": SWMSG.InitGame,
                 "player": new_player.to_json(),
                 "target": self.target_article.title,
+                "optimal_steps": self.optimal_steps,
+                "token": self.issue_token(ws_id),
             },
         )
-        initial_article = await self.get_initial_article()
         await self.send_to_user(
             si, {"type": SWMSG.NavigateTo, "article": initial_article.to_json()}
         )
+        self.prefetch_links(ws_id, initial_article)
 
         # await self.send_to_others(
         #     si, {"type": SWMSG.PlayerJoined, "player": new_player.to_json()}
@@ -220,34 +326,129 @@ class WikiGame(WSGame):
         assert player is not None
         nickname = player.nickname
         to = parsed.get("path", None)
-        assert to is not None
-        logger.debug(f"{nickname} is navigating to {to}")
-        self.players_finished.append(player.id)
-        player.place = len(self.players_finished)
-        if to == get_wiki_path_from_url(self.target_article.path):
+        if not isinstance(to, str) or not is_wiki_path(to):
+            self.log.warning(
+                "Invalid path to navigate to: %r",
+                to,
+                extra={"player": si.id, "event": "invalid_path"},
+            )
+            return
+        self.log.debug(
+            "%s is navigating to %s", nickname, to, extra={"player": si.id}
+        )
+        # The other links of the previous article won't be opened now
+        self.prefetcher.cancel(player.id, keep=to)
+        article = await self.load_wiki_article(to)
+        player.steps += 1
+        player.path = article.path
+        self.visits[normalize_wiki_path(article.path)] += 1
+        assert self.target_article is not None
+        if normalize_wiki_path(article.path) == normalize_wiki_path(
+            self.target_article.path
+        ):
+            self.players_finished.append(player.id)
+            player.place = len(self.players_finished)
             await self.send_to_user(
                 si,
                 {
                     "type": SWMSG.Finished,
                     "player": player.to_json(),
+                    "optimal_steps": self.optimal_steps,
                 },
             )
-        article = await self.load_wiki_article(to)
         await self.send_to_user(
             si, {"type": SWMSG.NavigateTo, "article": article.to_json()}
         )
+        self.prefetch_links(player.id, article)
 
-    async def handle_msg(self, si: ClientInfo, _type: CWMSG, msg: Message) -> None:
-        f = self.ws_handlers_mapping.get(_type, None)
-        if f is None:
-            logger.warning("Unknown message type received from client: {}".format(msg))
-        else:
-            await f(si, msg)
-
-
-wiki_game = WikiGame()
-
+    async def on_player_resumed(self, si: ClientInfo) -> None:
+        player = self.players.get(si.id, None)
+        if player is None or self.target_article is None:
+            return
+        await self.send_to_user(
+            si,
+            {
+                "type": SWMSG.InitGame,
+                "player": player.to_json(),
+                "target": self.target_article.title,
+                "optimal_steps": self.optimal_steps,
+                "token": self.tokens[si.id],
+            },
+        )
+        article = await self.load_wiki_article(player.path)
+        await self.send_to_user(
+            si, {"type": SWMSG.NavigateTo, "article": article.to_json()}
+        )
 
-@routes.get("/wiki/")
-async def on_req(request: Request) -> WebSocketResponse:
-    return await wiki_game.handle_req(request)
+    async def remove_player(self, pid: PlayerId, si: Optional[ClientInfo]) -> None:
+        self.prefetcher.cancel(pid)
+        self.players.pop(pid, None)
+        if not self.players:
+            # The next player to join gets a new round
+            self.initial_article = None
+            self.target_article = None
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "players": len(self.players)}
+
+    async def close(self) -> None:
+        self.prefetcher.close()
+        await super().close()
+
+    def snapshot(self, w: SnapshotWriter) -> None:
+        super().snapshot(w)
+        initial, target = self.initial_article, self.target_article
+        w.string(initial.path if initial is not None else "")
+        w.string(target.path if target is not None else "")
+        w.u32(self.optimal_steps)
+        w.u32(len(self.players))
+        for player in self.players.values():
+            w.string(player.id)
+            w.string(player.nickname)
+            w.i32(player.points)
+            w.u32(player.place)
+            w.u32(player.steps)
+            w.string(player.path)
+        w.strings(self.players_finished)
+
+    async def restore(self, r: SnapshotReader) -> None:
+        await super().restore(r)
+        initial, target = r.string(), r.string()
+        self.optimal_steps = r.u32()
+        for _ in range(r.u32()):
+            player = PlayerInfo(id=r.string(), nickname=r.string())
+            player.points = r.i32()
+            player.place = r.u32()
+            player.steps = r.u32()
+            player.path = r.string()
+            self.players[player.id] = player
+        self.players_finished = r.strings()
+        if initial and target:
+            # From the article cache, unless it has been cleared
+            self.initial_article = await self.load_wiki_article(initial)
+            self.target_article = await self.load_wiki_article(target)
+            self.target_distances = link_graph.distances_to(target, MAX_STEPS)
+
+
+async def wiki_context(app: web.Application) -> AsyncIterator[None]:
+    """Starts the background work of the wiki game, stops it and closes the Wikipedia client on shutdown.
+
+    Nothing here waits for the network, rounds are prepared in the background.
+    """
+    graph_task = asyncio.create_task(keep_link_graph_fresh())
+    round_pool.start()
+    async for _ in wiki_client.lifecycle(app):
+        yield
+    await round_pool.stop()
+    graph_task.cancel()
+    await article_cache.close()
+    shutdown_extractors()
+
+
+def create_room(room_id: RoomId, options: RoomOptions) -> WikiGame:
+    return WikiGame(room_id)
+
+
+rooms: RoomManager[WikiGame] = RoomManager(create_room)
+
+add_room_routes(routes, "/wiki", rooms)
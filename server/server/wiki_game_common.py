@@ -0,0 +1,44 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+from urllib.parse import unquote
+
+
+@dataclass
+class Article:
+    title: str
+    path: str
+    content: str
+    # Paths of the articles linked from the content, in the order of appearance
+    links: List[str] = field(default_factory=list)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"title": self.title, "path": self.path, "content": self.content}
+
+
+@dataclass
+class Round:
+    initial: Article
+    target: Article
+    # Length of the shortest path from the initial article to the target
+    optimal_steps: int
+
+
+URL_REGEXP = r".*(\/wiki\/.*)"
+
+
+def is_wiki_path(url: str) -> bool:
+    return re.search(URL_REGEXP, url) is not None
+
+
+def get_wiki_path_from_url(url: str) -> str:
+    m = re.search(URL_REGEXP, url)
+    if m is None:
+        raise Exception("Invalid Wiki article URL")
+    return m.group(1)
+
+
+def normalize_wiki_path(url: str) -> str:
+    """Cache key of an article: its `/wiki/...` path, unquoted and without the fragment."""
+    path = unquote(get_wiki_path_from_url(url)).split("#", 1)[0]
+    return path.replace(" ", "_")
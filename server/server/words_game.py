@@ -1,20 +1,30 @@
 import asyncio
 import json
+import logging
+import math
+import os
 import random
-from dataclasses import asdict, dataclass, field
-from datetime import datetime, timedelta
-from typing import Callable, Dict, List, Optional, Set, Any, Coroutine
-
-from aiohttp.web_request import Request
-from aiohttp.web_ws import WebSocketResponse
-
-from server.alive_players_list import init_alive_players_list, players_list_iter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple, Any, Coroutine
+
+from aiohttp import web
+
+from server.dictionary import load_binary_dictionary
+from server.input_relay import (
+    CLIENT_INPUT_BURST,
+    CLIENT_INPUT_RATE,
+    RELAY_RATE,
+    InputRelay,
+    TokenBucket,
+    inputs_dropped,
+)
 from server.lang import Language
 from server.logger import logger
+from server.rooms import RoomId, RoomManager, RoomOptions, add_room_routes
 from server.routes import routes
+from server.snapshot import SnapshotReader, SnapshotWriter
 from server.words_game_common import (
     PlayerInfo,
-    Letter,
     PlayersById,
     PlayerId,
     GameStateDesc,
@@ -24,24 +34,32 @@ from server.words_game_common import (
     SWMSG,
     WordsGameConfig,
 )
-from server.ws_game import ClientInfo, WSGame, Message, MessageHandler
+from server.particle_index import ParticleUsage
+from server.state_diff import DirtyTracking
+from server.turn_order import TurnOrder
+from server.turn_timer import TurnResult, TurnTimer
+from server.ws_game import ClientInfo, WSGame, Message
 
 # Settings
 TIME_UNTIL_START = 10
 LIVES_INITIAL = 3
 MIN_PLAYERS_TO_START_GAME = 2
-TICK_DURATION = 0.05
 TIME_TO_ANSWER = 15
 WORDS_DICT_PATH = "./assets/words.txt"
 PARTICLES_PATH = "./assets/particles.json"
+# Compiled by scripts/compile-dictionary.py, preferred over the text files
+COMPILED_DICT_PATH = "./assets/words.bin"
 MIN_PARTICLE_LENGTH = 3
 reward_random_letters = True
 
 
-# TODO: Make this lobby-local
 @dataclass
-class GameState:
-    """Current game state. Shared between client and server."""
+class GameState(DirtyTracking):
+    """Current game state. Shared between client and server.
+
+    Clients receive the state once on joining and then versioned patches
+    holding only the fields that have changed.
+    """
 
     config: WordsGameConfig
 
@@ -60,16 +78,56 @@ class GameState:
     last_player_to_answer: Optional[PlayerInfo] = None
     # Words used already in the game
     used_words: Set[str] = field(default_factory=lambda: set())
+    # Used words containing each particle
+    particle_usage: ParticleUsage = field(default_factory=ParticleUsage)
     guess_correct: bool = False
+    # Version of the last patch sent to the clients
+    version: int = 0
+
+    def field_json(self, key: str) -> Any:
+        if key == "players":
+            return {pid: p.to_json() for pid, p in self.players.items()}
+        if key == "last_player_to_answer":
+            last_player = self.last_player_to_answer
+            return last_player.id if last_player is not None else None
+        if key == "all_letters":
+            return self.config.alphabet.letters
+        return getattr(self, key)
 
     def to_json(self) -> Dict[str, Any]:
-        players_json = {pid: p.to_json() for pid, p in self.players.items()}
-        return {
-            **asdict(self),
-            "all_letters": list(self.config.all_letters),
-            "players": players_json,
-            "used_words": list(self.used_words),
-        }
+        return {key: self.field_json(key) for key in GAME_STATE_JSON_KEYS}
+
+    def patch_json(self, keys: Tuple[str, ...]) -> Dict[str, Any]:
+        """Changed fields out of `keys`. Only the changed players are included."""
+        changed = self.take_dirty(keys)
+        patch: Dict[str, Any] = {}
+        for key in keys:
+            if key == "players":
+                players = {}
+                for pid, p in self.players.items():
+                    player_patch = p.patch_json()
+                    if player_patch is not None:
+                        players[pid] = player_patch
+                if players:
+                    patch[key] = players
+            elif key in changed:
+                patch[key] = self.field_json(key)
+        return patch
+
+
+# Fields sent to the clients. `used_words` stays on the server.
+GAME_STATE_JSON_KEYS = (
+    "players",
+    "whos_turn",
+    "particle",
+    "desc",
+    "start_timer",
+    "guess",
+    "last_player_to_answer",
+    "guess_correct",
+    "all_letters",
+    "version",
+)
 
 
 def initial_game_state(config: WordsGameConfig) -> GameState:
@@ -79,11 +137,13 @@ def initial_game_state(config: WordsGameConfig) -> GameState:
 def load_dictionary(words_dict_path: str, particles_path: str) -> WordGameDict:
     ww = WordGameDict()
     logger.info("Loading dictionary...")
+    words = set()
     with open(words_dict_path, "r", encoding="utf-8") as f:
         for word in f.readlines():
             # don't include the newline
             w = word[:-1].lower()
-            ww.words.add(w)
+            words.add(w)
+    ww.words = words
     with open(particles_path, "r", encoding="utf-8") as f:
         ww.particles = json.load(f)
     ww.particle_keys = list(ww.particles.keys())
@@ -93,6 +153,8 @@ def load_dictionary(words_dict_path: str, particles_path: str) -> WordGameDict:
         )
         ww.by_difficulty[diff] = particles
         logger.info("Loaded {} difficulty={} words.".format(len(particles), diff))
+    # Without the particle index and the letter masks, which take a while to
+    # build: scripts/compile-dictionary.py writes them along with the words
     logger.info(
         "Done. Loaded {} words and {} particles".format(
             len(ww.words), len(ww.particles)
@@ -101,26 +163,99 @@ def load_dictionary(words_dict_path: str, particles_path: str) -> WordGameDict:
     return ww
 
 
-class WikiGame(WSGame):
+_dictionary: Optional[WordGameDict] = None
+
+
+def shared_dictionary() -> WordGameDict:
+    """The dictionary loaded once per process and shared by every room."""
+    global _dictionary
+    if _dictionary is None:
+        if os.path.isfile(COMPILED_DICT_PATH):
+            logger.info("Loading compiled dictionary...")
+            _dictionary = load_binary_dictionary(COMPILED_DICT_PATH)
+            logger.info(
+                "Done. Loaded {} words and {} particles".format(
+                    len(_dictionary.words), len(_dictionary.particles)
+                )
+            )
+        else:
+            _dictionary = load_dictionary(WORDS_DICT_PATH, PARTICLES_PATH)
+    return _dictionary
+
+
+async def preload_dictionary(app: web.Application) -> None:
+    shared_dictionary()
+
+
+def _finite(value: Any) -> float:
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"Expected a finite number, got {value!r}")
+    return number
+
+
+def config_from_options(options: RoomOptions) -> WordsGameConfig:
+    config = WordsGameConfig(
+        lang=Language.Russian,
+        lives_initial=int(options.get("lives_initial", LIVES_INITIAL)),
+        min_players_to_start_game=int(
+            options.get("min_players_to_start_game", MIN_PLAYERS_TO_START_GAME)
+        ),
+        time_until_start=int(options.get("time_until_start", TIME_UNTIL_START)),
+        time_to_answer=int(options.get("time_to_answer", TIME_TO_ANSWER)),
+        input_rate=_finite(options.get("input_rate", RELAY_RATE)),
+        client_input_rate=_finite(options.get("client_input_rate", CLIENT_INPUT_RATE)),
+        client_input_burst=int(
+            _finite(options.get("client_input_burst", CLIENT_INPUT_BURST))
+        ),
+    )
+    if config.lives_initial < 1 or config.min_players_to_start_game < 2:
+        raise ValueError("Invalid room config")
+    if config.time_until_start < 0 or config.time_to_answer < 1:
+        raise ValueError("Invalid room timers")
+    if (
+        config.input_rate <= 0
+        or config.client_input_rate <= 0
+        or config.client_input_burst < 1
+    ):
+        raise ValueError("Invalid input rate limits")
+    return config
+
+
+class WordsGame(WSGame):
+    game = "words"
+    client_messages = CWMSG
+    server_messages = SWMSG
     game_state: GameState
     # Handle to asyncio.Task that executes the game loop
     game_handle = None
-    ws_handlers_mapping: Dict[CWMSG, MessageHandler]
+    # Deadline of the current turn
+    turn: TurnTimer
+    # Order of the turns of the current game
+    turns: Optional[TurnOrder]
+    # Relays the inputs of the players to the room at a capped rate
+    input_relay: InputRelay
+    # Rate limits of the input updates of each client
+    input_limits: Dict[PlayerId, TokenBucket]
     ww: WordGameDict
     config: WordsGameConfig
 
-    def __init__(self) -> None:
-        super().__init__()
-        self.config = WordsGameConfig(
-            lives_initial=3, lang=Language.Russian, min_players_to_start_game=2
-        )
+    def __init__(
+        self, room_id: RoomId, config: WordsGameConfig, ww: WordGameDict
+    ) -> None:
+        super().__init__(room_id)
+        self.config = config
         self.game_state = initial_game_state(self.config)
+        self.turn = TurnTimer()
+        self.turns = None
+        self.input_relay = InputRelay(self.relay_input, config.input_rate, self.game)
+        self.input_limits = {}
         self.ws_handlers_mapping = {
             CWMSG.Joining: self.on_player_joined,  # type: ignore
             CWMSG.UpdateInput: self.on_player_input,  # type: ignore
             CWMSG.SubmitGuess: self.on_player_submit,  # type: ignore
         }
-        self.ww = load_dictionary(WORDS_DICT_PATH, PARTICLES_PATH)
+        self.ww = ww
 
     def get_player(self, pid: PlayerId) -> Optional[PlayerInfo]:
         """Get player state by his ID"""
@@ -132,19 +267,24 @@ class WikiGame(WSGame):
             return None
         return p.nickname
 
-    def state_update_msg(self, *keys: str) -> Message:
+    def state_update_msg(self, *keys: str) -> Optional[Message]:
+        """Patch with the fields out of `keys` changed since they were last sent."""
         gs = self.game_state
-        gsd = gs.to_json()
-        msg = {"type": SWMSG.UpdateGameState, "state": {key: gsd[key] for key in keys}}
-        return msg
+        patch = gs.patch_json(keys)
+        if not patch:
+            return None
+        gs.version += 1
+        return {"type": SWMSG.UpdateGameState, "version": gs.version, "state": patch}
 
     async def notify_of_su(self, *keys: str) -> None:
         msg = self.state_update_msg(*keys)
-        return await self.send_to_all(msg)
+        if msg is not None:
+            await self.send_to_all(msg)
 
     async def notify_others_of_su(self, si: ClientInfo, *keys: str) -> None:
         msg = self.state_update_msg(*keys)
-        return await self.send_to_others(si, msg)
+        if msg is not None:
+            await self.send_to_others(si, msg)
 
     async def wrong_guess(self, player: PlayerInfo) -> None:
         await self.send_to_all({"type": SWMSG.WrongGuess, "id": player.id})
@@ -152,21 +292,35 @@ class WikiGame(WSGame):
     async def correct_guess(self, player: PlayerInfo, guess: str) -> None:
         gs = self.game_state
         gs.used_words.add(guess)
+        if self.ww.index is not None:
+            self.ww.index.mark_used(gs.particle_usage, guess)
         player.input = ""
+        self.input_relay.drop(player.id)
         # use all letters in the word
-        for letter in guess:
-            k = ord(letter.lower())
-            if k in player.letters_left:
-                player.letters_left.remove(k)
+        alphabet = self.config.alphabet
+        letters = self.ww.letters
+        if letters is not None and letters.alphabet is alphabet:
+            player.letters_left &= ~letters.mask(guess)
+        else:
+            player.letters_left &= ~alphabet.mask(guess)
         # Reward random letter
-        if reward_random_letters:
-            letter_to_remove: Letter = random.choice(list(player.letters_left))
-            player.letters_left.remove(letter_to_remove)
-            logger.debug(f"Random letter rewarded: {letter}")
-        logger.debug(
-            f"player={player.nickname}, letters_left={' '.join(list(map(lambda x: chr(x), player.letters_left)))}"
-        )
-        if len(player.letters_left) == 0:
+        if reward_random_letters and player.letters_left:
+            rewarded = alphabet.random_letter(player.letters_left)
+            player.letters_left &= ~rewarded
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug(
+                    "Random letter rewarded: %s",
+                    chr(alphabet.first + rewarded.bit_length() - 1),
+                    extra={"player": player.id},
+                )
+        player.mark_dirty("letters_left")
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(
+                "letters_left=%s",
+                " ".join(map(chr, alphabet.codes(player.letters_left))),
+                extra={"player": player.id},
+            )
+        if not player.letters_left:
             player.lives_left += 1
             player.letters_left = self.config.all_letters
 
@@ -180,12 +334,23 @@ class WikiGame(WSGame):
         winner = gs.last_player_to_answer
         gs.players = {}
         gs.last_player_to_answer = None
+        self.turns = None
         if winner is not None:
             await self.send_to_all({"type": SWMSG.EndGame, "winner": winner.to_json()})
 
     def particles_dict_for(self, diff: Difficulty) -> List[str]:
         return self.ww.by_difficulty[diff]
 
+    def pick_particle(self, diff: Difficulty) -> str:
+        """Random particle that still has at least `diff` unused words containing it."""
+        particle = None
+        if self.ww.index is not None:
+            particle = self.ww.index.pick(self.game_state.particle_usage, diff.value)
+        if particle is None:
+            # Fall back to the static particle counts of the dictionary
+            particle = random.choice(self.particles_dict_for(diff))
+        return particle
+
     def is_guess_correct(self, guess: str) -> bool:
         return (
             len(guess) >= MIN_PARTICLE_LENGTH
@@ -207,8 +372,7 @@ class WikiGame(WSGame):
     async def start_game(self) -> None:
         gs = self.game_state
         gs.desc = GameStateDesc.Starting
-        gs.start_timer = TIME_UNTIL_START
-        pdict = self.particles_dict_for(Difficulty.MIN_500)
+        gs.start_timer = self.config.time_until_start
 
         # Starting timer
         await self.notify_of_su("desc", "start_timer")
@@ -221,48 +385,66 @@ class WikiGame(WSGame):
         await self.notify_of_su("desc")
         gs.last_player_to_answer = None
 
-        alive_players = init_alive_players_list(gs.players)
-        pit = players_list_iter(self.config, alive_players)
+        self.turns = TurnOrder(
+            gs.players.values(), self.config.min_players_to_start_game
+        )
+        await self.play()
+
+    async def play(
+        self, resumed: Optional[PlayerInfo] = None, remaining: float = 0.0
+    ) -> None:
+        """Take the turns until the game ends.
 
+        `resumed` is the player whose turn was interrupted by a restart, their
+        turn goes on for the `remaining` seconds first.
+        """
+        gs = self.game_state
+        assert self.turns is not None
         try:
+            if resumed is not None:
+                self.turn.start(remaining)
+                result = await self.turn.wait()
+                if result == TurnResult.TimedOut and resumed.lives_left > 0:
+                    resumed.lives_left -= 1
             while gs.desc == GameStateDesc.Playing:
                 # Process current turn
                 try:
-                    player = next(pit)
+                    player = next(self.turns)
                 except StopIteration:
                     break
-                player_id = player.id
                 gs.last_player_to_answer = player
+                if self.turns.finished:
+                    # The only player left is the winner
+                    break
+                player_id = player.id
                 player.input = ""
-                logger.debug("Processing player {}".format(player.nickname))
-                particle = random.choice(pdict)
+                # Inputs of the previous turn that are still pending are stale
+                self.input_relay.clear()
+                self.log.debug("Turn of %s", player.nickname, extra={"player": player_id})
+                particle = self.pick_particle(Difficulty.MIN_500)
                 # logger.debug("Guessing {}".format(correct_guess))
-                time_end = datetime.now() + timedelta(seconds=TIME_TO_ANSWER)
                 gs.whos_turn = player_id
                 gs.particle = particle
+                gs.guess_correct = False
+                self.turn.start(self.config.time_to_answer)
                 await self.notify_of_su("whos_turn", "particle", "players")
-                while True:
-                    if gs.guess_correct:
-                        gs.guess_correct = False
-                        break
-                    curr_time = datetime.now()
-                    out_of_time = curr_time >= time_end
-                    if out_of_time:
-                        if player.lives_left > 0:
-                            player.lives_left -= 1
-                        break
-                    await asyncio.sleep(TICK_DURATION)
+                # Resolved by a correct guess, or by the loop at the deadline
+                result = await self.turn.wait()
+                if result == TurnResult.TimedOut and player.lives_left > 0:
+                    player.lives_left -= 1
             # Game ended
             await self.end_game()
-        except Exception as e:
-            logger.error(f"Error during start_game() loop: {e.__repr__()}")
+        except Exception:
+            self.log.exception("Error during play() loop")
+        finally:
+            self.turn.cancel()
 
     async def on_player_joined(self, si: ClientInfo, parsed: Message) -> None:
         if self.is_game_in_progress():
             await self.send_to_user(si, {"type": SWMSG.GameInProgress})
             return
         nickname = parsed["nickname"]
-        logger.debug("{} is joining".format(nickname))
+        self.log.debug("%s is joining", nickname, extra={"player": si.id})
         ws_id = si.id
         new_player = PlayerInfo(
             self.config,
@@ -271,80 +453,196 @@ class WikiGame(WSGame):
         )
         gs = self.game_state
         gs.players[ws_id] = new_player
+        # Everyone receives the new player in full, so there's nothing to patch
+        new_player.clear_dirty()
         await self.send_to_user(
             si,
             {
                 "type": SWMSG.InitGame,
                 "state": gs.to_json(),
                 "player": new_player.to_json(),
+                "token": self.issue_token(ws_id),
             },
         )
         await self.send_to_others(
             si, {"type": SWMSG.PlayerJoined, "player": new_player.to_json()}
         )
 
-        # If we're waiting for players and we have enough players, start the game
-        if self.waiting_for_players() and len(gs.players) >= MIN_PLAYERS_TO_START_GAME:
-            self.game_handle = asyncio.create_task(self.start_game())
-        elif self.starting_the_game():
-            # Stop the starting sequence and restart it
-            assert self.game_handle is not None
-            self.game_handle.cancel()
+        # If we're waiting for players and we have enough players, start the game,
+        # if it's starting, restart the starting sequence. The task sets the state
+        # only once it runs, so a start scheduled by a previous join is cancelled too
+        if self.starting_the_game() or (
+            self.waiting_for_players()
+            and len(gs.players) >= self.config.min_players_to_start_game
+        ):
+            if self.game_handle is not None:
+                self.game_handle.cancel()
             self.game_handle = asyncio.create_task(self.start_game())
 
+    async def on_player_resumed(self, si: ClientInfo) -> None:
+        player = self.game_state.players.get(si.id, None)
+        if player is None:
+            return
+        await self.send_to_user(
+            si,
+            {
+                "type": SWMSG.InitGame,
+                "state": self.game_state.to_json(),
+                "player": player.to_json(),
+                "token": self.tokens[si.id],
+            },
+        )
+
+    async def on_spectator_joined(self, si: ClientInfo) -> None:
+        state = self.game_state.to_json()
+        await self.send_to_user(
+            si, {"type": SWMSG.InitGame, "state": state, "player": None}
+        )
+
     async def on_player_input(self, si: ClientInfo, parsed: Message) -> None:
         # Can't update input if not your turn
         gs = self.game_state
         if si.id != gs.whos_turn:
-            logger.warning(
-                f"Player #{si.id} tried to update input during #{gs.whos_turn} player's turn"
+            self.log.warning(
+                "Input update during the turn of %s",
+                gs.whos_turn,
+                extra={"player": si.id, "event": "input"},
+            )
+            return
+        limit = self.input_limits.get(si.id, None)
+        if limit is None:
+            limit = self.input_limits[si.id] = TokenBucket(
+                self.config.client_input_rate, self.config.client_input_burst
+            )
+        if not limit.take():
+            inputs_dropped.inc(self.game)
+            self.log.warning(
+                "Input update over the rate limit",
+                extra={"player": si.id, "event": "input_rate"},
             )
             return
         player = gs.players[si.id]
         player.input = parsed["input"]
-        await self.send_to_all(
-            {"type": SWMSG.UserInput, "id": player.id, "input": player.input}
-        )
+        self.log.debug("Input updated", extra={"player": si.id, "event": "input"})
+        self.input_relay.push(player.id, player.input)
+
+    def relay_input(self, pid: PlayerId, value: str) -> None:
+        self.broadcast({"type": SWMSG.UserInput, "id": pid, "input": value})
 
     async def on_player_submit(self, si: ClientInfo, parsed: Message) -> None:
         # Can't submit guess if not your turn
         gs = self.game_state
         if si.id != gs.whos_turn:
-            logger.warning(
-                f"Player #{si.id} tried to submit guess during #{gs.whos_turn} player's turn"
+            self.log.warning(
+                "Guess submitted during the turn of %s",
+                gs.whos_turn,
+                extra={"player": si.id, "event": "submit"},
             )
             return
+        if not self.turn.pending:
+            # The turn has already ended, but the next one hasn't started yet
+            return
         player = gs.players[si.id]
         guess = parsed["guess"]
         gs.guess_correct = self.is_guess_correct(guess)
         if gs.guess_correct:
-            logger.debug(f"Correct guess: {guess}")
+            self.log.debug("Correct guess: %s", guess, extra={"player": si.id})
             await self.correct_guess(player, guess)
+            self.turn.resolve(TurnResult.Answered)
         else:
             await self.wrong_guess(player)
 
-    async def handle_msg(self, si: ClientInfo, _type: CWMSG, msg: Message) -> None:
-        f = self.ws_handlers_mapping.get(_type, None)
-        if f is None:
-            logger.warning("Unknown message type received from client: {}".format(msg))
-        else:
-            await f(si, msg)
-
-    async def remove_player(self, pid: PlayerId, si: ClientInfo) -> None:
+    async def remove_player(self, pid: PlayerId, si: Optional[ClientInfo]) -> None:
         gs = self.game_state
+        self.input_relay.drop(pid)
+        self.input_limits.pop(pid, None)
         if pid in gs.players:
             del gs.players[pid]
-            await self.send_to_others(si, {"type": SWMSG.RemovePlayer, "id": pid})
-            if len(gs.players) < MIN_PLAYERS_TO_START_GAME:
+            if self.turns is not None:
+                self.turns.remove(pid)
+            if pid == gs.whos_turn:
+                self.turn.resolve(TurnResult.Skipped)
+            self.broadcast({"type": SWMSG.RemovePlayer, "id": pid}, exclude=pid)
+            if len(gs.players) < self.config.min_players_to_start_game:
                 await self.end_game()
                 if self.game_handle is not None:
                     self.game_handle.cancel()
 
+    def describe(self) -> Dict[str, Any]:
+        return {
+            **super().describe(),
+            "players": len(self.game_state.players),
+            "desc": self.game_state.desc,
+        }
+
+    async def close(self) -> None:
+        if self.game_handle is not None:
+            self.game_handle.cancel()
+        self.input_relay.clear()
+        await super().close()
+
+    def snapshot(self, w: SnapshotWriter) -> None:
+        super().snapshot(w)
+        gs = self.game_state
+        w.u8(gs.desc)
+        w.i32(gs.start_timer)
+        w.u32(gs.version)
+        w.string(gs.whos_turn or "")
+        w.string(gs.particle or "")
+        last = gs.last_player_to_answer
+        w.string(last.id if last is not None else "")
+        w.f64(self.turn.remaining())
+        w.u32(len(gs.players))
+        for player in gs.players.values():
+            w.string(player.id)
+            w.string(player.nickname)
+            w.i32(player.lives_left)
+            w.u32(player.letters_left)
+        # The rotation, from the player of the next turn
+        order: List[PlayerInfo] = []
+        if gs.desc == GameStateDesc.Playing and self.turns is not None:
+            order = self.turns.order()
+        w.strings(p.id for p in order)
+        w.words(gs.used_words)
+
+    async def restore(self, r: SnapshotReader) -> None:
+        await super().restore(r)
+        gs = self.game_state
+        gs.desc = GameStateDesc(r.u8())
+        gs.start_timer = r.i32()
+        gs.version = r.u32()
+        gs.whos_turn = r.string() or None
+        gs.particle = r.string() or None
+        last = r.string()
+        remaining = r.f64()
+        for _ in range(r.u32()):
+            player = PlayerInfo(self.config, id=r.string(), nickname=r.string())
+            player.lives_left = r.i32()
+            player.letters_left = r.u32()
+            player.clear_dirty()
+            gs.players[player.id] = player
+        order = [gs.players[pid] for pid in r.strings()]
+        gs.used_words = set(r.words())
+        if self.ww.index is not None:
+            for word in gs.used_words:
+                self.ww.index.mark_used(gs.particle_usage, word)
+        gs.last_player_to_answer = gs.players.get(last, None)
+        gs.clear_dirty()
+        if gs.desc == GameStateDesc.Playing:
+            self.turns = TurnOrder(order, self.config.min_players_to_start_game)
+            resumed = gs.players.get(gs.whos_turn or "", None)
+            self.game_handle = asyncio.create_task(self.play(resumed, remaining))
+        elif gs.desc == GameStateDesc.Starting:
+            # The countdown starts over
+            self.game_handle = asyncio.create_task(self.start_game())
+
+
+def create_room(room_id: RoomId, options: RoomOptions) -> WordsGame:
+    return WordsGame(room_id, config_from_options(options), shared_dictionary())
 
-wiki_game = WikiGame()
 
+rooms: RoomManager[WordsGame] = RoomManager(create_room)
 
-@routes.get("/words/")
-async def words_game(request: Request) -> WebSocketResponse:
-    """This route handles the words WebSocket API."""
-    return await wiki_game.handle_req(request)
+# This registers the words WebSocket API (`/words/`, `/words/{room_id}/`)
+# and the lobby API (`/words/rooms/`)
+add_room_routes(routes, "/words", rooms)
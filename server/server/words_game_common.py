@@ -1,13 +1,21 @@
-from dataclasses import asdict, dataclass, field
+import random
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field
 from enum import Enum, IntEnum
-from typing import Dict, List, Set, Any
+from typing import Collection, Dict, List, Optional, Sequence, Any
 
+from server.input_relay import CLIENT_INPUT_BURST, CLIENT_INPUT_RATE, RELAY_RATE
 from server.lang import Language
+from server.particle_index import ParticleIndex
+from server.state_diff import DirtyTracking
 from server.ws_game import ClientId
 
 PlayerId = ClientId
+# Code point of a letter
 Letter = int
-Letters = Set[Letter]
+# Bitmask of the letters of an alphabet, see `Alphabet`
+Letters = int
 
 
 class WordsGameConfig:
@@ -16,18 +24,42 @@ class WordsGameConfig:
     lives_initial: int
     min_players_to_start_game: int
     lang: Language
+    alphabet: "Alphabet"
     all_letters: Letters
+    # Seconds of the countdown before the game starts
+    time_until_start: int
+    # Seconds a player has to answer during their turn
+    time_to_answer: int
+    # Input updates relayed to the room per second
+    input_rate: float
+    # Input updates a client may send per second, and in a burst
+    client_input_rate: float
+    client_input_burst: int
 
     def __init__(
-        self, lang: Language, lives_initial: int, min_players_to_start_game: int
+        self,
+        lang: Language,
+        lives_initial: int,
+        min_players_to_start_game: int,
+        time_until_start: int = 10,
+        time_to_answer: int = 15,
+        input_rate: float = RELAY_RATE,
+        client_input_rate: float = CLIENT_INPUT_RATE,
+        client_input_burst: int = CLIENT_INPUT_BURST,
     ) -> None:
         self.lang = lang
         self.lives_initial = lives_initial
         self.min_players_to_start_game = min_players_to_start_game
-        self.all_letters = letters_for_lang(lang)
+        self.alphabet = alphabet_for_lang(lang)
+        self.all_letters = self.alphabet.all
+        self.time_until_start = time_until_start
+        self.time_to_answer = time_to_answer
+        self.input_rate = input_rate
+        self.client_input_rate = client_input_rate
+        self.client_input_burst = client_input_burst
 
 
-class PlayerInfo:
+class PlayerInfo(DirtyTracking):
     """Information on the current player state."""
 
     id: PlayerId
@@ -44,34 +76,116 @@ class PlayerInfo:
         self.letters_left = config.all_letters
         self.input = ""
 
+    def field_json(self, key: str) -> Any:
+        return getattr(self, key)
+
     def to_json(self) -> Dict[str, Any]:
-        return {
-            **asdict(self),
-            "letters_left": list(self.letters_left),
-        }
+        return {key: self.field_json(key) for key in PLAYER_JSON_KEYS}
+
+    def patch_json(self) -> Optional[Dict[str, Any]]:
+        """Fields changed since the last patch, or None if nothing has changed."""
+        changed = self.take_dirty(PLAYER_JSON_KEYS)
+        if not changed:
+            return None
+        return {key: self.field_json(key) for key in changed}
+
+
+PLAYER_JSON_KEYS = ("id", "nickname", "input", "lives_left", "letters_left")
 
 
 PlayersById = Dict[PlayerId, PlayerInfo]
 
 
-def letters_in_range(lstart: str, lend: str) -> Letters:
-    letters = set()
-    for i in range(ord(lstart), ord(lend) + 1):
-        letters.add(i)
-    return letters
+class Alphabet:
+    """Consecutive letters of a language. Sets of its letters are bitmasks,
+    bit i standing for the letter `first + i`.
+    """
+
+    first: Letter
+    size: int
+    # Every letter
+    all: Letters
+    # Code points of the letters, in order
+    letters: List[Letter]
+
+    def __init__(self, lstart: str, lend: str) -> None:
+        self.first = ord(lstart)
+        self.size = ord(lend) - self.first + 1
+        # Masks are stored as uint32 in compiled dictionaries
+        assert self.size <= 32
+        self.all = (1 << self.size) - 1
+        self.letters = list(range(self.first, self.first + self.size))
+
+    def mask(self, word: str) -> Letters:
+        """Letters of the alphabet in the word, other characters are ignored."""
+        letters = 0
+        for ch in word:
+            i = ord(ch) - self.first
+            if 0 <= i < self.size:
+                letters |= 1 << i
+        return letters
+
+    def codes(self, letters: Letters) -> List[Letter]:
+        return [self.first + i for i in range(self.size) if letters >> i & 1]
+
+    def random_letter(
+        self, letters: Letters, rng: Optional[random.Random] = None
+    ) -> Letters:
+        """Mask of a random letter out of `letters`, which can't be empty."""
+        k = (rng or random).randrange(letters.bit_count())
+        # Narrow down the k-th letter, halving the range of bits every step
+        lo, size = 0, self.size
+        while size > 1:
+            half = size // 2
+            below = (letters >> lo & ((1 << half) - 1)).bit_count()
+            if k < below:
+                size = half
+            else:
+                k -= below
+                lo += half
+                size -= half
+        return 1 << lo
+
+
+class WordLetters:
+    """Letter masks of the dictionary words, by word id."""
+
+    alphabet: Alphabet
+    # Sorted words, the ids are positions in it
+    words: Sequence[str]
+    # An array, or a memory-mapped section of a compiled dictionary
+    masks: Sequence[int]
+
+    def __init__(
+        self, alphabet: Alphabet, words: Sequence[str], masks: Sequence[int]
+    ) -> None:
+        self.alphabet = alphabet
+        self.words = words
+        self.masks = masks
+
+    @classmethod
+    def build(cls, alphabet: Alphabet, words: Sequence[str]) -> "WordLetters":
+        return cls(alphabet, words, array("I", map(alphabet.mask, words)))
+
+    def mask(self, word: str) -> Letters:
+        # utf-8 bytes sort like code points, so compiled words bisect as strings too
+        i = bisect_left(self.words, word)
+        if i < len(self.words) and self.words[i] == word:
+            return self.masks[i]
+        return self.alphabet.mask(word)
 
 
-lang_to_letters = {
-    Language.Russian: letters_in_range("а", "я"),
-    Language.English: letters_in_range("a", "z"),
+lang_to_alphabet = {
+    Language.Russian: Alphabet("а", "я"),
+    Language.English: Alphabet("a", "z"),
 }
 
 
-def letters_for_lang(lang: Language) -> Letters:
-    letters = lang_to_letters.get(lang, None)
-    if letters is None:
+def alphabet_for_lang(lang: Language) -> Alphabet:
+    alphabet = lang_to_alphabet.get(lang, None)
+    if alphabet is None:
         raise Exception(f"Language {lang} is not available")
-    return letters
+    return alphabet
 
 
 class Difficulty(Enum):
@@ -89,13 +203,18 @@ ParticleDict = Dict[str, int]
 class WordGameDict:
     """Loaded game dictionary."""
 
-    words: Set[str] = field(default_factory=lambda: set())
+    # Set of words, or MappedWords of a compiled dictionary
+    words: Collection[str] = field(default_factory=lambda: set())
     particles: ParticleDict = field(default_factory=lambda: {})
     particle_keys: List[str] = field(default_factory=lambda: [])
     by_difficulty: Dict[Difficulty, List[str]] = field(default_factory=lambda: {})
+    # Words containing each particle
+    index: Optional[ParticleIndex] = None
+    # Letters of each word
+    letters: Optional[WordLetters] = None
 
 
-class CWMSG:
+class CWMSG(IntEnum):
     """Client messages."""
 
     Joining = 0
@@ -103,7 +222,7 @@ class CWMSG:
     SubmitGuess = 2
 
 
-class SWMSG:
+class SWMSG(IntEnum):
     """Server messages."""
 
     InitGame = 0
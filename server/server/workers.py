@@ -0,0 +1,245 @@
+"""Multi-process mode: a supervisor forks workers that share the listening port.
+
+Every worker listens on the public port with SO_REUSEPORT, so the kernel
+spreads the connections over them, and on an internal port of its own. Each
+room lives on a single worker picked by the hash of its id. A worker that
+gets a connection for a room it doesn't own proxies it to the owner through
+the internal port, so the state of a room is never shared between processes.
+"""
+import asyncio
+import os
+import signal
+import time
+import zlib
+from typing import AsyncIterator, Callable, Dict, List, Optional, Union
+
+import aiohttp
+from aiohttp import web
+from aiohttp.http_websocket import WSCloseCode
+from aiohttp.web_request import Request
+
+from server.codec import protocols
+from server.logger import logger, stop_loggers
+
+# Settings
+INTERNAL_HOST = "127.0.0.1"
+# Seconds to wait before restarting a worker that has died
+RESTART_DELAY = 1.0
+# Marks the requests proxied between the workers
+FORWARDED_HEADER = "X-Room-Forwarded"
+
+
+class Cluster:
+    """The workers of the server, and which one owns each room.
+
+    A single process owns every room, which is the default.
+    """
+
+    # Index of this worker and number of workers
+    index: int
+    size: int
+    # Internal port of each worker
+    ports: List[int]
+    session: Optional[aiohttp.ClientSession]
+
+    def __init__(self) -> None:
+        self.index = 0
+        self.size = 1
+        self.ports = []
+        self.session = None
+
+    def configure(self, size: int, internal_port: int) -> None:
+        self.size = size
+        self.ports = [internal_port + i for i in range(size)]
+
+    def owner(self, room_id: str) -> int:
+        return zlib.crc32(room_id.encode("utf-8")) % self.size
+
+    def owns(self, room_id: str) -> bool:
+        return self.owner(room_id) == self.index
+
+    def url(self, index: int, path: str) -> str:
+        return f"http://{INTERNAL_HOST}:{self.ports[index]}{path}"
+
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers={FORWARDED_HEADER: str(self.index)}
+            )
+        return self.session
+
+    async def lifecycle(self, app: web.Application) -> AsyncIterator[None]:
+        """Closes the session between the workers, to be added to `app.cleanup_ctx`."""
+        yield
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+cluster = Cluster()
+
+
+def is_forwarded(request: Request) -> bool:
+    """Whether another worker has passed the request on.
+
+    Only trusted on the internal port, clients can send the header to the
+    public one too.
+    """
+    if FORWARDED_HEADER not in request.headers or not cluster.ports:
+        return False
+    if request.transport is None:
+        return False
+    sockname = request.transport.get_extra_info("sockname")
+    return (
+        isinstance(sockname, tuple) and sockname[1] == cluster.ports[cluster.index]
+    )
+
+
+async def proxy_request(request: Request, index: int) -> web.Response:
+    """Pass an HTTP request on to another worker."""
+    async with cluster.get_session().request(
+        request.method,
+        cluster.url(index, request.path_qs),
+        data=await request.read() if request.can_read_body else None,
+        headers={"Content-Type": request.content_type},
+    ) as resp:
+        return web.Response(
+            status=resp.status,
+            body=await resp.read(),
+            content_type=resp.content_type,
+        )
+
+
+async def gather_json(path: str) -> List[object]:
+    """JSON responses of the other workers to a GET of `path`."""
+
+    async def get(index: int) -> object:
+        async with cluster.get_session().get(cluster.url(index, path)) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    others = [i for i in range(cluster.size) if i != cluster.index]
+    return list(await asyncio.gather(*(get(i) for i in others)))
+
+
+AnyWebSocket = Union[aiohttp.ClientWebSocketResponse, web.WebSocketResponse]
+
+
+async def _pump(source: AnyWebSocket, dest: AnyWebSocket) -> None:
+    async for msg in source:
+        if msg.type == aiohttp.WSMsgType.TEXT:
+            await dest.send_str(msg.data)
+        elif msg.type == aiohttp.WSMsgType.BINARY:
+            await dest.send_bytes(msg.data)
+
+
+async def proxy_websocket(request: Request, index: int) -> web.WebSocketResponse:
+    """Relay a WebSocket connection to the worker owning its room."""
+    ws = web.WebSocketResponse(protocols=protocols())
+    await ws.prepare(request)
+    try:
+        upstream = await cluster.get_session().ws_connect(
+            cluster.url(index, request.path_qs),
+            protocols=(ws.ws_protocol,) if ws.ws_protocol else (),
+        )
+    except aiohttp.ClientError as e:
+        logger.warning("Can't reach worker %s: %r", index, e)
+        await ws.close(code=WSCloseCode.TRY_AGAIN_LATER, message=b"Try again later")
+        return ws
+    async with upstream:
+        pumps = [
+            asyncio.create_task(_pump(ws, upstream)),
+            asyncio.create_task(_pump(upstream, ws)),
+        ]
+        try:
+            # Either side closing ends the connection
+            await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for pump in pumps:
+                pump.cancel()
+    await ws.close()
+    return ws
+
+
+async def _serve_worker(
+    app: web.Application, host: str, port: int, internal_port: int
+) -> None:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port, reuse_port=True).start()
+    await web.TCPSite(runner, INTERNAL_HOST, internal_port).start()
+    logger.info("Worker %s listening on %s:%s", cluster.index, host, port)
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        await runner.cleanup()
+
+
+def run_workers(
+    create_app: Callable[[], web.Application],
+    host: str,
+    port: int,
+    n_workers: int,
+    internal_port: int,
+    preload: Callable[[], object] = lambda: None,
+) -> None:
+    """Fork `n_workers` workers and restart them if they die, until SIGTERM or SIGINT.
+
+    `preload` runs before forking, so what it loads is shared by the workers
+    until they write to it.
+    """
+    cluster.configure(n_workers, internal_port)
+    preload()
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid:
+            children[pid] = index
+            return
+        # Worker process, never returns to the supervisor loop
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            cluster.index = index
+            asyncio.run(
+                _serve_worker(create_app(), host, port, cluster.ports[index])
+            )
+        except BaseException:
+            logger.exception("Worker %s failed", index)
+            code = 1
+        finally:
+            stop_loggers()
+            os._exit(code)
+
+    def stop(signum: int, frame: object) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(n_workers):
+        spawn(index)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid)
+        if stopping:
+            continue
+        logger.error(
+            "Worker %s exited with status %s, restarting",
+            index,
+            os.waitstatus_to_exitcode(status),
+        )
+        time.sleep(RESTART_DELAY)
+        spawn(index)
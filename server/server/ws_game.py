@@ -1,7 +1,10 @@
-import json
-from dataclasses import dataclass
+import asyncio
+import secrets
+import uuid
+from enum import IntEnum
+from dataclasses import dataclass, field
 from typing import Any, Dict
-from typing import Callable, Dict, List, Optional, Set, Any, Coroutine
+from typing import Callable, Dict, List, Optional, Set, Any, Coroutine, Type
 
 import aiohttp
 from aiohttp import web
@@ -9,7 +12,18 @@ from aiohttp.http_websocket import WSCloseCode, WSMessage
 from aiohttp.web_request import Request
 from aiohttp.web_ws import WebSocketResponse
 
-from server.logger import logger
+from server.backplane import Backplane
+from server.broadcast import Outbox
+from server.codec import Codec, CodecError, Frame, codec_for, protocols
+from server.logger import ContextLogger, room_logger
+from server.snapshot import SnapshotReader, SnapshotWriter
+from server.metrics import (
+    broadcast_seconds,
+    handler_seconds,
+    message_name,
+    messages_received,
+    messages_sent,
+)
 
 ClientId = str
 Message = Dict[str, Any]
@@ -19,89 +33,306 @@ Message = Dict[str, Any]
 class ClientInfo:
     id: ClientId
     socket: WebSocketResponse
+    # Encoding negotiated by the client
+    codec: Codec = field(default_factory=lambda: codec_for(None))
+    # Receives the messages of the room but doesn't take part in the game
+    spectator: bool = False
+    outbox: Outbox = field(init=False)
 
-    async def send_json(self, msg: Message) -> None:
-        await self.socket.send_json(msg)
+    def __post_init__(self) -> None:
+        self.outbox = Outbox(self.socket)
+
+    def push(self, frame: Frame) -> bool:
+        """Queue an already serialized message for sending."""
+        return self.outbox.push(frame)
+
+    async def send(self, msg: Message) -> None:
+        self.push(self.codec.encode(msg))
+
+    async def close(self, reason: bytes) -> None:
+        """Disconnect the client, which can connect again later."""
+        await self.socket.close(code=WSCloseCode.TRY_AGAIN_LATER, message=reason)
+
+
+class RemoteClient(ClientInfo):
+    """Client connected to another node, reached through the backplane of the room."""
+
+    room: "WSGame"
+    # Messages of the client waiting to be handled, None once it has left
+    inbox: "asyncio.Queue[Optional[Message]]"
+
+    def __init__(self, id: ClientId, room: "WSGame", spectator: bool = False) -> None:
+        # No socket here, the node of the client writes to it
+        self.id = id
+        self.room = room
+        self.spectator = spectator
+        self.inbox = asyncio.Queue()
+
+    def push(self, frame: Frame) -> bool:
+        raise TypeError("Remote clients are sent messages, not frames")
+
+    async def send(self, msg: Message) -> None:
+        self.room.publish({"msg": msg, "to": self.id})
+
+    async def close(self, reason: bytes) -> None:
+        self.room.publish({"close": True, "to": self.id, "reason": reason.decode()})
 
 
 MessageHandler = Callable[[ClientInfo, Message], Coroutine[Any, Any, Any]]
 
 
 class WSGame:
+    room_id: str
     clients: Dict[ClientId, ClientInfo]
+    # Clients of the room connected to other nodes
+    remote_clients: Dict[ClientId, RemoteClient]
+    # Relays the messages of the room to the other nodes, set by the room manager
+    backplane: Optional[Backplane] = None
+    channel = ""
+    # Adds the room id to the log records
+    log: ContextLogger
+    # Handlers of the client messages, by message type
+    ws_handlers_mapping: Dict[Any, MessageHandler]
+    # Name of the game and its message types, for the metrics
+    game = "ws"
+    client_messages: Optional[Type[IntEnum]] = None
+    server_messages: Optional[Type[IntEnum]] = None
+    # Secret tokens the players can resume their session with, by player
+    tokens: Dict[ClientId, str]
+    # Players of a restored room who haven't resumed their session yet
+    absent: Set[ClientId]
 
-    # Auto-incremented client id
-    __player_id = 0
-
-    def __init__(self) -> None:
+    def __init__(self, room_id: str) -> None:
+        self.room_id = room_id
         self.clients = {}
+        self.remote_clients = {}
+        self.log = room_logger(room_id)
+        self.ws_handlers_mapping = {}
+        self.tokens = {}
+        self.absent = set()
 
     def next_player_id(self) -> ClientId:
-        # TODO: Use uuid?
-        self.__player_id += 1
-        return str(self.__player_id)
+        # Random, so the ids stay unique when a room is restored after a restart
+        return uuid.uuid4().hex[:8]
+
+    def issue_token(self, pid: ClientId) -> str:
+        token = self.tokens[pid] = secrets.token_urlsafe(16)
+        return token
+
+    def find_absent(self, token: Optional[str]) -> Optional[ClientId]:
+        """Id of the absent player the token belongs to."""
+        if not token:
+            return None
+        for pid in self.absent:
+            if secrets.compare_digest(self.tokens.get(pid, ""), token):
+                return pid
+        return None
+
+    def resume(self, token: Optional[str]) -> Optional[ClientId]:
+        """Id of the absent player the token belongs to, who is no longer absent."""
+        pid = self.find_absent(token)
+        if pid is not None:
+            self.absent.discard(pid)
+        return pid
+
+    async def resume_player(self, token: Optional[str]) -> Optional[ClientId]:
+        """Id of the player resuming their session with the token, if any."""
+        return self.resume(token)
 
     def is_user_connected(self, pid: ClientId) -> bool:
         return self.clients.get(pid, None) is not None
 
+    def publish(self, envelope: Message) -> None:
+        if self.backplane is not None:
+            self.backplane.publish(self.channel, envelope)
+
+    def broadcast(self, msg: Message, exclude: Optional[ClientId] = None) -> None:
+        """Serialize the message once per codec and queue it for every client but `exclude`.
+
+        The clients of the other nodes get it once per node through the backplane.
+        """
+        if self.remote_clients:
+            self.publish({"msg": msg, "exclude": exclude})
+        with broadcast_seconds.time(self.game):
+            frames: Dict[str, Frame] = {}
+            sent = 0
+            for _id, client in list(self.clients.items()):
+                if _id != exclude:
+                    codec = client.codec
+                    frame = frames.get(codec.name, None)
+                    if frame is None:
+                        frame = frames[codec.name] = codec.encode(msg)
+                    client.push(frame)
+                    sent += 1
+        if sent:
+            messages_sent.inc(
+                self.game, message_name(self.server_messages, msg["type"]), amount=sent
+            )
+
     async def send_to_all(self, msg: Message) -> None:
-        for _, client in self.clients.items():
-            await client.send_json(msg)
+        self.broadcast(msg)
 
     async def send_to_others(self, si: ClientInfo, msg: Message) -> None:
-        cuid = si.id
-        for _id, client in self.clients.items():
-            if _id != cuid:
-                await client.send_json(msg)
+        self.broadcast(msg, exclude=si.id)
 
     async def send_to_user(self, si: ClientInfo, msg: Message) -> Any:
-        return await si.socket.send_json(msg)
+        messages_sent.inc(self.game, message_name(self.server_messages, msg["type"]))
+        return await si.send(msg)
 
-    async def handle_req(self, request: Request) -> WebSocketResponse:
-        ws = web.WebSocketResponse()
+    async def handle_req(
+        self, request: Request, spectator: bool = False
+    ) -> WebSocketResponse:
+        ws = web.WebSocketResponse(protocols=protocols())
         ready = ws.can_prepare(request=request)
         if not ready:
             await ws.close(code=WSCloseCode.PROTOCOL_ERROR)
         await ws.prepare(request)
-        pid = self.next_player_id()
-        logger.info("preparing connection for id={}".format(pid))
+        resumed = None
+        if not spectator:
+            resumed = await self.resume_player(request.query.get("resume", None))
+        pid = resumed if resumed is not None else self.next_player_id()
+        self.log.info("Preparing connection", extra={"player": pid})
         # TODO: Maybe also check username?
         if self.is_user_connected(pid):
-            logger.warning("User id={} already connected, disconnecting.".format(pid))
+            self.log.warning("Already connected, disconnecting", extra={"player": pid})
             await ws.close(
                 code=WSCloseCode.TRY_AGAIN_LATER, message=b"Already connected"
             )
             return ws
         # Add user to the client list
-        si = ClientInfo(id=pid, socket=ws)
-        self.clients[pid] = si
+        si = ClientInfo(
+            id=pid, socket=ws, codec=codec_for(ws.ws_protocol), spectator=spectator
+        )
         try:
+            await self.add_client(si)
+            if resumed is not None:
+                await self.on_player_resumed(si)
             # Handle client messages until disconnects
             async for msg in ws:
                 if not isinstance(msg, WSMessage):
                     continue
-                if msg.type == aiohttp.WSMsgType.TEXT:
-                    parsed = json.loads(msg.data)
-                    _type = parsed["type"]
-                    await self.handle_msg(si, _type, parsed)
+                if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    if spectator:
+                        continue
+                    try:
+                        parsed = si.codec.decode(msg.data)
+                    except CodecError as e:
+                        self.log.warning(
+                            "Malformed message: %s",
+                            e,
+                            extra={"player": pid, "event": "malformed_message"},
+                        )
+                        continue
+                    await self.handle_msg(si, parsed["type"], parsed)
                 elif msg.type == aiohttp.WSMsgType.ERROR:
-                    logger.error(
-                        "ws connection closed with exception %s" % ws.exception()
+                    self.log.error(
+                        "ws connection closed with exception %s",
+                        ws.exception(),
+                        extra={"player": pid},
                     )
         finally:
             # When a connection is stopped, get rid of the client socket
             await self.remove_client(si)
             # Remove the player from the game
-            await self.remove_player(si.id, si)
+            if not spectator:
+                await self.remove_player(si.id, si)
+                self.tokens.pop(si.id, None)
         return ws
 
+    async def serve_remote(self, client: RemoteClient, resumed: bool = False) -> None:
+        """Handle the messages of a client of another node until it leaves."""
+        try:
+            if client.spectator:
+                await self.on_spectator_joined(client)
+            elif resumed:
+                await self.on_player_resumed(client)
+            while True:
+                msg = await client.inbox.get()
+                if msg is None:
+                    break
+                if not client.spectator:
+                    await self.handle_msg(client, msg["type"], msg)
+        finally:
+            self.remote_clients.pop(client.id, None)
+            if not client.spectator:
+                await self.remove_player(client.id, client)
+                self.tokens.pop(client.id, None)
+
+    async def drop_absent(self) -> None:
+        """Remove the players who haven't resumed their session in time."""
+        for pid in list(self.absent):
+            self.absent.discard(pid)
+            self.tokens.pop(pid, None)
+            await self.remove_player(pid, None)
+
+    async def add_client(self, si: ClientInfo) -> None:
+        self.clients[si.id] = si
+        if si.spectator:
+            await self.on_spectator_joined(si)
+
     async def remove_client(self, si: ClientInfo) -> None:
         pid = si.id
+        si.outbox.close()
         if self.clients.get(pid, None) is not None:
             del self.clients[pid]
 
+    def is_empty(self) -> bool:
+        return not self.clients and not self.remote_clients and not self.absent
+
+    def describe(self) -> Dict[str, Any]:
+        """Short summary of the room for lobby listings."""
+        return {
+            "id": self.room_id,
+            "clients": len(self.clients) + len(self.remote_clients),
+        }
+
+    async def close(self) -> None:
+        """Disconnect every client of the room."""
+        if self.remote_clients:
+            self.publish({"close": True})
+            for remote in self.remote_clients.values():
+                remote.inbox.put_nowait(None)
+        for client in list(self.clients.values()):
+            await client.socket.close(
+                code=WSCloseCode.GOING_AWAY, message=b"Room closed"
+            )
+
     async def handle_msg(self, si: ClientInfo, _type: Any, msg: Message) -> None:
+        f = self.ws_handlers_mapping.get(_type, None)
+        name = message_name(self.client_messages, _type) if f else "unknown"
+        messages_received.inc(self.game, name)
+        if f is None:
+            self.log.warning(
+                "Unknown message type received from client: %s",
+                msg,
+                extra={"player": si.id, "event": "unknown_message"},
+            )
+            return
+        with handler_seconds.time(self.game, name):
+            await f(si, msg)
+
+    async def on_spectator_joined(self, si: ClientInfo) -> None:
+        """Send the state of the room to a new spectator."""
         pass
 
-    async def remove_player(self, pid: ClientId, si: ClientInfo) -> None:
+    async def on_player_resumed(self, si: ClientInfo) -> None:
+        """Send the state of the room to a player who has resumed their session."""
         pass
+
+    async def remove_player(self, pid: ClientId, si: Optional[ClientInfo]) -> None:
+        """`si` is None for a player who hasn't resumed their session after a restart."""
+        pass
+
+    def snapshot(self, w: SnapshotWriter) -> None:
+        """Write the state of the room, see `server.snapshot`."""
+        w.u32(len(self.tokens))
+        for pid, token in self.tokens.items():
+            w.string(pid)
+            w.string(token)
+
+    async def restore(self, r: SnapshotReader) -> None:
+        """Read the state written by `snapshot`. The players are absent until they resume."""
+        for _ in range(r.u32()):
+            pid = r.string()
+            self.tokens[pid] = r.string()
+            self.absent.add(pid)
@@ -0,0 +1,53 @@
+import asyncio
+
+from server.article_cache import ArticleCache
+from server.wiki_game_common import Article
+
+
+def article(name: str, size: int) -> Article:
+    return Article(
+        title=name, path=f"https://en.wikipedia.org/wiki/{name}", content="x" * size
+    )
+
+
+def test_lru_is_bounded_and_backed_by_disk(tmp_path):
+    async def run():
+        db_path = str(tmp_path / "articles.sqlite3")
+        cache = ArticleCache(db_path, max_bytes=250)
+        await cache.put(article("A", 100), "/wiki/A#History")
+        await cache.put(article("B", 100))
+        await cache.put(article("C", 100))
+        assert cache.memory_bytes <= 250
+        assert list(cache.memory) == ["/wiki/B", "/wiki/C"]
+
+        a = await cache.get("/wiki/A")
+        assert a is not None and a.title == "A"
+        assert await cache.get("/wiki/Missing") is None
+        assert cache.stats()["disk_hits"] == 1
+        assert cache.stats()["misses"] == 1
+        await cache.close()
+
+        # Articles survive a restart
+        restarted = ArticleCache(db_path, max_bytes=250)
+        c = await restarted.get("https://en.wikipedia.org/wiki/C")
+        assert c is not None and c.content == "x" * 100
+        assert (await restarted.get("/wiki/C")) is c
+        assert restarted.stats()["memory_hits"] == 1
+        await restarted.close()
+
+    asyncio.run(run())
+
+
+def test_link_rows_split_aliases(tmp_path):
+    async def run():
+        for db_path in (str(tmp_path / "articles.sqlite3"), None):
+            cache = ArticleCache(db_path)
+            a = article("A", 1)
+            a.links = ["/wiki/B"]
+            await cache.put(a, "/wiki/Special:Random")
+            rows, aliases = await cache.link_rows()
+            assert rows == [("/wiki/A", ["/wiki/B"])]
+            assert aliases == {"/wiki/Special:Random": "/wiki/A"}
+            await cache.close()
+
+    asyncio.run(run())
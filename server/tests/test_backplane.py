@@ -0,0 +1,281 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import server.backplane
+from server.backplane import Broker, MemoryBackplane, MemoryHub, SocketBackplane
+from server.rooms import RoomManager, add_room_routes
+from server.ws_game import WSGame
+
+
+class EchoGame(WSGame):
+    def __init__(self, room_id: str) -> None:
+        super().__init__(room_id)
+        self.ws_handlers_mapping = {0: self.on_echo}
+
+    async def on_echo(self, si, msg):
+        await self.send_to_user(si, {"type": 2, "text": "sent"})
+        self.broadcast({"type": 1, "text": msg["text"]}, exclude=si.id)
+
+    async def on_spectator_joined(self, si):
+        await self.send_to_user(si, {"type": 3, "clients": len(self.clients)})
+
+    async def on_player_resumed(self, si):
+        await self.send_to_user(si, {"type": 4, "id": si.id})
+
+
+def node_app(backplane):
+    routes = web.RouteTableDef()
+    manager = RoomManager(lambda i, o: EchoGame(i), backplane=backplane)
+    add_room_routes(routes, "/relay", manager)
+    app = web.Application()
+    app.add_routes(routes)
+    return app, manager
+
+
+def test_rooms_across_nodes():
+    async def run():
+        hub = MemoryHub()
+        app_a, rooms_a = node_app(MemoryBackplane(hub, node="a"))
+        app_b, rooms_b = node_app(MemoryBackplane(hub, node="b"))
+        async with TestClient(TestServer(app_a)) as a, TestClient(
+            TestServer(app_b)
+        ) as b:
+            local = await a.ws_connect("/relay/abc/")
+            remote = await b.ws_connect("/relay/abc/")
+            spectator = await b.ws_connect("/relay/abc/spectate/")
+            assert await spectator.receive_json() == {"type": 3, "clients": 1}
+            # The room lives on the node that was joined first
+            assert "abc" in rooms_a.rooms and "abc" not in rooms_b.rooms
+
+            await remote.send_json({"type": 0, "text": "hi"})
+            assert await remote.receive_json() == {"type": 2, "text": "sent"}
+            assert await local.receive_json() == {"type": 1, "text": "hi"}
+            assert await spectator.receive_json() == {"type": 1, "text": "hi"}
+            await local.send_json({"type": 0, "text": "yo"})
+            assert await remote.receive_json() == {"type": 1, "text": "yo"}
+            assert await spectator.receive_json() == {"type": 1, "text": "yo"}
+            # Spectators can't play
+            await spectator.send_json({"type": 0, "text": "no"})
+            await remote.send_json({"type": 0, "text": "again"})
+            assert await remote.receive_json() == {"type": 2, "text": "sent"}
+            assert await spectator.receive_json() == {"type": 1, "text": "again"}
+
+            await remote.close()
+            await spectator.close()
+            await local.close()
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+            assert not rooms_a.rooms and not rooms_b.remote_rooms
+            assert not hub.owners
+
+    asyncio.run(run())
+
+
+def test_closing_a_room_of_another_node():
+    async def run():
+        hub = MemoryHub()
+        app_a, rooms_a = node_app(MemoryBackplane(hub, node="a"))
+        app_b, _ = node_app(MemoryBackplane(hub, node="b"))
+        async with TestClient(TestServer(app_a)) as a, TestClient(
+            TestServer(app_b)
+        ) as b:
+            resp = await a.post("/relay/rooms/")
+            room_id = (await resp.json())["id"]
+            remote = await b.ws_connect(f"/relay/{room_id}/")
+            assert (await b.delete(f"/relay/rooms/{room_id}/")).status == 204
+            msg = await remote.receive()
+            assert msg.type == web.WSMsgType.CLOSE
+            assert not rooms_a.rooms
+            assert (await b.delete(f"/relay/rooms/{room_id}/")).status == 404
+
+    asyncio.run(run())
+
+
+def test_resuming_through_another_node():
+    async def run():
+        hub = MemoryHub()
+        app_a, rooms_a = node_app(MemoryBackplane(hub, node="a"))
+        app_b, rooms_b = node_app(MemoryBackplane(hub, node="b"))
+        async with TestClient(TestServer(app_a)) as a, TestClient(
+            TestServer(app_b)
+        ) as b:
+            local = await a.ws_connect("/relay/abc/")
+            room = rooms_a.get("abc")
+            # As restored from a snapshot
+            room.tokens["p1"] = "secret"
+            room.absent.add("p1")
+
+            remote = await b.ws_connect("/relay/abc/", params={"resume": "wrong"})
+            await remote.send_json({"type": 0, "text": "hi"})
+            assert await remote.receive_json() == {"type": 2, "text": "sent"}
+            assert room.absent == {"p1"}
+
+            resumed = await b.ws_connect("/relay/abc/", params={"resume": "secret"})
+            assert await resumed.receive_json() == {"type": 4, "id": "p1"}
+            assert not room.absent and "p1" in room.remote_clients
+            await resumed.send_json({"type": 0, "text": "back"})
+            assert await resumed.receive_json() == {"type": 2, "text": "sent"}
+            assert await local.receive_json() == {"type": 1, "text": "hi"}
+            assert await local.receive_json() == {"type": 1, "text": "back"}
+
+            # The session can't be resumed twice
+            again = await b.ws_connect("/relay/abc/", params={"resume": "secret"})
+            await again.send_json({"type": 0, "text": "again"})
+            assert await again.receive_json() == {"type": 2, "text": "sent"}
+            assert len(room.remote_clients) == 3
+
+            for ws in (again, resumed, remote, local):
+                await ws.close()
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+            assert not rooms_a.rooms and not rooms_b.remote_rooms
+
+    asyncio.run(run())
+
+
+def test_closing_the_rooms_of_a_lost_claim():
+    async def run():
+        backplane = MemoryBackplane(MemoryHub(), node="a")
+        app, rooms = node_app(backplane)
+        async with TestClient(TestServer(app)) as client:
+            ws = await client.ws_connect("/relay/abc/")
+            backplane.claim_lost("relay/other")
+            backplane.claim_lost("relay/abc")
+            msg = await ws.receive()
+            assert msg.type == web.WSMsgType.CLOSE
+            assert not rooms.rooms
+
+    asyncio.run(run())
+
+
+def test_socket_backplane(tmp_path):
+    async def run():
+        address = f"unix:{tmp_path / 'bp.sock'}"
+        broker = Broker()
+        await broker.start(address)
+        a = SocketBackplane(address, node="a")
+        b = SocketBackplane(address, node="b")
+        await a.start()
+        await b.start()
+        received = []
+        b.subscribe("room", received.append)
+        assert await a.claim("room") == "a"
+        assert await b.claim("room") == "a"
+        assert await b.lookup("room") == "a"
+        a.publish("room", {"type": 1})
+        a.publish("other", {"type": 2})
+        a.publish("room", {"type": 3})
+        for _ in range(100):
+            if len(received) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert received == [{"type": 1}, {"type": 3}]
+
+        # The claims of a node are dropped when it disconnects
+        await a.close()
+        await asyncio.sleep(0.05)
+        assert await b.lookup("room") is None
+        assert await b.claim("room") == "b"
+        await b.release("room")
+        assert await b.lookup("room") is None
+        await b.close()
+        await broker.close()
+
+    asyncio.run(run())
+
+
+def test_socket_backplane_reclaims(tmp_path, monkeypatch):
+    monkeypatch.setattr(server.backplane, "RECONNECT_DELAY", 0.2)
+
+    async def run():
+        address = f"unix:{tmp_path / 'bp.sock'}"
+        broker = Broker()
+        await broker.start(address)
+        a = SocketBackplane(address, node="a")
+        b = SocketBackplane(address, node="b")
+        await a.start()
+        await b.start()
+        lost = []
+        a.on_claim_lost(lost.append)
+        assert await a.claim("room") == "a"
+        assert await a.claim("kept") == "a"
+
+        # Another node claims a room while its owner is disconnected
+        a.writer.close()
+        await asyncio.sleep(0.05)
+        assert await b.claim("room") == "b"
+        for _ in range(100):
+            if lost:
+                break
+            await asyncio.sleep(0.01)
+        assert lost == ["room"]
+        assert a.claims == {"kept"}
+        assert await b.lookup("kept") == "a"
+        await a.close()
+        await b.close()
+        await broker.close()
+
+    asyncio.run(run())
+
+
+def test_socket_backplane_handler_failure(tmp_path):
+    async def run():
+        address = f"unix:{tmp_path / 'bp.sock'}"
+        broker = Broker()
+        await broker.start(address)
+        a = SocketBackplane(address, node="a")
+        b = SocketBackplane(address, node="b")
+        await a.start()
+        await b.start()
+        received = []
+
+        def fail(msg):
+            raise ValueError(msg)
+
+        b.subscribe("room", fail)
+        b.subscribe("room", received.append)
+        await b.lookup("room")
+        a.publish("room", {"type": 1})
+        a.publish("room", {"type": 2})
+        for _ in range(100):
+            if len(received) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert received == [{"type": 1}, {"type": 2}]
+        assert b.connected.is_set()
+        await a.close()
+        await b.close()
+        await broker.close()
+
+    asyncio.run(run())
+
+
+def test_broker_drops_slow_nodes(tmp_path, monkeypatch):
+    # Any node with something left to send is too slow
+    monkeypatch.setattr(server.backplane, "MAX_BUFFERED", -1)
+
+    async def run():
+        address = f"unix:{tmp_path / 'bp.sock'}"
+        broker = Broker()
+        await broker.start(address)
+        a = SocketBackplane(address, node="a")
+        b = SocketBackplane(address, node="b")
+        await a.start()
+        await b.start()
+        received = []
+        b.subscribe("room", received.append)
+        assert await b.claim("other") == "b"
+        a.publish("room", {"type": 1})
+        for _ in range(100):
+            if not b.connected.is_set():
+                break
+            await asyncio.sleep(0.01)
+        assert not b.connected.is_set() and not received
+        assert await a.lookup("other") is None
+        await a.close()
+        await b.close()
+        await broker.close()
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+import asyncio
+from typing import Any, List
+
+from server.broadcast import Outbox
+
+
+class FakeSocket:
+    def __init__(self, delay: float = 0) -> None:
+        self.delay = delay
+        self.sent: List[str] = []
+        self.closed = False
+
+    async def send_str(self, data: str) -> None:
+        await asyncio.sleep(self.delay)
+        self.sent.append(data)
+
+    async def close(self, **kwargs: Any) -> None:
+        self.closed = True
+
+
+def test_stalled_client_does_not_block_others():
+    async def run():
+        fast = FakeSocket()
+        stalled = FakeSocket(delay=60)
+        fast_box = Outbox(fast)  # type: ignore
+        stalled_box = Outbox(stalled, send_timeout=0.05)  # type: ignore
+        for i in range(3):
+            stalled_box.push(str(i))
+            fast_box.push(str(i))
+        await asyncio.sleep(0.1)
+        assert fast.sent == ["0", "1", "2"]
+        assert stalled_box.evicted
+        assert stalled.closed
+
+    asyncio.run(run())
+
+
+def test_overflow_evicts_client():
+    async def run():
+        sock = FakeSocket(delay=60)
+        box = Outbox(sock, size=2)  # type: ignore
+        assert box.push("a")
+        assert box.push("b")
+        # The writer task holds "a", so the queue fills up on the fourth frame
+        await asyncio.sleep(0)
+        assert box.push("c")
+        assert not box.push("d")
+        assert box.evicted
+        assert not box.push("e")
+        await asyncio.sleep(0)
+        assert sock.closed
+        box.close()
+
+    asyncio.run(run())
+
+
+def test_closed_socket_stops_the_outbox():
+    class ClosedSocket(FakeSocket):
+        async def send_str(self, data: str) -> None:
+            raise ConnectionResetError("Cannot write to closing transport")
+
+    async def run():
+        box = Outbox(ClosedSocket())  # type: ignore
+        assert box.push("a")
+        await asyncio.sleep(0.01)
+        assert box.evicted
+        assert not box.push("b")
+
+    asyncio.run(run())
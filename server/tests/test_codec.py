@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from server.codec import CodecError, JSONCodec, codec_for, codecs
+from server.rooms import RoomManager, add_room_routes
+from server.ws_game import WSGame
+
+
+def test_json_round_trip():
+    codec = JSONCodec()
+    msg = {"type": 4, "id": "1", "input": "абв"}
+    frame = codec.encode(msg)
+    assert isinstance(frame, str)
+    assert codec.decode(frame) == msg
+
+
+@pytest.mark.parametrize(
+    "frame", ["{", "[1, 2]", '{"input": "a"}', '{"type": []}', '{"type": {}}']
+)
+def test_json_rejects_malformed_messages(frame):
+    with pytest.raises(CodecError):
+        JSONCodec().decode(frame)
+
+
+def test_unknown_protocol_falls_back_to_json():
+    assert codec_for(None).name == "json"
+    assert codec_for("xml").name == "json"
+
+
+def test_msgpack_frames_start_with_the_type():
+    pytest.importorskip("msgpack")
+    codec = codecs["msgpack"]
+    frame = codec.encode({"type": 4, "id": "1", "input": "абв"})
+    assert isinstance(frame, bytes) and frame[0] == 4
+    assert codec.decode(frame) == {"type": 4, "id": "1", "input": "абв"}
+    with pytest.raises(CodecError):
+        codec.decode(b"\x04\xc1")
+
+
+def test_codec_is_negotiated_per_connection():
+    class EchoGame(WSGame):
+        def __init__(self, room_id: str) -> None:
+            super().__init__(room_id)
+            self.ws_handlers_mapping = {0: self.on_echo}
+
+        async def on_echo(self, si, msg):
+            self.broadcast({"type": 1, "text": msg["text"]})
+
+    async def run():
+        routes = web.RouteTableDef()
+        add_room_routes(routes, "/codec", RoomManager(lambda i, o: EchoGame(i)))
+        app = web.Application()
+        app.add_routes(routes)
+        async with TestClient(TestServer(app)) as client:
+            ws = await client.ws_connect("/codec/", protocols=("json",))
+            assert ws.protocol == "json"
+            # Malformed frames are skipped, the connection stays open
+            await ws.send_str("not json")
+            await ws.send_json({"type": 0, "text": "hi"})
+            assert await ws.receive_json() == {"type": 1, "text": "hi"}
+            await ws.close()
+
+    asyncio.run(run())
@@ -0,0 +1,51 @@
+
+from server.dictionary import MappedWords, load_binary_dictionary, write_dictionary
+from server.particle_index import ParticleUsage
+from server.words_game_common import Difficulty
+
+
+def test_compiled_dictionary_roundtrip(tmp_path):
+    words = ["яблоко", "апельсин", "банан", "абв"]
+    particles = {"абв": 600, "ябл": 350, "нан": 10}
+    path = tmp_path / "words.bin"
+    with open(path, "wb") as f:
+        write_dictionary(f, words, particles)
+
+    ww = load_binary_dictionary(str(path))
+    assert isinstance(ww.words, MappedWords)
+    assert len(ww.words) == 4
+    assert list(ww.words) == sorted(words, key=lambda w: w.encode("utf-8"))
+    assert ww.words[-1] == ww.words[3] and ww.words[1:3] == list(ww.words)[1:3]
+    assert ww.words.find("банан") == ww.words.index("банан")
+    assert ww.words.find("груша") == -1
+    for w in words:
+        assert w in ww.words
+    assert "груша" not in ww.words
+    assert "аб" not in ww.words
+    assert ww.particles == particles
+    assert ww.by_difficulty[Difficulty.MIN_500] == ["абв"]
+    assert ww.by_difficulty[Difficulty.MIN_300] == ["абв", "ябл"]
+    assert ww.letters is not None
+    assert ww.letters.mask("абв") == 0b111
+    assert ww.letters.mask("банан") == ww.letters.alphabet.mask("банан")
+    # Not in the dictionary
+    assert ww.letters.mask("ваба") == 0b111
+
+
+def test_compiled_particle_index(tmp_path):
+    words = ["абвабв", "жабва", "вабвг", "груша"]
+    path = tmp_path / "words.bin"
+    with open(path, "wb") as f:
+        write_dictionary(f, words, {"абв": 600, "груш": 10, "ёёё": 1})
+    index = load_binary_dictionary(str(path)).index
+    assert index is not None
+    assert index.word_count("абв") == 3
+    assert index.word_count("груш") == 1
+    assert index.word_count("ёёё") == 0
+
+    usage = ParticleUsage()
+    index.mark_used(usage, "абвабв")
+    assert index.unused_count("абв", usage) == 2
+    assert index.hint("абв", {"абвабв", "жабва"}) == "вабвг"
+    assert index.pick(usage, 2) == "абв"
+    assert index.pick(usage, 3) is None
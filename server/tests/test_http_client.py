@@ -0,0 +1,29 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from server.http_client import HTTPClient
+
+
+def test_retries_on_server_errors():
+    async def run():
+        calls = []
+
+        async def article(request: web.Request) -> web.Response:
+            calls.append(request.path)
+            if len(calls) == 1:
+                return web.Response(status=503)
+            return web.Response(text="<h1>Article</h1>")
+
+        app = web.Application()
+        app.router.add_get("/wiki/{name}", article)
+        async with TestServer(app) as server:
+            client = HTTPClient(str(server.make_url("")), backoff=0.01)
+            text, url = await client.get_text("/wiki/Python")
+            await client.close()
+        assert text == "<h1>Article</h1>"
+        assert url.endswith("/wiki/Python")
+        assert calls == ["/wiki/Python", "/wiki/Python"]
+
+    asyncio.run(run())
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from server.input_relay import InputRelay, TokenBucket
+from server.words_game import config_from_options
+
+
+def test_token_bucket_limits_bursts():
+    bucket = TokenBucket(rate=10, burst=3)
+    now = bucket.last
+    assert [bucket.take(now) for _ in range(4)] == [True, True, True, False]
+    # A token comes back every 0.1 s
+    assert bucket.take(now + 0.11)
+    assert not bucket.take(now + 0.11)
+
+
+def test_relay_coalesces_inputs():
+    async def run():
+        sent = []
+        relay = InputRelay(lambda pid, value: sent.append((pid, value)), rate=20)
+        # The first input after a quiet period goes out right away
+        relay.push("1", "a")
+        assert sent == [("1", "a")]
+        for value in ("ab", "abc", "abcd"):
+            relay.push("1", value)
+        relay.push("2", "x")
+        assert len(sent) == 1
+        await asyncio.sleep(0.08)
+        assert sent == [("1", "a"), ("1", "abcd"), ("2", "x")]
+
+    asyncio.run(run())
+
+
+def test_relay_drops_stale_inputs():
+    async def run():
+        sent = []
+        relay = InputRelay(lambda pid, value: sent.append((pid, value)), rate=5)
+        relay.push("1", "a")
+        relay.push("1", "ab")
+        relay.push("2", "x")
+        relay.drop("1")
+        await asyncio.sleep(0.25)
+        assert sent == [("1", "a"), ("2", "x")]
+        # Within the interval of the last flush, so both are pending
+        relay.push("2", "xy")
+        relay.push("2", "xyz")
+        relay.clear()
+        await asyncio.sleep(0.25)
+        assert sent == [("1", "a"), ("2", "x")]
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"input_rate": float("nan")},
+        {"client_input_rate": float("inf")},
+        {"client_input_burst": float("nan")},
+        {"client_input_burst": 0},
+    ],
+)
+def test_invalid_rate_limits(options):
+    with pytest.raises(ValueError):
+        config_from_options(options)
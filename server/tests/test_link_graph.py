@@ -0,0 +1,74 @@
+import asyncio
+import random
+
+from server.link_graph import LinkGraph
+from server.wiki_extract import run_in_process, shutdown_extractors
+
+# A -> B -> C -> D, A -> E -> C, D is not fetched yet
+ROWS = [
+    ("/wiki/A", ["/wiki/B", "/wiki/E", "/wiki/B#History"]),
+    ("/wiki/B", ["/wiki/C_redirect"]),
+    ("/wiki/C", ["/wiki/D", "/wiki/A"]),
+    ("/wiki/E", ["/wiki/C"]),
+]
+
+
+def test_csr_and_distances():
+    graph = LinkGraph.build(ROWS, {"/wiki/C_redirect": "/wiki/C"})
+    assert graph.n_known == 4
+    assert len(graph) == 5
+    assert graph.edge_count == 6
+    assert [graph.paths[n] for n in graph.links_of(graph.ids["/wiki/A"])] == [
+        "/wiki/B",
+        "/wiki/E",
+    ]
+    levels = graph.levels("https://en.wikipedia.org/wiki/A", 10)
+    assert [sorted(graph.paths[n] for n in level) for level in levels] == [
+        ["/wiki/A"],
+        ["/wiki/B", "/wiki/E"],
+        ["/wiki/C"],
+        ["/wiki/D"],
+    ]
+    assert graph.shortest_path_length("/wiki/A", "/wiki/C_redirect", 10) == 2
+    assert graph.shortest_path_length("/wiki/A", "/wiki/D", 2) is None
+
+
+def test_pick_target():
+    graph = LinkGraph.build(ROWS, {"/wiki/C_redirect": "/wiki/C"})
+    rng = random.Random(0)
+    # D is 3 links away but isn't known, so C is the farthest known article
+    assert graph.pick_target("/wiki/A", 2, 4, rng=rng) == ("/wiki/C", 2)
+    assert graph.pick_target("/wiki/A", 3, 4, rng=rng) is None
+    # Articles outside of the graph are searched from their own links
+    assert graph.pick_target("/wiki/New", 2, 2, ["/wiki/B"], rng=rng) == (
+        "/wiki/C",
+        2,
+    )
+    assert LinkGraph.empty().pick_target("/wiki/A", 1, 3) is None
+
+
+def test_distances_to():
+    graph = LinkGraph.build(ROWS, {"/wiki/C_redirect": "/wiki/C"})
+    assert graph.distances_to("/wiki/C", 1) == {"/wiki/C": 0, "/wiki/B": 1, "/wiki/E": 1}
+    assert graph.distances_to("/wiki/D", 10) == {
+        "/wiki/D": 0,
+        "/wiki/C": 1,
+        "/wiki/B": 2,
+        "/wiki/E": 2,
+        "/wiki/A": 3,
+    }
+    assert graph.distances_to("/wiki/Missing", 3) == {}
+
+
+def test_build_in_a_process():
+    async def build():
+        try:
+            return await run_in_process(
+                LinkGraph.build, ROWS, {"/wiki/C_redirect": "/wiki/C"}
+            )
+        finally:
+            shutdown_extractors()
+
+    graph = asyncio.run(build())
+    assert graph.edge_count == 6
+    assert graph.shortest_path_length("/wiki/A", "/wiki/D", 10) == 3
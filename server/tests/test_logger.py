@@ -0,0 +1,66 @@
+import json
+import logging
+import queue
+import sys
+
+from server.logger import (
+    JSONFormatter,
+    SamplingFilter,
+    StructuredQueueHandler,
+    room_logger,
+)
+
+
+def record(**extra) -> logging.LogRecord:
+    r = logging.LogRecord("server", logging.DEBUG, __file__, 1, "hello %s", ("x",), None)
+    r.__dict__.update(extra)
+    return r
+
+
+def test_sampling_filter_limits_events():
+    f = SamplingFilter(rate=0.0, burst=2)
+    assert all(f.filter(record()) for _ in range(10))
+    passed = [f.filter(record(event="input")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert f.filter(record(event="submit"))
+
+    f.rate = 1e9
+    r = record(event="input")
+    assert f.filter(r)
+    assert r.suppressed == 3
+
+
+def test_json_records_carry_the_context():
+    captured = []
+
+    class Capture(logging.Handler):
+        def emit(self, r: logging.LogRecord) -> None:
+            captured.append(r)
+
+    handler = Capture()
+    log = room_logger("abc")
+    log.logger.addHandler(handler)
+    log.logger.setLevel(logging.DEBUG)
+    try:
+        log.debug("joined %s", "Bob", extra={"player": "7"})
+    finally:
+        log.logger.removeHandler(handler)
+        log.logger.setLevel(logging.NOTSET)
+    entry = json.loads(JSONFormatter().format(captured[0]))
+    assert entry["message"] == "joined Bob"
+    assert entry["room"] == "abc"
+    assert entry["player"] == "7"
+    assert entry["level"] == "DEBUG"
+
+
+def test_exceptions_are_kept_through_the_queue():
+    log_queue = queue.SimpleQueue()
+    handler = StructuredQueueHandler(log_queue)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        r = record(exc_info=sys.exc_info())
+    handler.handle(r)
+    entry = json.loads(JSONFormatter().format(log_queue.get_nowait()))
+    assert entry["message"] == "hello x"
+    assert "ValueError: boom" in entry["exc_info"]
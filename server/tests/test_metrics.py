@@ -0,0 +1,84 @@
+import asyncio
+from enum import IntEnum
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from server.metrics import Counter, Gauge, Histogram, message_name, metrics_handler
+from server.rooms import RoomManager, add_room_routes
+from server.ws_game import WSGame
+
+
+def test_text_exposition():
+    c = Counter("msgs_total", "Messages", ("type",))
+    c.inc("Join")
+    c.inc('Say "hi"', amount=2)
+    assert c.render() == [
+        "# HELP msgs_total Messages",
+        "# TYPE msgs_total counter",
+        'msgs_total{type="Join"} 1',
+        'msgs_total{type="Say \\"hi\\""} 2',
+    ]
+    g = Gauge("size", "Size", collector=lambda: [((), 2.5)])
+    assert g.render()[2:] == ["size 2.5"]
+    h = Histogram("lat_seconds", "Latency", buckets=(0.1, 1))
+    h.observe(0.05)
+    h.observe(0.5)
+    h.observe(3)
+    assert h.render()[2:] == [
+        'lat_seconds_bucket{le="0.1"} 1',
+        'lat_seconds_bucket{le="1"} 2',
+        'lat_seconds_bucket{le="+Inf"} 3',
+        "lat_seconds_sum 3.55",
+        "lat_seconds_count 3",
+    ]
+
+
+def test_message_names():
+    class Messages(IntEnum):
+        Join = 0
+
+    assert message_name(Messages, 0) == "Join"
+    assert message_name(Messages, 7) == "unknown"
+    assert message_name(Messages, "Join") == "unknown"
+    assert message_name(None, 7) == "7"
+
+
+def test_metrics_endpoint_counts_messages():
+    class EchoGame(WSGame):
+        game = "echo"
+
+        def __init__(self, room_id: str) -> None:
+            super().__init__(room_id)
+            self.ws_handlers_mapping = {0: self.on_echo}
+
+        async def on_echo(self, si, msg):
+            self.broadcast({"type": 1, "text": msg["text"]})
+
+    async def run():
+        routes = web.RouteTableDef()
+        add_room_routes(routes, "/echo", RoomManager(lambda i, o: EchoGame(i)))
+        app = web.Application()
+        app.add_routes(routes)
+        app.router.add_get("/metrics", metrics_handler)
+        async with TestClient(TestServer(app)) as client:
+            ws = await client.ws_connect("/echo/")
+            await ws.send_json({"type": 0, "text": "hi"})
+            assert (await ws.receive_json())["text"] == "hi"
+            await ws.send_json({"type": 7})
+            await ws.send_json({"type": "made up"})
+            await ws.send_json({"type": 0, "text": "again"})
+            assert (await ws.receive_json())["text"] == "again"
+            resp = await client.get("/metrics")
+            assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            text = await resp.text()
+            await ws.close()
+        assert 'ws_clients{game="echo"} 1' in text
+        assert 'rooms_active{game="echo"} 1' in text
+        assert 'ws_messages_received_total{game="echo",type="0"} 2' in text
+        assert 'ws_messages_received_total{game="echo",type="unknown"} 2' in text
+        assert 'ws_messages_sent_total{game="echo",type="1"} 2' in text
+        assert 'ws_handler_seconds_count{game="echo",type="0"} 2' in text
+        assert text.endswith("\n")
+
+    asyncio.run(run())
@@ -0,0 +1,21 @@
+import pytest
+
+from bench import micro
+
+
+@pytest.fixture(autouse=True)
+def small_dictionary(monkeypatch):
+    monkeypatch.setattr(micro, "N_WORDS", 2000)
+    monkeypatch.setattr(micro, "_dictionary", None)
+
+
+@pytest.mark.parametrize("name", sorted(micro.benchmarks))
+def test_benchmark_runs(name):
+    micro.benchmarks[name]()(3)
+
+
+def test_compare_reports_regressions(capsys):
+    results = {"fast": 1.0, "slow": 2.0, "new": 1.0}
+    baseline = {"fast": 1.1, "slow": 1.0}
+    assert micro.compare(results, baseline, 0.3) == ["slow"]
+    assert "REGRESSION" in capsys.readouterr().out
@@ -0,0 +1,62 @@
+import asyncio
+from types import SimpleNamespace
+
+from server.prefetch import Prefetcher, rank_links
+from server.wiki_game import PlayerInfo, WikiGame
+
+
+def test_rank_links():
+    links = ["/wiki/A", "/wiki/B", "/wiki/C", "/wiki/A#Top", "/wiki/D"]
+    assert rank_links(links, {}, {}, limit=2) == ["/wiki/A", "/wiki/B"]
+    assert rank_links(links, {"/wiki/D": 3}, {}, limit=2) == ["/wiki/D", "/wiki/A"]
+    assert rank_links(links, {}, {"/wiki/C": 0}, limit=1) == ["/wiki/C"]
+
+
+def test_prefetcher_budget_and_cancel():
+    async def run():
+        started = []
+        finished = []
+        release = asyncio.Event()
+
+        async def load(path):
+            started.append(path)
+            await release.wait()
+            finished.append(path)
+
+        prefetcher = Prefetcher(load, asyncio.Semaphore(2))
+        prefetcher.prefetch("p1", ["/wiki/A", "/wiki/B", "/wiki/C"])
+        await asyncio.sleep(0)
+        assert started == ["/wiki/A", "/wiki/B"]
+
+        # Navigating to B keeps its prefetch and drops the rest
+        prefetcher.cancel("p1", keep="/wiki/B")
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.sleep(0.01)
+        assert started == ["/wiki/A", "/wiki/B"]
+        assert finished == ["/wiki/B"]
+        prefetcher.close()
+
+    asyncio.run(run())
+
+
+def test_invalid_navigation_is_ignored():
+    async def run():
+        release = asyncio.Event()
+
+        async def load(path):
+            await release.wait()
+
+        game = WikiGame("abc")
+        game.prefetcher = Prefetcher(load, asyncio.Semaphore(2))
+        game.players["1"] = PlayerInfo(id="1", nickname="Alice")
+        game.prefetcher.prefetch("1", ["/wiki/A"])
+        si = SimpleNamespace(id="1")
+        for path in ("/w/index.php", "", None, 42):
+            await game.on_player_navigate(si, {"path": path})
+        assert game.players["1"].steps == 0
+        # The prefetches of the player go on
+        assert not game.prefetcher.tasks["1"]["/wiki/A"].cancelled()
+        game.prefetcher.close()
+
+    asyncio.run(run())
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import server.rooms
+from server.backplane import BackplaneError, MemoryBackplane, MemoryHub
+from server.rooms import (
+    DEFAULT_ROOM_ID,
+    RoomManager,
+    RoomsLimitReached,
+    add_room_routes,
+)
+from server.ws_game import WSGame
+
+
+def test_room_lifecycle():
+    async def run():
+        manager = RoomManager(lambda room_id, options: WSGame(room_id), max_rooms=2)
+        default = manager.join(DEFAULT_ROOM_ID)
+        assert manager.join(DEFAULT_ROOM_ID) is default
+        room = manager.create()
+        assert manager.get(room.room_id) is room
+        assert {r["id"] for r in manager.list()} == {DEFAULT_ROOM_ID, room.room_id}
+        with pytest.raises(RoomsLimitReached):
+            manager.create()
+        await manager.close_if_empty(DEFAULT_ROOM_ID)
+        await manager.close_if_empty(room.room_id)
+        assert manager.get(room.room_id) is None
+        assert manager.get(DEFAULT_ROOM_ID) is default
+        assert not await manager.close(room.room_id)
+
+    asyncio.run(run())
+
+
+class FlakyBackplane(MemoryBackplane):
+    down = False
+
+    async def claim(self, key):
+        if self.down:
+            raise BackplaneError("Not connected to the backplane")
+        return await super().claim(key)
+
+
+def test_rooms_and_claims_dont_leak(monkeypatch):
+    monkeypatch.setattr(server.rooms, "EMPTY_ROOM_TIMEOUT", 0.05)
+
+    async def run():
+        hub = MemoryHub()
+        backplane = FlakyBackplane(hub, node="a")
+        manager = RoomManager(lambda i, o: WSGame(i), backplane=backplane)
+        routes = web.RouteTableDef()
+        add_room_routes(routes, "/lobby", manager)
+        app = web.Application()
+        app.add_routes(routes)
+        async with TestClient(TestServer(app)) as client:
+            # Plain HTTP and spectators don't open rooms
+            assert (await client.get("/lobby/abc/")).status == 400
+            assert (await client.get("/lobby/abc/spectate/")).status == 400
+            with pytest.raises(Exception):
+                await client.ws_connect("/lobby/abc/spectate/")
+            assert not manager.rooms and not hub.owners
+
+            # Rooms nobody joins are closed
+            resp = await client.post("/lobby/rooms/")
+            assert resp.status == 201
+            await asyncio.sleep(0.1)
+            assert not manager.rooms and not hub.owners
+
+            backplane.down = True
+            assert (await client.post("/lobby/rooms/")).status == 503
+            assert not manager.rooms and not hub.owners
+            backplane.down = False
+
+            manager.max_rooms = 0
+            with pytest.raises(Exception):
+                await client.ws_connect("/lobby/abc/")
+            assert not manager.rooms and not hub.owners
+
+    asyncio.run(run())
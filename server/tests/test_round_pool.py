@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from server import round_pool, wiki_game
+from server.round_pool import RoundPool
+from server.wiki_game import WikiGame
+
+
+def test_pool_prepares_in_background_and_retries(monkeypatch):
+    monkeypatch.setattr(round_pool, "RETRY_DELAY", 0.01)
+
+    async def run():
+        calls = []
+
+        async def prepare():
+            calls.append(None)
+            if len(calls) == 2:
+                raise RuntimeError("network is down")
+            return len(calls)
+
+        pool = RoundPool(prepare, size=2, workers=1)
+        # Without workers a round is prepared on demand
+        assert await pool.take() == 1
+
+        pool.start()
+        await asyncio.sleep(0)
+        assert pool.ready.empty()
+        await asyncio.sleep(0.05)
+        assert pool.ready.qsize() == 2
+        assert await pool.take() == 3
+        await asyncio.sleep(0)
+        assert pool.ready.qsize() == 2
+        await pool.stop()
+        assert pool.workers == []
+
+    asyncio.run(run())
+
+
+def test_joining_without_a_round(monkeypatch):
+    monkeypatch.setattr(round_pool, "RETRY_DELAY", 0.01)
+    monkeypatch.setattr(round_pool, "TAKE_TIMEOUT", 0.05)
+
+    async def run():
+        async def prepare():
+            raise RuntimeError("network is down")
+
+        pool = RoundPool(prepare, workers=1)
+        pool.start()
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.take(timeout=0.05)
+
+        # The player is told to come back later, and the next one can try again
+        monkeypatch.setattr(wiki_game, "round_pool", pool)
+        closed = []
+
+        async def close(reason):
+            closed.append(reason)
+
+        game = WikiGame("abc")
+        si = SimpleNamespace(id="p1", close=close)
+        await game.on_player_joined(si, {"nickname": "John"})
+        assert closed == [b"No round ready"]
+        assert not game.players and not game.init_lock.locked()
+        await pool.stop()
+        game.prefetcher.close()
+
+    asyncio.run(run())
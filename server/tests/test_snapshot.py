@@ -0,0 +1,208 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import server.room_snapshots
+from bench.synthetic import synthetic_dictionary
+from server.lang import Language
+from server.room_snapshots import RoomSnapshots
+from server.rooms import RoomManager, add_room_routes
+from server.snapshot import (
+    SnapshotFormatError,
+    SnapshotReader,
+    SnapshotWriter,
+    encode_record,
+    read_snapshot,
+    write_snapshot,
+)
+from server.turn_order import TurnOrder
+from server.words_game import WordsGame
+from server.words_game_common import GameStateDesc, PlayerInfo, WordsGameConfig
+from server.ws_game import WSGame
+
+
+def test_format_round_trip(tmp_path):
+    w = SnapshotWriter()
+    w.u8(7)
+    w.i32(-3)
+    w.f64(1.5)
+    w.string("тест")
+    w.strings(["a", "", "b"])
+    w.words(["слово", "ещё"])
+    w.words([])
+    r = SnapshotReader(bytes(w.buf))
+    assert r.u8() == 7
+    assert r.i32() == -3
+    assert r.f64() == 1.5
+    assert r.string() == "тест"
+    assert r.strings() == ["a", "", "b"]
+    assert r.words() == ["слово", "ещё"]
+    assert r.words() == []
+    with pytest.raises(SnapshotFormatError):
+        r.u8()
+
+    path = str(tmp_path / "rooms.snapshot")
+    write_snapshot(path, [encode_record(("words", "abc", "{}", b"state"))])
+    _, records = read_snapshot(path)
+    assert records == [("words", "abc", "{}", b"state")]
+
+
+def test_words_game_is_restored_mid_turn():
+    async def run():
+        ww = synthetic_dictionary(2000, 1)
+        config = WordsGameConfig(Language.Russian, 3, 2, time_to_answer=15)
+        game = WordsGame("abc", config, ww)
+        gs = game.game_state
+        for pid in ("a", "b", "c"):
+            gs.players[pid] = PlayerInfo(config, id=pid, nickname=pid.upper())
+            game.issue_token(pid)
+        gs.players["b"].lives_left = 1
+        gs.players["b"].letters_left = 0b11
+        gs.desc = GameStateDesc.Playing
+        game.turns = TurnOrder(gs.players.values())
+        next(game.turns)
+        gs.whos_turn = next(game.turns).id
+        gs.particle = ww.particle_keys[0]
+        gs.used_words = set(sorted(ww.words)[:10])
+        game.turn.start(10)
+        w = SnapshotWriter()
+        game.snapshot(w)
+        game.turn.cancel()
+
+        restored = WordsGame("abc", config, ww)
+        await restored.restore(SnapshotReader(bytes(w.buf)))
+        # The turn goes on in the play() task
+        await asyncio.sleep(0)
+        rs = restored.game_state
+        assert {p.id: (p.nickname, p.lives_left) for p in rs.players.values()} == {
+            "a": ("A", 3),
+            "b": ("B", 1),
+            "c": ("C", 3),
+        }
+        assert rs.players["b"].letters_left == 0b11
+        assert rs.players["a"].letters_left == config.all_letters
+        assert rs.used_words == gs.used_words
+        assert rs.particle == gs.particle and rs.whos_turn == "b"
+        assert 9 < restored.turn.remaining() <= 10
+        assert [p.id for p in restored.turns.order()] == ["c", "a", "b"]
+        assert restored.absent == {"a", "b", "c"}
+        assert restored.tokens == game.tokens
+        await restored.close()
+
+    asyncio.run(run())
+
+
+def test_words_game_is_restored_after_a_finished_game():
+    async def run():
+        ww = synthetic_dictionary(2000, 1)
+        config = WordsGameConfig(Language.Russian, 3, 2)
+        game = WordsGame("abc", config, ww)
+        gs = game.game_state
+        for pid in ("a", "b"):
+            gs.players[pid] = PlayerInfo(config, id=pid, nickname=pid.upper())
+        gs.desc = GameStateDesc.Playing
+        game.turns = TurnOrder(gs.players.values())
+        gs.last_player_to_answer = gs.players["a"]
+        await game.end_game()
+        assert game.turns is None
+        # A new lobby gathers
+        gs.players["c"] = PlayerInfo(config, id="c", nickname="C")
+        w = SnapshotWriter()
+        game.snapshot(w)
+
+        restored = WordsGame("abc", config, ww)
+        await restored.restore(SnapshotReader(bytes(w.buf)))
+        assert list(restored.game_state.players) == ["c"]
+        assert restored.game_state.desc == GameStateDesc.WaitingForPlayers
+        assert restored.turns is None
+        await restored.close()
+
+    asyncio.run(run())
+
+
+class TokenGame(WSGame):
+    def __init__(self, room_id):
+        super().__init__(room_id)
+        self.players = {}
+        self.ws_handlers_mapping = {0: self.on_join}
+
+    async def on_join(self, si, msg):
+        self.players[si.id] = msg["nickname"]
+        token = self.issue_token(si.id)
+        await self.send_to_user(si, {"type": 0, "id": si.id, "token": token})
+
+    async def on_player_resumed(self, si):
+        await self.send_to_user(
+            si, {"type": 1, "id": si.id, "nickname": self.players[si.id]}
+        )
+
+    async def remove_player(self, pid, si):
+        self.players.pop(pid, None)
+
+    def snapshot(self, w):
+        super().snapshot(w)
+        w.strings(self.players)
+        w.strings(self.players.values())
+
+    async def restore(self, r):
+        await super().restore(r)
+        self.players = dict(zip(r.strings(), r.strings()))
+
+
+def node_app():
+    routes = web.RouteTableDef()
+    manager = RoomManager(lambda i, o: TokenGame(i))
+    add_room_routes(routes, "/snap", manager)
+    app = web.Application()
+    app.add_routes(routes)
+    return app, manager
+
+
+def test_players_resume_after_a_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(server.room_snapshots, "RESUME_TIMEOUT", 0.2)
+    snapshots = RoomSnapshots(str(tmp_path / "rooms.snapshot"))
+
+    async def run():
+        app, _ = node_app()
+        tokens = {}
+        async with TestClient(TestServer(app)) as client:
+            for nickname in ("ann", "bob"):
+                ws = await client.ws_connect("/snap/abc/")
+                await ws.send_json({"type": 0, "nickname": nickname})
+                tokens[nickname] = await ws.receive_json()
+            # Other tests may have left rooms open
+            assert await snapshots.save() >= 1
+            _, records = read_snapshot(snapshots.path)
+            assert ("snap", "abc") in [(r[0], r[1]) for r in records]
+
+        # A new process
+        app, manager = node_app()
+        async with TestClient(TestServer(app)) as client:
+            assert await snapshots.restore() >= 1
+            room = manager.get("abc")
+            assert set(room.players.values()) == {"ann", "bob"}
+            ws = await client.ws_connect(
+                "/snap/abc/", params={"resume": tokens["ann"]["token"]}
+            )
+            assert await ws.receive_json() == {
+                "type": 1,
+                "id": tokens["ann"]["id"],
+                "nickname": "ann",
+            }
+            # A token is only good once
+            other = await client.ws_connect(
+                "/snap/abc/", params={"resume": tokens["ann"]["token"]}
+            )
+            await other.close()
+            assert room.absent == {tokens["bob"]["id"]}
+            # Bob hasn't come back in time
+            await asyncio.sleep(0.3)
+            assert room.players == {tokens["ann"]["id"]: "ann"}
+            assert not room.absent
+            await ws.close()
+            await asyncio.sleep(0.05)
+            assert manager.get("abc") is None
+
+    asyncio.run(run())
@@ -0,0 +1,27 @@
+from server.lang import Language
+from server.words_game import GameState
+from server.words_game_common import PlayerInfo, WordsGameConfig
+
+
+def test_patch_holds_only_changed_fields():
+    config = WordsGameConfig(
+        lang=Language.Russian, lives_initial=3, min_players_to_start_game=2
+    )
+    gs = GameState(config)
+    alice = PlayerInfo(config, id="1", nickname="Alice")
+    bob = PlayerInfo(config, id="2", nickname="Bob")
+    gs.players = {"1": alice, "2": bob}
+    alice.clear_dirty()
+    bob.clear_dirty()
+    gs.clear_dirty()
+
+    assert gs.patch_json(("whos_turn", "particle", "players")) == {}
+    gs.whos_turn = "1"
+    bob.lives_left -= 1
+    gs.used_words.add("слово")
+    assert gs.patch_json(("whos_turn", "particle", "players")) == {
+        "whos_turn": "1",
+        "players": {"2": {"lives_left": 2}},
+    }
+    assert gs.patch_json(("whos_turn", "particle", "players")) == {}
+    assert "used_words" not in gs.to_json()
@@ -0,0 +1,70 @@
+import pytest
+
+from server.lang import Language
+from server.turn_order import TurnOrder
+from server.words_game_common import PlayerInfo, WordsGameConfig
+
+CONFIG = WordsGameConfig(
+    lang=Language.Russian, lives_initial=3, min_players_to_start_game=2
+)
+
+
+def player(id: str, nickname: str, lives_left: int) -> PlayerInfo:
+    p = PlayerInfo(CONFIG, id=id, nickname=nickname)
+    p.lives_left = lives_left
+    return p
+
+
+def test_player_cycle():
+    hello_player = player("2", "Hello", 8)
+    john = player("8", "John", 2)
+    someone = player("9", "Someone", 0)
+    whatever = player("12", "Whatever", 1)
+    players = {
+        "2": hello_player,
+        "8": john,
+        "9": someone,
+        "12": whatever,
+    }
+    i = TurnOrder(players.values())
+    assert next(i) == hello_player
+    john.lives_left -= 1
+    assert next(i) == john
+    assert next(i) == whatever
+    assert next(i) == hello_player
+    assert next(i) == john
+    assert next(i) == whatever
+    assert next(i) == hello_player
+    john.lives_left -= 1
+    assert next(i) == whatever
+    whatever.lives_left -= 1
+    assert next(i) == hello_player
+    with pytest.raises(StopIteration):
+        assert next(i)
+    with pytest.raises(StopIteration):
+        assert next(i)
+
+
+def test_players_joining_and_leaving():
+    a, b, c, d = (player(str(n), name, 1) for n, name in enumerate("abcd"))
+    turns = TurnOrder([a, b, c])
+    assert len(turns) == 3
+    assert next(turns) == a
+    # Joins at the end of the current round
+    turns.add(d)
+    assert next(turns) == b
+    turns.remove(c.id)
+    assert len(turns) == 3
+    assert next(turns) == d
+    assert next(turns) == a
+    assert next(turns) == b
+    assert next(turns) == d
+    assert next(turns) == a
+    # Leaving during their own turn
+    turns.remove(a.id)
+    assert next(turns) == b
+    b.lives_left = 0
+    assert next(turns) == d
+    assert turns.finished
+    with pytest.raises(StopIteration):
+        next(turns)
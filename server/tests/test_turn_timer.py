@@ -0,0 +1,27 @@
+import asyncio
+
+from server.turn_timer import TurnResult, TurnTimer
+
+
+def test_answer_resolves_turn_immediately():
+    async def run():
+        turn = TurnTimer()
+        turn.start(60)
+        asyncio.get_running_loop().call_soon(turn.resolve, TurnResult.Answered)
+        assert await asyncio.wait_for(turn.wait(), 1) == TurnResult.Answered
+        assert not turn.pending
+        assert not turn.resolve(TurnResult.Answered)
+
+    asyncio.run(run())
+
+
+def test_turn_times_out_once():
+    async def run():
+        turn = TurnTimer()
+        turn.start(0.01)
+        assert turn.pending
+        assert await turn.wait() == TurnResult.TimedOut
+        assert not turn.resolve(TurnResult.Answered)
+        assert turn.remaining() == 0.0
+
+    asyncio.run(run())
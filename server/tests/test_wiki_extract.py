@@ -0,0 +1,23 @@
+from server.wiki_extract import extract_article
+
+PAGE = """<!DOCTYPE html><html><head><script>head()</script></head><body>
+<h1 id="firstHeading"><span>Python &amp; Co</span></h1>
+<div id="mw-content-text"><div class="mw-content-ltr mw-parser-output">
+<p onclick="evil()">Intro <a href="/wiki/Snake">snake</a> <a href="/wiki/Snake">again</a></p>
+<div class="note"><script>var s = "</div>";</script><a href="javascript:evil()">x</a></div>
+<p><a href="/wiki/File:Logo.png"><img src="logo.png"></a><br>&#160;<a href="/wiki/Guido">Guido</a></p>
+</div><a href="/wiki/After">outside</a></div></body></html>"""
+
+
+def test_extracts_title_content_and_links():
+    article = extract_article(PAGE, "https://en.wikipedia.org/wiki/Python")
+    assert article.title == "Python & Co"
+    assert article.path == "https://en.wikipedia.org/wiki/Python"
+    assert article.links == ["/wiki/Snake", "/wiki/Guido"]
+    assert article.content.startswith('<div class="mw-content-ltr mw-parser-output">')
+    assert article.content.endswith("</p>\n</div>")
+    assert "script" not in article.content
+    assert "onclick" not in article.content
+    assert "javascript:" not in article.content
+    assert '<img src="logo.png" /></a><br />&#160;' in article.content
+    assert "/wiki/After" not in article.content
@@ -0,0 +1,42 @@
+import asyncio
+import random
+
+from bench.synthetic import synthetic_dictionary
+from server.lang import Language
+from server.words_game import WordsGame
+from server.words_game_common import PlayerInfo, WordsGameConfig, alphabet_for_lang
+
+
+def test_letters_are_bitmasks():
+    alphabet = alphabet_for_lang(Language.Russian)
+    assert alphabet.mask("абя-ё") == 1 | 2 | 1 << 31
+    assert alphabet.codes(0b101) == [ord("а"), ord("в")]
+    rng = random.Random(0)
+    picked = {alphabet.random_letter(0b10110, rng) for _ in range(100)}
+    assert picked == {0b10, 0b100, 0b10000}
+
+
+def test_correct_guess_awards_letters():
+    async def run():
+        config = WordsGameConfig(
+            lang=Language.Russian, lives_initial=3, min_players_to_start_game=2
+        )
+        game = WordsGame("abc", config, synthetic_dictionary(100))
+        alice = PlayerInfo(config, id="1", nickname="Alice")
+        bob = PlayerInfo(config, id="2", nickname="Bob")
+        game.game_state.players = {"1": alice, "2": bob}
+        alice.letters_left = config.alphabet.mask("абвгд")
+        alice.clear_dirty()
+        await game.correct_guess(alice, "абв")
+        # The letters of the word and a random one of the others
+        assert alice.letters_left.bit_count() == 1
+        assert alice.letters_left & ~config.alphabet.mask("гд") == 0
+        assert bob.letters_left == config.all_letters
+        assert alice.patch_json()["letters_left"] == alice.letters_left
+
+        await game.correct_guess(alice, "гд")
+        assert alice.lives_left == 4
+        assert alice.letters_left == config.all_letters
+        assert WordsGameConfig(Language.Russian, 3, 2).all_letters == (1 << 32) - 1
+
+    asyncio.run(run())
@@ -0,0 +1,87 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.http_websocket import WSCloseCode
+from aiohttp.test_utils import TestClient, TestServer
+
+from server.rooms import RoomManager, add_room_routes
+from server.workers import FORWARDED_HEADER, cluster, proxy_websocket
+from server.ws_game import WSGame
+
+
+class EchoGame(WSGame):
+    def __init__(self, room_id: str) -> None:
+        super().__init__(room_id)
+        self.ws_handlers_mapping = {0: self.on_echo}
+
+    async def on_echo(self, si, msg):
+        self.broadcast({"type": 1, "text": msg["text"], "room": self.room_id})
+
+
+def test_created_rooms_are_owned(monkeypatch):
+    monkeypatch.setattr(cluster, "size", 4)
+    monkeypatch.setattr(cluster, "index", 3)
+    manager = RoomManager(lambda room_id, options: WSGame(room_id))
+    for _ in range(10):
+        assert cluster.owner(manager.create().room_id) == 3
+
+
+def test_websocket_is_proxied_to_the_owner(monkeypatch):
+    async def run():
+        routes = web.RouteTableDef()
+        add_room_routes(routes, "/echo", RoomManager(lambda i, o: EchoGame(i)))
+        owner = web.Application()
+        owner.add_routes(routes)
+
+        async def forward(request):
+            return await proxy_websocket(request, 0)
+
+        other = web.Application()
+        other.router.add_get("/echo/{room_id}/", forward)
+        async with TestServer(owner) as owner_server:
+            monkeypatch.setattr(cluster, "ports", [owner_server.port])
+            async with TestClient(TestServer(other)) as client:
+                ws = await client.ws_connect("/echo/abc/", protocols=("json",))
+                assert ws.protocol == "json"
+                await ws.send_json({"type": 0, "text": "hi"})
+                msg = await ws.receive_json()
+                assert msg == {"type": 1, "text": "hi", "room": "abc"}
+                await ws.close()
+        if cluster.session is not None:
+            await cluster.session.close()
+            cluster.session = None
+
+    asyncio.run(run())
+
+
+def test_forwarding_is_only_trusted_internally(monkeypatch):
+    async def run():
+        def node():
+            routes = web.RouteTableDef()
+            add_room_routes(routes, "/echo", RoomManager(lambda i, o: EchoGame(i)))
+            app = web.Application()
+            app.add_routes(routes)
+            return app
+
+        # A room of the other worker
+        room_id = next(f"r{i}" for i in range(100) if cluster.owner(f"r{i}") == 1)
+        async with TestClient(TestServer(node())) as public, TestClient(
+            TestServer(node())
+        ) as internal:
+            monkeypatch.setattr(cluster, "ports", [internal.port, internal.port + 1])
+            headers = {FORWARDED_HEADER: "1"}
+            ws = await internal.ws_connect(f"/echo/{room_id}/", headers=headers)
+            await ws.send_json({"type": 0, "text": "hi"})
+            assert (await ws.receive_json())["text"] == "hi"
+            await ws.close()
+            # Proxied to the other worker, which isn't there
+            ws = await public.ws_connect(f"/echo/{room_id}/", headers=headers)
+            msg = await ws.receive()
+            assert msg.type == web.WSMsgType.CLOSE
+            assert msg.data == WSCloseCode.TRY_AGAIN_LATER
+        if cluster.session is not None:
+            await cluster.session.close()
+            cluster.session = None
+
+    monkeypatch.setattr(cluster, "size", 2)
+    asyncio.run(run())